@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""Compressed, indexed output archive for C.R.A.SSH
+
+Instead of one ``hostname-YYMMDD-HHMMSS.txt`` per device (``-w``), ``-Z
+run.gz`` puts every output of the run in a single file. Each (device, command)
+output is compressed on its own, as a gzip member (or a zstd frame for
+``.zst`` paths, when the ``zstandard`` module is installed), and appended to
+the archive. Concatenated members are still a valid gzip/zstd stream, so
+``zcat run.gz`` shows everything, while ``run.gz.idx`` (one JSON object per
+line: device, hostname, command, offset, length, size) lets a single output be
+read back with one seek::
+
+    python archive.py run.gz                       # list the index
+    python archive.py run.gz 10.0.0.1 "show ver"   # print one output
+
+Compression and disk I/O happen on a writer thread. Sessions queue each
+output chunk as it arrives (``begin``/``write``/``end``), and the writer feeds
+it to that output's streaming compressor, so a huge ``show tech`` is never
+held whole. Members are written to the archive one at a time. Until its
+command finishes, a member's compressed bytes sit in a spool that goes to a
+temporary file past ``SPOOL`` bytes. The queue is bounded, so a slow disk
+slows the sessions down instead of filling memory.
+
+"""
+
+import gzip
+import itertools
+import json
+import queue
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+
+def codec(path):
+    """``"zstd"`` for ``.zst`` paths, ``"gzip"`` otherwise"""
+    return "zstd" if path.endswith(".zst") else "gzip"
+
+
+def zstd():
+    """The ``zstandard`` module, imported on first use; ``None`` if it isn't installed"""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def compressor(kind, level):
+    """Streaming compressor for one gzip member / zstd frame: ``compress(data)``..., then ``flush()``"""
+    if kind == "zstd":
+        return zstd().ZstdCompressor(level=level).compressobj()
+    return zlib.compressobj(level, zlib.DEFLATED, 31)      # wbits 16 + 15: gzip header and trailer
+
+
+def decompress(data, kind):
+    if kind == "zstd":
+        # Streamed frames don't record their size up front, which ZstdDecompressor.decompress() needs
+        return zstd().ZstdDecompressor().decompressobj().decompress(data)
+    return gzip.decompress(data)
+
+
+class _Member(object):
+    """One output being compressed, only touched by the writer thread"""
+
+    def __init__(self, entry, compressor, spool):
+        self.entry = entry
+        self.compressor = compressor
+        self.spool = spool
+        self.size = 0
+
+
+class ArchiveWriter(object):
+    """Append command outputs to ``path`` and their index to ``path + ".idx"``
+
+    Args:
+    path (str): Archive file, ``.zst`` selects zstd
+    level (int): Compression level, ``None`` for the codec default (gzip 6, zstd 3)
+    """
+
+    QUEUE_CHUNKS = 256              # Chunks waiting for the writer before sessions block (~16 MB)
+    SPOOL = 1024 * 1024             # Compressed bytes of an unfinished member kept in memory
+
+    def __init__(self, path, level=None):
+        self.path = path
+        self.kind = codec(path)
+        if self.kind == "zstd" and zstd() is None:
+            raise RuntimeError("zstd archives need the zstandard module (pip install zstandard)")
+        self.level = level if level is not None else (3 if self.kind == "zstd" else 6)
+        self.f = open(path, 'ab')
+        self.index = open(path + ".idx", 'a')
+        self.offset = self.f.tell()
+        self.queue = queue.Queue(self.QUEUE_CHUNKS)
+        self.ids = itertools.count()
+        self.members = {}           # id -> _Member, writer thread only
+        self.error = None
+        self.thread = threading.Thread(target=self.writer, name="crassh-archive", daemon=True)
+        self.thread.start()
+
+    def begin(self, device, hostname, command):
+        """Start the output of ``command`` on ``device``, returns the id for ``write``/``end``"""
+        member = next(self.ids)
+        self.queue.put(("begin", member, {"device": device, "hostname": hostname, "command": command, "time": time.time()}))
+        return member
+
+    def write(self, member, chunk):
+        """Queue one chunk of output, blocks only while the writer is ``QUEUE_CHUNKS`` behind"""
+        self.queue.put(("data", member, chunk))
+
+    def end(self, member):
+        """The output is complete, the writer appends it to the archive"""
+        self.queue.put(("end", member, None))
+
+    def add(self, device, hostname, command, output):
+        """Queue the complete output of ``command`` on ``device`` in one go"""
+        member = self.begin(device, hostname, command)
+        self.write(member, output)
+        self.end(member)
+
+    def writer(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            action, member, payload = item
+            if self.error is not None:
+                # Keep draining the queue so sessions never block, report it on close()
+                self.discard(member)
+                continue
+            try:
+                if action == "begin":
+                    self.members[member] = _Member(payload, compressor(self.kind, self.level),
+                                                   tempfile.SpooledTemporaryFile(self.SPOOL))
+                elif action == "data":
+                    current = self.members[member]
+                    data = payload.encode("utf-8")
+                    current.size += len(data)
+                    current.spool.write(current.compressor.compress(data))
+                else:
+                    self.append(self.members.pop(member))
+            except Exception as e:
+                # Disk full, a bad chunk, a compressor error...: record it and keep draining,
+                # a writer that died would leave the sessions blocked on a full queue
+                self.error = e
+                self.discard(member)
+
+    def append(self, member):
+        """Finish ``member`` and copy it to the archive, then index it"""
+        try:
+            member.spool.write(member.compressor.flush())
+            length = member.spool.tell()
+            member.spool.seek(0)
+            shutil.copyfileobj(member.spool, self.f)
+        finally:
+            member.spool.close()
+        member.entry.update({"offset": self.offset, "length": length, "size": member.size})
+        self.index.write(json.dumps(member.entry, sort_keys=True) + "\n")
+        self.offset += length
+
+    def discard(self, member):
+        current = self.members.pop(member, None)
+        if current is not None:
+            current.spool.close()
+
+    def close(self):
+        """Wait for the queued outputs to hit the disk and close the files"""
+        self.queue.put(None)
+        self.thread.join()
+        # Outputs of sessions that died mid-command never got their end()
+        for member in list(self.members):
+            self.discard(member)
+        self.f.close()
+        self.index.close()
+        if self.error is not None:
+            print("Archive %s: write failed: %s" % (self.path, self.error))
+
+
+def read_index(path):
+    """Index entries of the archive ``path``, in write order"""
+    with open(path + ".idx", 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def read_output(path, entry):
+    """Output for one index ``entry``, only its own bytes are read and decompressed"""
+    with open(path, 'rb') as f:
+        f.seek(entry["offset"])
+        return decompress(f.read(entry["length"]), codec(path)).decode("utf-8")
+
+
+def find(path, device, command=None):
+    """Index entries for ``device`` (IP or hostname), optionally only ``command``"""
+    return [entry for entry in read_index(path)
+            if device in (entry["device"], entry["hostname"]) and command in (None, entry["command"])]
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: %s archive [device [command]]" % sys.argv[0])
+        sys.exit(1)
+    path = sys.argv[1]
+    if len(sys.argv) == 2:
+        for entry in read_index(path):
+            print("%-20s %-20s %10d  %s" % (entry["device"], entry["hostname"], entry["size"], entry["command"]))
+        return
+    for entry in find(path, sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None):
+        sys.stdout.write(read_output(path, entry))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""Jump host (bastion) multiplexing for C.R.A.SSH
+
+When the devices are only reachable through a jump host, ``connect(...,
+jump=JumpHosts(...))`` doesn't open a TCP connection to the device. It opens a
+``direct-tcpip`` channel to ``device:22`` over an SSH transport to the bastion,
+and the device session runs inside that channel. The bastion transport is
+opened and authenticated once, then shared by every session.
+
+* ``max_channels`` caps the sessions carried by one bastion (OpenSSH's
+  ``MaxSessions`` defaults to 10).
+* With several bastions, each new session goes to the one carrying the fewest
+  channels. If they are all full, it waits for a slot.
+* A slot frees up by itself when the device session is closed (closing the
+  inner transport closes its channel).
+* A bastion whose transport died is reconnected on the next session.
+
+Usage::
+
+    jump = JumpHosts(["jump1.example.com", "admin@jump2.example.com:2222"], "user", "pass")
+    conn = claseCrassh()
+    conn.connect("10.0.0.1", "user", "pass", jump=jump)
+
+"""
+
+import threading
+import time
+
+
+def parse(spec, username, password):
+    """``[user@]host[:port]`` -> (host, port, username); the user defaults to ``username``"""
+    user, at, hostport = spec.rpartition("@")
+    host, colon, port = hostport.partition(":")
+    return host, int(port) if colon else 22, user if at else username
+
+
+class Bastion(object):
+    """One jump host and its shared, lazily opened SSH transport
+
+    Args:
+    host (str): Jump host address
+    username (str): Jump host username
+    password (str): Jump host password
+    port (int): Jump host SSH port
+    max_channels (int): Device sessions this bastion may carry at once
+    """
+
+    def __init__(self, host, username, password, port=22, max_channels=10):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_channels = max_channels
+        self.client = None
+        self.channels = []              # Device channels, only touched under JumpHosts.cond
+        self.lock = threading.Lock()    # Serializes (re)connecting to the bastion
+
+    def in_use(self):
+        """Channels still open (closed ones are dropped as they are found)"""
+        self.channels = [chan for chan in self.channels if not chan.closed]
+        return len(self.channels)
+
+    def transport(self, timeout):
+        """The bastion transport, connected and authenticated on first use or if it died"""
+        import paramiko
+        with self.lock:
+            if self.client is not None and self.client.get_transport() is not None \
+                    and self.client.get_transport().is_active():
+                return self.client.get_transport()
+            if self.client is not None:
+                self.client.close()
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            client.connect(self.host, port=self.port, username=self.username, password=self.password,
+                           allow_agent=False, look_for_keys=False, timeout=timeout)
+            self.client = client
+            return client.get_transport()
+
+    def close(self):
+        with self.lock:
+            if self.client is not None:
+                self.client.close()
+                self.client = None
+
+
+class JumpHosts(object):
+    """One or more bastions sharing the device sessions between them
+
+    Args:
+    specs (list): ``[user@]host[:port]`` of each bastion
+    username (str): Bastion username when the spec has none
+    password (str): Bastion password
+    max_channels (int): Device sessions per bastion
+    """
+
+    MAX_CHANNELS = 10
+
+    def __init__(self, specs, username, password, max_channels=None):
+        self.specs = tuple(specs)
+        self.max_channels = max_channels or self.MAX_CHANNELS
+        self.bastions = []
+        for spec in specs:
+            host, port, user = parse(spec, username, password)
+            self.bastions.append(Bastion(host, user, password, port, self.max_channels))
+        self.cond = threading.Condition()
+
+    def reserve(self, timeout):
+        """The least loaded bastion with a free slot, waits up to ``timeout`` seconds for one"""
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while True:
+                loads = [(bastion.in_use(), i) for i, bastion in enumerate(self.bastions)]
+                load, i = min(loads)
+                if load < self.max_channels:
+                    return self.bastions[i], load
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise IOError("every jump host is carrying %d sessions" % self.max_channels)
+                # Slots free up when sessions close, which nobody signals: look again shortly
+                self.cond.wait(min(remaining, 0.2))
+
+    def open(self, device, port=22, timeout=10):
+        """A ``direct-tcpip`` channel to ``device:port``, to use as ``sock=`` for the device session
+
+        Returns:
+        tuple.  (Bastion, paramiko.Channel)
+        """
+        with self.cond:
+            bastion, load = self.reserve(timeout)
+            # A placeholder holds the slot while the channel is being opened outside the lock
+            placeholder = _Pending()
+            bastion.channels.append(placeholder)
+        try:
+            chan = bastion.transport(timeout).open_channel(
+                "direct-tcpip", (device, port), ("127.0.0.1", 0), timeout=timeout)
+        except BaseException:
+            with self.cond:
+                placeholder.closed = True
+            raise
+        with self.cond:
+            placeholder.closed = True
+            bastion.channels.append(chan)
+        return bastion, chan
+
+    def close(self):
+        for bastion in self.bastions:
+            bastion.close()
+
+
+class _Pending(object):
+    closed = False
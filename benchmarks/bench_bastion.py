@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""Fleet runs through jump hosts vs. straight to the devices.
+
+Starts one ``FakeIOSServer`` (the fleet) and ``--bastions`` in-process
+``FakeBastionServer`` jump hosts, then runs the same fleet as
+``bench_e2e.py`` directly and through ``bastion.JumpHosts``. Reports the
+connect latency and throughput of both, plus how many logins each bastion
+saw (one per bastion is the point: the transport is shared) and the most
+channels it carried at once (bounded by ``--channels``).
+
+Usage::
+
+    python benchmarks/bench_bastion.py [--devices 50] [--bastions 2] [--channels 10] [--commands 3]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from bastion import JumpHosts  # noqa: E402
+from bench_e2e import run_fleet  # noqa: E402
+from fake_ios import FakeIOSServer, FakeBastionServer  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=50, help="devices (sessions) in the fleet")
+    parser.add_argument("--bastions", type=int, default=2, help="jump hosts to spread the sessions over")
+    parser.add_argument("--channels", type=int, default=10, help="sessions per jump host")
+    parser.add_argument("--commands", type=int, default=3, help="commands per device")
+    parser.add_argument("--size", type=int, default=65536, help="bytes of output per command")
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds each command takes on the device")
+    args = parser.parse_args()
+
+    server = FakeIOSServer(output_size=args.size, latency=args.latency).start()
+    bastions = [FakeBastionServer().start() for i in range(args.bastions)]
+    jump = JumpHosts(["127.0.0.1:%d" % b.port for b in bastions], server.username, server.password, args.channels)
+    commands = ["show interfaces status"] * args.commands
+    print("%-8s %7s %12s %12s %10s %10s" % ("path", "failed", "connect avg", "connect p95", "cmds/s", "wall"))
+    try:
+        for name, kwargs in (("direct", {}), ("bastion", {"jump": jump})):
+            stats = run_fleet(server, args.devices, commands, kwargs)
+            print("%-8s %7d %11.3fs %11.3fs %10.1f %9.1fs" % (
+                name, stats["failed"], stats["connect_avg"], stats["connect_p95"], stats["cmds_per_sec"], stats["wall"]))
+        for i, b in enumerate(bastions):
+            print("bastion %d: %d login(s), at most %d channels at once" % (i + 1, b.connections, b.peak))
+    finally:
+        jump.close()
+        for b in bastions:
+            b.stop()
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
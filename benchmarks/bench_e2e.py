@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""End-to-end benchmark of ``claseCrassh.connect``/``send_command`` against a fake IOS fleet.
+
+Starts an in-process ``FakeIOSServer`` and, for every fleet size, connects
+that many simulated devices at once (one thread and one ``claseCrassh`` per
+device, like ``main -j``), runs the command set and disconnects. Reports:
+
+* connect latency (TCP + key exchange + auth + shell + enable + terminal length + hostname probe),
+* commands per second and bytes per second across the fleet,
+* CPU seconds per session (client and fake server share the process, so this is an upper bound).
+
+Usage::
+
+    python benchmarks/bench_e2e.py [--devices 1,10,100,1000] [--commands 5] [--size 65536] [--latency 0.01]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from claseCrassh import claseCrassh  # noqa: E402
+from fake_ios import FakeIOSServer  # noqa: E402
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_device(server, commands, results, lock, connect_kwargs):
+    conn = claseCrassh()
+    start = time.perf_counter()
+    hostname = conn.connect("127.0.0.1", server.username, server.password, True, server.enable_password,
+                            False, 30, login_timeout=60, port=server.port, **connect_kwargs)
+    connected = time.perf_counter()
+    received = 0
+    done = 0
+    if hostname:
+        for cmd in commands:
+            received += len(conn.send_command(cmd, hostname, 120).encode("utf-8"))
+            done += 1
+        conn.disconnect()
+    with lock:
+        results.append((hostname, connected - start, time.perf_counter() - connected, done, received))
+
+
+def run_fleet(server, devices, commands, connect_kwargs=None):
+    """Connect ``devices`` sessions at once, return the stats dict."""
+    results = []
+    lock = threading.Lock()
+    threads = [threading.Thread(target=run_device, args=(server, commands, results, lock, connect_kwargs or {}))
+               for i in range(devices)]
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    ok = [r for r in results if r[0]]
+    connects = [r[1] for r in ok]
+    return {
+        "devices": devices,
+        "failed": devices - len(ok),
+        "connect_avg": sum(connects) / len(connects) if connects else 0.0,
+        "connect_p95": percentile(connects, 0.95),
+        "cmds_per_sec": sum(r[3] for r in ok) / wall,
+        "bytes_per_sec": sum(r[4] for r in ok) / wall,
+        "cpu_per_session": cpu / devices,
+        "wall": wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", default="1,10,100,1000", help="fleet sizes to simulate")
+    parser.add_argument("--commands", type=int, default=5, help="commands per device")
+    parser.add_argument("--size", type=int, default=65536, help="bytes of output per command")
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds each command takes on the device")
+    parser.add_argument("--probe-latency", type=float, default=0.05, help="seconds the hostname probe takes")
+    args = parser.parse_args()
+
+    server = FakeIOSServer(output_size=args.size, latency=args.latency, probe_latency=args.probe_latency).start()
+    commands = ["show interfaces status"] * args.commands
+    print("%8s %7s %12s %12s %10s %12s %10s %8s" % (
+        "devices", "failed", "connect avg", "connect p95", "cmds/s", "MB/s", "cpu/sess", "wall"))
+    try:
+        for devices in [int(x) for x in args.devices.split(",")]:
+            stats = run_fleet(server, devices, commands)
+            print("%8d %7d %11.3fs %11.3fs %10.1f %12.2f %9.3fs %7.1fs" % (
+                stats["devices"], stats["failed"], stats["connect_avg"], stats["connect_p95"],
+                stats["cmds_per_sec"], stats["bytes_per_sec"] / 1e6, stats["cpu_per_session"], stats["wall"]))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
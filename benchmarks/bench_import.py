@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""Import-time budget check for the C.R.A.SSH / swOffal modules.
+
+Cron wrappers and HTTP workers import these modules thousands of times a
+day, so importing them must be cheap and must not have side effects. For
+every module this script imports it in a fresh interpreter ``--runs`` times,
+reports the median time over an empty interpreter, and checks that the
+import:
+
+* stays under ``--budget`` milliseconds,
+* does not load paramiko or bottle (those load on first connect / first app),
+* does not change the working directory or start threads.
+
+Exits with status 1 if any module fails, so it can gate a release::
+
+    python benchmarks/bench_import.py [--budget 150] [--runs 7] [module ...]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+
+MODULES = ["claseCrassh", "ssh", "switch", "sesiones", "servicio", "interfaces", "planificador",
+           "historial", "contadores", "hostcache", "metrics", "archive", "store", "inventario"]
+HEAVY = ["paramiko", "bottle"]
+
+PROBE = """
+import json, os, sys, threading
+cwd = os.getcwd()
+threads = threading.active_count()
+import %s
+print(json.dumps({"cwd": os.getcwd() == cwd, "threads": threading.active_count() - threads,
+                  "heavy": [m for m in %r if m in sys.modules]}))
+"""
+
+
+def run(code):
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, stdout=subprocess.PIPE, check=True).stdout
+    return time.perf_counter() - start, out
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=MODULES, help="modules to check")
+    parser.add_argument("--budget", type=float, default=150.0, help="milliseconds allowed per import")
+    parser.add_argument("--runs", type=int, default=7, help="fresh interpreters per module")
+    args = parser.parse_args()
+
+    baseline = median([run("pass")[0] for i in range(args.runs)])
+    print("%-14s %10s  %s" % ("module", "ms", "result"))
+    failed = False
+    for module in args.modules:
+        times = []
+        for i in range(args.runs):
+            seconds, out = run(PROBE % (module, HEAVY))
+            times.append(seconds)
+        found = json.loads(out.decode("utf-8").splitlines()[-1])
+        ms = (median(times) - baseline) * 1000
+        problems = []
+        if ms > args.budget:
+            problems.append("over budget")
+        if found["heavy"]:
+            problems.append("loads " + ", ".join(found["heavy"]))
+        if not found["cwd"]:
+            problems.append("changes the working directory")
+        if found["threads"]:
+            problems.append("starts threads")
+        failed = failed or bool(problems)
+        print("%-14s %10.1f  %s" % (module, ms, "; ".join(problems) or "ok"))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
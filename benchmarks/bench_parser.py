@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""Parsing benchmark for ``interfaces.parsearInterfaces``.
+
+Builds a corpus of synthetic ``show interface`` outputs (switch and router
+flavours, random counters, some ports down) and times:
+
+* the compiled single-pass parser, one port per output (``show interface X``),
+* the same parser over bulk ``show interfaces`` outputs (48 ports per text),
+* the old ``words.index`` parser that ``SwVerif.verificarPuertos`` used.
+
+With ``--crlf`` the outputs have ``\\r\\n`` line endings, as they come off the
+SSH channel.
+
+Usage::
+
+    python benchmarks/bench_parser.py [--samples 20000] [--seed 1] [--crlf]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+from interfaces import parsearInterfaces, parsearInterfaz  # noqa: E402
+
+SWITCH = """{nombre} is {estado}, line protocol is {protocolo} ({conn})
+  Hardware is Gigabit Ethernet, address is 0011.2233.{mac:04x} (bia 0011.2233.{mac:04x})
+  Description: acceso piso {piso}
+  MTU 1500 bytes, BW 1000000 Kbit/sec, DLY 10 usec,
+     reliability {rel}/255, txload {tx}/255, rxload {rx}/255
+  Encapsulation ARPA, loopback not set
+  Keepalive set (10 sec)
+  Full-duplex, 1000Mb/s, media type is 10/100/1000BaseTX
+  input flow-control is off, output flow-control is unsupported
+  ARP type: ARPA, ARP Timeout 04:00:00
+  Last input never, output 00:00:01, output hang never
+  Last clearing of "show interface" counters never
+  Input queue: 0/75/0/0 (size/max/drops/flushes); Total output drops: 0
+  Queueing strategy: fifo
+  Output queue: 0/40 (size/max)
+  5 minute input rate {inr} bits/sec, {inp} packets/sec
+  5 minute output rate {outr} bits/sec, {outp} packets/sec
+     {pin} packets input, {bin} bytes, 0 no buffer
+     Received 10453 broadcasts (8800 multicasts)
+     0 runts, 0 giants, 0 throttles
+     {ie} input errors, {crc} CRC, 0 frame, 0 overrun, 0 ignored
+     0 watchdog, 8800 multicast, 0 pause input
+     0 input packets with dribble condition detected
+     {pout} packets output, {bout} bytes, 0 underruns
+     {oe} output errors, {col} collisions, {res} interface resets
+     0 unknown protocol drops
+     0 babbles, 0 late collision, 0 deferred
+     0 lost carrier, 0 no carrier, 0 pause output
+     0 output buffer failures, 0 output buffers swapped out
+"""
+
+ROUTER = """{nombre} is {estado}, line protocol is {protocolo}
+  Hardware is CN Gigabit Ethernet, address is 0022.3344.{mac:04x} (bia 0022.3344.{mac:04x})
+  Internet address is 10.{piso}.0.1/24
+  MTU 1500 bytes, BW 100000 Kbit/sec, DLY 100 usec,
+     reliability {rel}/255, txload {tx}/255, rxload {rx}/255
+  Encapsulation ARPA, loopback not set
+  30 second input rate {inr} bits/sec, {inp} packets/sec
+  30 second output rate {outr} bits/sec, {outp} packets/sec
+     {pin} packets input, {bin} bytes, 0 no buffer
+     {ie} input errors, {crc} CRC, 0 frame, 0 overrun, 0 ignored
+     {pout} packets output, {bout} bytes, 0 underruns
+     {oe} output errors, {res} interface resets
+"""
+
+
+def muestra(rnd, nombre):
+    abajo = rnd.random() < 0.1
+    return rnd.choice((SWITCH, SWITCH, ROUTER)).format(
+        nombre=nombre,
+        estado="administratively down" if abajo else "up",
+        protocolo="down" if abajo else "up",
+        conn="disabled" if abajo else "connected",
+        mac=rnd.randrange(0x10000), piso=rnd.randrange(1, 30),
+        rel=rnd.randrange(200, 256), tx=rnd.randrange(1, 256), rx=rnd.randrange(1, 256),
+        inr=rnd.randrange(10 ** 9), inp=rnd.randrange(10 ** 5),
+        outr=rnd.randrange(10 ** 9), outp=rnd.randrange(10 ** 5),
+        pin=rnd.randrange(10 ** 12), bin=rnd.randrange(10 ** 14),
+        pout=rnd.randrange(10 ** 12), bout=rnd.randrange(10 ** 14),
+        ie=rnd.randrange(1000), crc=rnd.randrange(1000), oe=rnd.randrange(1000),
+        col=rnd.randrange(1000), res=rnd.randrange(20),
+    )
+
+
+def parser_viejo(output, puerto):
+    """The parser ``verificarPuertos`` used before (switch flavour only)."""
+    words = output.split()
+    gig_ind = words.index(puerto) + 6
+    rel_ind = words.index('reliability')
+    txl_ind = words.index('txload')
+    rxl_ind = words.index('rxload')
+    crc_ind = words.index('CRC,')
+    col_ind = words.index('collisions,')
+    stringSw = ' '.join(words[gig_ind:gig_ind + 3])
+    stringSw1 = ' '.join(words[rel_ind:rel_ind + 2])
+    stringSw3 = ' '.join(words[crc_ind - 4:crc_ind + 1])
+    stringSw4 = ' '.join(words[col_ind - 4:col_ind + 1])
+    txl_texto = ' '.join(words[txl_ind:txl_ind + 2])
+    rxl_texto = ' '.join(words[rxl_ind:rxl_ind + 2])
+    txl_indb = txl_texto.index('/')
+    rxl_indb = rxl_texto.index('/')
+    resultado_txl = int(txl_texto[txl_indb - 1:txl_indb]) / int(rxl_texto[txl_indb + 1:])
+    resultado_rxl = int(txl_texto[rxl_indb - 1:rxl_indb]) / int(rxl_texto[rxl_indb + 1:])
+    stringSw2 = ('txload %' + "{0:.3f}".format(resultado_txl) + ', rxload %' + "{0:.3f}".format(resultado_rxl))
+    return (stringSw, stringSw1, stringSw2, stringSw3, stringSw4)
+
+
+def cronometrar(func, corpus):
+    inicio = time.perf_counter()
+    fallos = 0
+    for args in corpus:
+        try:
+            func(*args)
+        except ValueError:
+            fallos += 1
+    return time.perf_counter() - inicio, fallos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=20000, help="interface outputs in the corpus")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--crlf", action="store_true", help="\\r\\n line endings, as read from the device")
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    nombres = ["GigabitEthernet1/0/%d" % n for n in range(1, 49)]
+    sueltos = []
+    for i in range(args.samples):
+        nombre = nombres[i % len(nombres)]
+        texto = muestra(rnd, nombre)
+        if args.crlf:
+            texto = texto.replace("\n", "\r\n")
+        sueltos.append((texto, nombre))
+    masivos = []
+    for i in range(0, len(sueltos), len(nombres)):
+        masivos.append(("".join(texto for texto, nombre in sueltos[i:i + len(nombres)]),))
+    megas = sum(len(texto) for texto, nombre in sueltos) / 1e6
+
+    # sanity check: every port comes back with its counters
+    for texto, nombre in sueltos[:200]:
+        registro = parsearInterfaz(texto)
+        assert registro.interfaz == nombre and registro.crc is not None
+
+    print("corpus: %d outputs, %.1f MB" % (len(sueltos), megas))
+    print("%-34s %9s %12s %8s" % ("parser", "seconds", "outputs/s", "errors"))
+    for nombre, func, corpus in (
+            ("parsearInterfaz (per port)", lambda t, n: parsearInterfaz(t), sueltos),
+            ("parsearInterfaces (48 per text)", parsearInterfaces, masivos),
+            ("old words.index parser", parser_viejo, sueltos)):
+        segundos, fallos = cronometrar(func, corpus)
+        print("%-34s %8.3fs %12.0f %8d" % (nombre, segundos, len(sueltos) / segundos, fallos))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""Connect latency and bulk-output throughput of each SSH transport profile.
+
+Runs ``claseCrassh.connect`` plus one large command against the in-process
+``FakeIOSServer`` once per profile in ``profiles.PROFILES``. With ``--rtt``
+and/or ``--bandwidth`` the client goes through a local relay that delays and
+rate-limits both directions, which is where window sizes and compression
+show up (plain loopback mostly measures CPU: ciphers, MACs, key exchange).
+
+The fake server accepts compression so ``slow-wan`` can negotiate it. Its
+canned output is very repetitive, so compression gains here are an upper
+bound for real ``show`` output.
+
+Usage::
+
+    python benchmarks/bench_profiles.py [--connects 5] [--size 4194304] [--rtt 0.08] [--bandwidth 2e6]
+"""
+
+import argparse
+import heapq
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+import paramiko  # noqa: E402
+
+import profiles  # noqa: E402
+from claseCrassh import claseCrassh  # noqa: E402
+from fake_ios import FakeIOSServer  # noqa: E402
+
+
+class CompressingServer(FakeIOSServer):
+    """Fake IOS that also offers zlib, like most IOS images do."""
+
+    def make_transport(self, client):
+        transport = paramiko.Transport(client)
+        transport.use_compression(True)
+        return transport
+
+
+class SlowLink(object):
+    """TCP relay that adds ``rtt / 2`` of delay and a ``bandwidth`` (bytes/s) cap per direction."""
+
+    def __init__(self, target_port, rtt=0.0, bandwidth=None):
+        self.target_port = target_port
+        self.delay = rtt / 2.0
+        self.bandwidth = bandwidth
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(64)
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+
+    def accept_loop(self):
+        while True:
+            try:
+                client, addr = self.sock.accept()
+            except OSError:
+                break
+            server = socket.create_connection(("127.0.0.1", self.target_port))
+            for src, dst in ((client, server), (server, client)):
+                self.pipe(src, dst)
+
+    def pipe(self, src, dst):
+        queue = []
+        cond = threading.Condition()
+
+        def reader():
+            free_at = 0.0
+            while True:
+                try:
+                    data = src.recv(65536)
+                except OSError:
+                    data = b""
+                now = time.monotonic()
+                # Serialization at the capped rate, then the propagation delay
+                if self.bandwidth:
+                    free_at = max(free_at, now) + len(data) / self.bandwidth
+                else:
+                    free_at = now
+                with cond:
+                    heapq.heappush(queue, (free_at + self.delay, len(queue), data))
+                    cond.notify()
+                if not data:
+                    break
+
+        def writer():
+            while True:
+                with cond:
+                    while not queue:
+                        cond.wait()
+                    due, seq, data = queue[0]
+                    wait = due - time.monotonic()
+                    if wait > 0:
+                        cond.wait(wait)
+                        continue
+                    heapq.heappop(queue)
+                if not data:
+                    try:
+                        dst.shutdown(socket.SHUT_WR)
+                    except OSError:
+                        pass
+                    break
+                try:
+                    dst.sendall(data)
+                except OSError:
+                    break
+
+        threading.Thread(target=reader, daemon=True).start()
+        threading.Thread(target=writer, daemon=True).start()
+
+    def stop(self):
+        self.sock.close()
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def measure(server, port, profile, connects, bulk_commands):
+    connect_times = []
+    bulk_times = []
+    received = 0
+    for i in range(connects):
+        conn = claseCrassh()
+        start = time.perf_counter()
+        hostname = conn.connect("127.0.0.1", server.username, server.password, True, server.enable_password,
+                                False, 30, login_timeout=120, port=port, profile=profile)
+        if not hostname:
+            return None
+        connect_times.append(time.perf_counter() - start)
+        if i == 0:
+            # Bulk output on the first session only, the others just measure connect
+            start = time.perf_counter()
+            for j in range(bulk_commands):
+                received += len(conn.send_command("show tech-support", hostname, 600).encode("utf-8"))
+            bulk_times.append(time.perf_counter() - start)
+        conn.disconnect()
+    return median(connect_times), received / sum(bulk_times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--connects", type=int, default=5, help="connects per profile (median is reported)")
+    parser.add_argument("--size", type=int, default=4 * 1024 * 1024, help="bytes of output of the bulk command")
+    parser.add_argument("--bulk", type=int, default=2, help="bulk commands per profile")
+    parser.add_argument("--rtt", type=float, default=0.0, help="round trip time to simulate, seconds")
+    parser.add_argument("--bandwidth", type=float, default=None, help="link rate to simulate, bytes per second")
+    parser.add_argument("profiles", nargs="*", default=sorted(profiles.PROFILES), help="profiles to compare")
+    args = parser.parse_args()
+
+    server = CompressingServer(output_size=args.size).start()
+    link = None
+    port = server.port
+    if args.rtt or args.bandwidth:
+        link = SlowLink(server.port, args.rtt, args.bandwidth)
+        port = link.port
+    print("rtt %.0f ms, bandwidth %s" % (args.rtt * 1000, "%.1f MB/s" % (args.bandwidth / 1e6) if args.bandwidth else "unlimited"))
+    print("%-12s %12s %14s" % ("profile", "connect", "bulk MB/s"))
+    try:
+        for name in args.profiles:
+            result = measure(server, port, name, args.connects, args.bulk)
+            if result is None:
+                print("%-12s %12s" % (name, "failed"))
+                continue
+            print("%-12s %11.3fs %14.2f" % (name, result[0], result[1] / 1e6))
+    finally:
+        if link:
+            link.stop()
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
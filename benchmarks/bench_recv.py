@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""Micro-benchmark for ``claseCrassh.send_command`` receive loop.
+
+Feeds a fake paramiko channel with ``N`` bytes of ``show run`` like output
+(2048 byte chunks, multibyte characters included) followed by the prompt, and
+reports wall time and CPU time for the current receive loop and, for
+comparison, the old ``recv_ready()`` busy loop.
+
+Usage::
+
+    python benchmarks/bench_recv.py [--sizes 64,256,1024,4096] [--latency 0.2] [--legacy-max 1024]
+
+``--sizes`` are in KB, ``--latency`` is milliseconds between chunks (network
+time, where the old loop spins a full core) and ``--legacy-max`` is the
+biggest size (KB) the quadratic old loop is run against.
+"""
+
+import argparse
+import os
+import re
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+from claseCrassh import claseCrassh  # noqa: E402
+
+CHUNK = 2048
+HOSTNAME = "bench-sw01"
+
+
+def make_output(size):
+    """Build ``size`` bytes of device output ending with the prompt."""
+    line = " description enlace a depósito ñandú - interface GigabitEthernet1/0/1\r\n".encode("utf-8")
+    body = line * (size // len(line) + 1)
+    return b"show run\r\n" + body[:size] + ("\r\n" + HOSTNAME + "#").encode("utf-8")
+
+
+class FakeChannel(object):
+    """Just enough of ``paramiko.Channel`` for ``send_command``."""
+
+    def __init__(self, payload, latency):
+        self.chunks = [payload[i:i + CHUNK] for i in range(0, len(payload), CHUNK)]
+        self.latency = latency
+        self.timeout = None
+        self.next_at = 0
+
+    def send(self, data):
+        self.next_at = time.monotonic() + self.latency
+        return len(data)
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def recv_ready(self):
+        return bool(self.chunks) and time.monotonic() >= self.next_at
+
+    def recv(self, nbytes):
+        wait = self.next_at - time.monotonic()
+        if wait > 0:
+            if self.timeout is not None and wait > self.timeout:
+                time.sleep(self.timeout)
+                raise socket.timeout()
+            time.sleep(wait)
+        if not self.chunks:
+            return b""
+        self.next_at = time.monotonic() + self.latency
+        return self.chunks.pop(0)
+
+
+def legacy_send_command(conn, command, bail_timeout=60):
+    """The receive loop as it was before the rewrite (busy loop, rescans everything)."""
+    output = ""
+    keeplooping = True
+    regex = '^' + conn.hostname[:20] + '(.*)(\\ )?#'
+    theprompt = re.compile(regex)
+    now = int(time.time())
+    timeout = now + bail_timeout
+    conn.remote_conn.send(command + "\n")
+    while keeplooping:
+        now = int(time.time())
+        if now == timeout:
+            output += "crassh bailed on command: " + command
+            break
+        if conn.remote_conn.recv_ready():
+            # 'replace' here, the old code raised UnicodeDecodeError on split multibyte chars
+            output += conn.remote_conn.recv(2048).decode('utf-8', 'replace')
+            theoutput = output.splitlines()
+            for lines in theoutput:
+                myregmatch = theprompt.search(lines)
+            if myregmatch:
+                keeplooping = False
+    return output
+
+
+def measure(func, payload, latency):
+    conn = claseCrassh()
+    conn.hostname = HOSTNAME
+    conn.remote_conn = FakeChannel(payload, latency)
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    output = func(conn)
+    return time.perf_counter() - wall, time.process_time() - cpu, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="64,256,1024,4096", help="output sizes in KB")
+    parser.add_argument("--latency", type=float, default=0.0, help="milliseconds between chunks")
+    parser.add_argument("--legacy-max", type=int, default=1024, help="largest size (KB) for the old loop")
+    args = parser.parse_args()
+
+    latency = args.latency / 1000.0
+    print("%10s %8s | %10s %10s | %10s %10s" % ("size KB", "chunks", "new wall", "new cpu", "old wall", "old cpu"))
+    for size_kb in [int(x) for x in args.sizes.split(",")]:
+        payload = make_output(size_kb * 1024)
+        wall, cpu, output = measure(lambda c: c.send_command("show run", HOSTNAME, 600), payload, latency)
+        assert output == payload.decode("utf-8"), "receive loop corrupted the output"
+        row = "%10d %8d | %9.3fs %9.3fs |" % (size_kb, len(payload) // CHUNK + 1, wall, cpu)
+        if size_kb <= args.legacy_max:
+            wall, cpu, output = measure(lambda c: legacy_send_command(c, "show run", 600), payload, latency)
+            row += " %9.3fs %9.3fs" % (wall, cpu)
+        else:
+            row += " %10s %10s" % ("-", "-")
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
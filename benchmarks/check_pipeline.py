@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""Check that pipelined commands (``-W``) give the same outputs as running them one by one.
+
+Drives ``send_commands_pipelined`` and ``send_commands_iter`` against a fake
+shell that runs the commands in order, like a device reading typed-ahead
+input, and hands its output back cut at random points (inside lines, inside
+the prompt, inside multibyte characters). For every scenario and seed the
+outputs of both modes are compared command by command:
+
+* ``plain``: quick commands, every output must be identical,
+* ``late``: one command outlives the timeout but its prompt comes within
+  ``-t`` more seconds: it is bailed on in both modes, every other output must
+  be identical (the late prompt must not end the next command),
+* ``hung``: one command never ends: both modes must give up the shell
+  (``ShellLost``) right after it, with the same commands complete.
+
+Usage::
+
+    python benchmarks/check_pipeline.py [--seeds 20] [--window 8] [--timeout 0.2]
+
+Exits non-zero if any output differs.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+from claseCrassh import claseCrassh, ShellLost  # noqa: E402
+
+HOSTNAME = "check-sw01"
+BAILED = "crassh bailed on command: "
+
+
+class FakeShell(object):
+    """Just enough of ``paramiko.Channel``: a shell that runs what it is sent, one command at a time
+
+    Args:
+    seed (int): Seed of the split points and of the outputs
+    durations (dict): Seconds each command takes, the others take none (``None`` never ends)
+    """
+
+    def __init__(self, seed, durations):
+        self.seed = seed
+        self.rnd = random.Random(seed)
+        self.durations = durations
+        self.timeout = None
+        self.typed = ""             # Sent, up to the next line break
+        self.events = []            # (time.monotonic() it shows up, bytes), in order
+        self.pending = b""          # Shown up, not read yet
+        self.busy_until = time.monotonic()
+
+    def output(self, command):
+        """What the device prints for ``command``: lines with multibyte text, then the prompt"""
+        # Same text whatever the mode, the split points are what changes
+        rnd = random.Random("%d %s" % (self.seed, command))
+        lines = ["%s línea %d de «%s» ñandú" % (command, n, command) for n in range(rnd.randrange(0, 40))]
+        return ("\r\n".join(lines) + "\r\n" if lines else "") + HOSTNAME + "#"
+
+    def send(self, data):
+        self.typed += data.decode("utf-8") if isinstance(data, bytes) else data
+        lines = self.typed.split("\n")
+        self.typed = lines.pop()
+        for command in lines:
+            # The echo shows up when the device gets to the command, the rest when it is done
+            start = max(self.busy_until, time.monotonic())
+            self.events.append((start, (command + "\r\n").encode("utf-8")))
+            duration = self.durations.get(command, 0)
+            if duration is None:
+                self.busy_until = float("inf")
+                continue
+            self.busy_until = start + duration
+            self.events.append((self.busy_until, self.output(command).encode("utf-8")))
+        return len(data)
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def recv(self, nbytes):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while True:
+            now = time.monotonic()
+            while self.events and self.events[0][0] <= now:
+                self.pending += self.events.pop(0)[1]
+            if self.pending:
+                cut = self.rnd.randrange(1, min(nbytes, len(self.pending), 64) + 1)
+                data, self.pending = self.pending[:cut], self.pending[cut:]
+                return data
+            wake = self.events[0][0] if self.events else float("inf")
+            if deadline is not None:
+                if now >= deadline:
+                    raise socket.timeout()
+                wake = min(wake, deadline)
+            time.sleep(max(0.0, min(wake - now, 0.05)))
+
+
+def run(mode, commands, durations, seed, timeout, window):
+    """Outputs of ``commands`` in ``mode``, and whether the shell was given up
+
+    Returns:
+    tuple.  ``{index: output}`` of the complete commands, and ``True`` if ``ShellLost`` was raised
+    """
+    conn = claseCrassh()
+    conn.hostname = HOSTNAME
+    conn.remote_conn = FakeShell(seed, durations)
+    if mode == "pipelined":
+        results = conn.send_commands_pipelined(commands, HOSTNAME, timeout, window)
+    else:
+        results = conn.send_commands_iter(commands, HOSTNAME, timeout)
+    outputs = {}
+    chunks = []
+    lost = False
+    # The bail messages would bury the table
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            for index, chunk in results:
+                if chunk is None:
+                    outputs[index] = "".join(chunks)
+                    chunks = []
+                else:
+                    chunks.append(chunk)
+        except ShellLost:
+            lost = True
+    return outputs, lost
+
+
+def compare(sequential, pipelined, commands):
+    """Differences between the two runs, as text lines (none if they agree)"""
+    (seq_out, seq_lost), (pipe_out, pipe_lost) = sequential, pipelined
+    problems = []
+    if seq_lost != pipe_lost:
+        problems.append("shell given up: sequential %s, pipelined %s" % (seq_lost, pipe_lost))
+    if sorted(seq_out) != sorted(pipe_out):
+        problems.append("complete commands: sequential %s, pipelined %s" % (sorted(seq_out), sorted(pipe_out)))
+    for index in sorted(set(seq_out) & set(pipe_out)):
+        seq_bailed = BAILED in seq_out[index]
+        pipe_bailed = BAILED in pipe_out[index]
+        if seq_bailed != pipe_bailed:
+            problems.append("%s: bailed sequential %s, pipelined %s" % (commands[index], seq_bailed, pipe_bailed))
+        elif not seq_bailed and seq_out[index] != pipe_out[index]:
+            problems.append("%s: outputs differ (%d vs %d chars)" % (commands[index], len(seq_out[index]), len(pipe_out[index])))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seeds", type=int, default=20, help="random splits tried per scenario")
+    parser.add_argument("--window", type=int, default=8, help="commands in flight (-W)")
+    parser.add_argument("--timeout", type=float, default=0.2, help="seconds per command (-t)")
+    args = parser.parse_args()
+
+    commands = ["show cmd%02d" % n for n in range(12)]
+    slow = commands[5]
+    scenarios = (
+        ("plain", {}, False),
+        # Outlives the timeout, its prompt comes within -t more seconds
+        ("late", {slow: args.timeout * 1.5}, False),
+        ("hung", {slow: None}, True),
+    )
+    failed = 0
+    print("%-8s %6s %10s %10s" % ("scenario", "seeds", "mismatches", "seconds"))
+    for name, durations, lost in scenarios:
+        seeds = args.seeds if not durations else max(1, args.seeds // 4)
+        mismatches = 0
+        started = time.monotonic()
+        for seed in range(seeds):
+            sequential = run("sequential", commands, durations, seed, args.timeout, args.window)
+            pipelined = run("pipelined", commands, durations, seed, args.timeout, args.window)
+            problems = compare(sequential, pipelined, commands)
+            if sequential[1] != lost:
+                problems.append("sequential: shell given up %s, expected %s" % (sequential[1], lost))
+            if problems:
+                mismatches += 1
+                for problem in problems:
+                    print("  seed %d: %s" % (seed, problem))
+        failed += mismatches
+        print("%-8s %6d %10d %9.2fs" % (name, seeds, mismatches, time.monotonic() - started))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""In-process stand-in for a Cisco IOS SSH server, for benchmarks.
+
+``FakeIOSServer`` listens on ``127.0.0.1`` and answers every connection with
+a paramiko ``ServerInterface`` that emulates just enough of an IOS shell for
+``claseCrassh``:
+
+* banner and user exec prompt (``swNNNN>``), ``enable`` + ``Password:``,
+* ``terminal length 0``,
+* ``show run | inc hostname``,
+* any other command returns ``output_size`` bytes of canned output after
+  ``latency`` seconds.
+
+Every connection gets its own hostname (``sw0001``, ``sw0002``...), so one
+server stands in for a whole fleet. ``FakeBastionServer`` is a jump host: it
+only accepts ``direct-tcpip`` channels and relays each one to its target (a
+``FakeIOSServer``, say). Usage::
+
+    server = FakeIOSServer(output_size=64 * 1024, latency=0.01)
+    server.start()
+    conn = claseCrassh()
+    conn.connect("127.0.0.1", "cisco", "cisco", True, "cisco", port=server.port)
+    ...
+    server.stop()
+"""
+
+import itertools
+import socket
+import threading
+import time
+
+import paramiko
+
+BANNER = "\r\n*****************************\r\n* Acceso solo autorizado     *\r\n*****************************\r\n\r\n"
+LINE = "  GigabitEthernet1/0/1   connected    10   a-full a-1000 10/100/1000BaseTX\r\n"
+
+_host_key = None
+_host_key_lock = threading.Lock()
+
+
+def host_key():
+    """One RSA host key per process, generating it is the slow part of starting a server."""
+    global _host_key
+    with _host_key_lock:
+        if _host_key is None:
+            _host_key = paramiko.RSAKey.generate(2048)
+        return _host_key
+
+
+class FakeIOSInterface(paramiko.ServerInterface):
+    """Accepts ``username``/``password``, interactive shells and ``exec`` requests."""
+
+    def __init__(self, server):
+        self.server = server
+        self.channels = 0
+        self.requests = {}          # channel id -> None for a shell, the command for an exec
+        self.requested = threading.Condition()
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        if username == self.server.username and password == self.server.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind != "session":
+            return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+        # Like IOS, a server can be limited to a few channels per connection
+        if self.server.channels is not None and self.channels >= self.server.channels:
+            return paramiko.OPEN_FAILED_RESOURCE_SHORTAGE
+        self.channels += 1
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        with self.requested:
+            self.requests[channel.get_id()] = None
+            self.requested.notify_all()
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        with self.requested:
+            self.requests[channel.get_id()] = command.decode("utf-8", "replace")
+            self.requested.notify_all()
+        return True
+
+    def wait_request(self, channel, timeout=10):
+        """``(True, None)`` for a shell, ``(True, command)`` for an exec, ``(False, None)`` if nothing came"""
+        with self.requested:
+            self.requested.wait_for(lambda: channel.get_id() in self.requests, timeout)
+            if channel.get_id() not in self.requests:
+                return False, None
+            return True, self.requests.pop(channel.get_id())
+
+
+class FakeIOSShell(object):
+    """The IOS command line on one channel."""
+
+    def __init__(self, server, channel, hostname):
+        self.server = server
+        self.channel = channel
+        self.hostname = hostname
+        self.privileged = False
+
+    def prompt(self):
+        return self.hostname + ("#" if self.privileged else ">")
+
+    def readline(self):
+        line = b""
+        while not line.endswith(b"\n"):
+            data = self.channel.recv(1)
+            if not data:
+                return None
+            line += data
+        return line.decode("utf-8", "replace").strip()
+
+    def run(self):
+        chan = self.channel
+        try:
+            chan.sendall(BANNER + self.prompt())
+            while True:
+                line = self.readline()
+                if line is None:
+                    break
+                chan.sendall(line + "\r\n")
+                if line == "enable" and not self.privileged:
+                    chan.sendall("Password: ")
+                    password = self.readline()
+                    if password == self.server.enable_password:
+                        self.privileged = True
+                    else:
+                        chan.sendall("\r\n% Access denied\r\n\r\n")
+                    chan.sendall("\r\n" + self.prompt())
+                    continue
+                if line in ("exit", "logout"):
+                    break
+                chan.sendall(self.execute(line) + self.prompt())
+        except (socket.error, EOFError, paramiko.SSHException):
+            pass
+        finally:
+            chan.close()
+
+    def execute(self, line):
+        if not line or line == "terminal length 0":
+            return ""
+        if line.startswith("show run | inc hostname"):
+            time.sleep(self.server.probe_latency)
+            return "hostname %s\r\n" % self.hostname
+        time.sleep(self.server.latency)
+        return self.server.output
+
+
+class FakeIOSServer(object):
+    """A listening fake IOS fleet.
+
+    Args:
+    output_size (int): Bytes returned by every command other than the handshake ones
+    latency (float): Seconds each command takes
+    probe_latency (float): Seconds ``show run | inc hostname`` takes (a config walk)
+    channels (int): Channels accepted per connection, ``None`` for no limit
+    """
+
+    def __init__(self, output_size=4096, latency=0.0, probe_latency=0.0,
+                 username="cisco", password="cisco", enable_password="cisco", port=0, channels=None):
+        self.output = (LINE * (output_size // len(LINE) + 1))[:output_size] + "\r\n"
+        self.latency = latency
+        self.probe_latency = probe_latency
+        self.username = username
+        self.password = password
+        self.enable_password = enable_password
+        self.channels = channels
+        self.counter = itertools.count(1)
+        self.transports = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", port))
+        self.sock.listen(1024)
+        self.port = self.sock.getsockname()[1]
+        self.running = False
+
+    def start(self):
+        host_key()
+        self.running = True
+        thread = threading.Thread(target=self.accept_loop, name="fake-ios-accept", daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        self.sock.close()
+        for transport in self.transports:
+            transport.close()
+
+    def accept_loop(self):
+        while self.running:
+            try:
+                client, addr = self.sock.accept()
+            except OSError:
+                break
+            thread = threading.Thread(target=self.serve, args=(client,), daemon=True)
+            thread.start()
+
+    def make_transport(self, client):
+        """Server side transport, subclasses tune it (window sizes, algorithms...)."""
+        return paramiko.Transport(client)
+
+    def serve(self, client):
+        transport = self.make_transport(client)
+        self.transports.append(transport)
+        transport.add_server_key(host_key())
+        interface = FakeIOSInterface(self)
+        try:
+            transport.start_server(server=interface)
+        except (paramiko.SSHException, EOFError):
+            return
+        channel = transport.accept(30)
+        if channel is None:
+            transport.close()
+            return
+        # One hostname per connection, every channel of it is the same device
+        hostname = "sw%04d" % next(self.counter)
+        while channel is not None or transport.is_active():
+            if channel is not None:
+                thread = threading.Thread(target=self.session, args=(interface, channel, hostname), daemon=True)
+                thread.start()
+            channel = transport.accept(1)
+
+    def session(self, interface, channel, hostname):
+        ok, command = interface.wait_request(channel)
+        shell = FakeIOSShell(self, channel, hostname)
+        if not ok:
+            channel.close()
+        elif command is None:
+            shell.run()
+        else:
+            try:
+                channel.sendall(shell.execute(command))
+            except (socket.error, EOFError, paramiko.SSHException):
+                pass
+            channel.close()
+
+
+class FakeBastionInterface(FakeIOSInterface):
+    """Accepts ``direct-tcpip`` channels, no shells."""
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_direct_tcpip_request(self, chanid, origin, destination):
+        self.server.destinations[chanid] = destination
+        return paramiko.OPEN_SUCCEEDED
+
+
+class FakeBastionServer(FakeIOSServer):
+    """A jump host relaying ``direct-tcpip`` channels to their destinations.
+
+    ``connections`` counts transports (SSH logins to the bastion), ``peak``
+    the most channels open at once over any of them.
+    """
+
+    def __init__(self, **kwargs):
+        FakeIOSServer.__init__(self, **kwargs)
+        self.destinations = {}
+        self.connections = 0
+        self.open_channels = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def serve(self, client):
+        transport = self.make_transport(client)
+        self.transports.append(transport)
+        transport.add_server_key(host_key())
+        try:
+            transport.start_server(server=FakeBastionInterface(self))
+        except (paramiko.SSHException, EOFError):
+            return
+        with self.lock:
+            self.connections += 1
+        while transport.is_active():
+            channel = transport.accept(1)
+            if channel is None:
+                continue
+            destination = self.destinations.pop(channel.get_id(), None)
+            thread = threading.Thread(target=self.relay, args=(channel, destination), daemon=True)
+            thread.start()
+
+    def relay(self, channel, destination):
+        try:
+            target = socket.create_connection(destination, 10)
+        except (OSError, TypeError):
+            channel.close()
+            return
+        with self.lock:
+            self.open_channels += 1
+            self.peak = max(self.peak, self.open_channels)
+
+        def pump(src, dst):
+            try:
+                while True:
+                    data = src.recv(65536)
+                    if not data:
+                        break
+                    dst.sendall(data)
+            except (OSError, EOFError, paramiko.SSHException):
+                pass
+            finally:
+                # shutdown (not just close) wakes the other pump if it is blocked on the target
+                channel.close()
+                try:
+                    target.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+        thread = threading.Thread(target=pump, args=(target, channel), daemon=True)
+        thread.start()
+        pump(channel, target)
+        thread.join()
+        target.close()
+        with self.lock:
+            self.open_channels -= 1
@@ -21,18 +21,40 @@ import getopt               # Command line options
 import os                   #
 import stat                 # File system
 import re                   # Regex
-import paramiko             # SSH
+import codecs               # Incremental UTF-8 decoding
+import threading            # Locks for parallel runs
+import concurrent.futures   # Worker pool (-j)
+from hostcache import HostnameCache # Hostname/prompt cache (-H)
+from metrics import JsonlSink       # Per-phase timings (-M)
+from archive import ArchiveWriter   # Compressed, indexed output (-Z)
+from store import OutputStore       # Deduplicated outputs + run manifests (-S)
+import profiles                     # SSH transport profiles (-K)
+from bastion import JumpHosts       # Shared jump host transports (-J)
+from reachability import Sweeper    # TCP/22 pre-flight sweep (-R)
+from inventario import Inventario, parsearFiltro # Device inventory (-I/-F)
+from durations import DurationStats, CONNECT, LOGIN # Learned timeouts and estimates (-D)
+from progress import Progress, open_stream          # Progress and live event stream (-O)
 
 # I don't care about long line, deal with it ;)
 # pylint: disable=C0301
 
 
+class ShellLost(Exception):
+    """The shell never came back to the prompt after a bail, nothing more can be run on it"""
+
+
 class claseCrassh(object):
 
     # Global variables
     crassh_version = "2.8"      # Version Control in a Variable
-    remote_conn = ""            # Paramiko Remote Connection
-    remote_conn_pre = ""        # Paramiko Remote Connection Settings (pre-connect)
+    recv_size = 65536           # Bytes asked from the channel on every receive
+
+    # Prompts seen while logging in, matched against the last line received
+    prompt_privileged = re.compile(r'^[\w.\-]+(\([\w\-]+\))?#\s*$')
+    prompt_user = re.compile(r'^[\w.\-]+>\s*$')
+    prompt_password = re.compile(r'[Pp]assword:\s*$')
+    # Commands that only read state, safe to run side by side (send_commands_parallel)
+    read_only_command = re.compile(r'^\s*(sh(o(w)?)?|more|dir)(\s|$)', re.I)
 
 
     # Python 2 & 3 input compatibility
@@ -44,9 +66,41 @@ class claseCrassh(object):
         pass
     """
     def __init__(self):
+        # Connection state lives on the instance so every worker gets its own session
+        self.remote_conn = ""       # Paramiko Remote Connection
+        self.remote_conn_pre = ""   # Paramiko Remote Connection Settings (pre-connect)
+        self.hostname = ""          # Hostname of the connected device
+        self.device = ""            # Address used to connect
+        self.prompt = ""            # Privileged prompt seen at login
+        self.hostcache = None       # hostcache.HostnameCache, skips the hostname probe when warm
+        self.metrics = None         # Timing sink (see metrics.py), gets one event per phase
+        self.durations = None       # durations.DurationStats, timeouts learned per device/command
+        self.enable = False         # Login settings, extra shells (send_commands_parallel) replay them
+        self.enable_password = ""
         return None
     def print_help(self):
         return None
+    def record(self, phase, started, **extra):
+        """Hand the time since ``started`` (``time.monotonic()``) for ``phase`` to the metrics sink, if any
+        Command and connect times also go to the duration stats (``-D``) the timeouts are learned from.
+        """
+        seconds = time.monotonic() - started
+        if self.durations is not None:
+            if phase == "command":
+                self.durations.add(self.device, extra["command"], seconds, extra.get("bailed", False))
+            elif phase in ("tcp_connect", "bastion_channel"):
+                self.durations.add(self.device, CONNECT, seconds)
+        if self.metrics is None:
+            return
+        event = {"device": self.device, "hostname": self.hostname, "phase": phase, "seconds": seconds}
+        event.update(extra)
+        self.metrics.record(event)
+    def command_timeout(self, command, bail_timeout):
+        """Seconds ``command`` may take on this device: learned from past runs (``-D``), else ``bail_timeout``"""
+        if self.durations is None:
+            return bail_timeout
+        return self.durations.timeout(self.device, command, bail_timeout)
+
     def send_command(self, command="show ver", hostname="Switch", bail_timeout=60):
         """Sending commands to a switch, router, device, whatever!
             Args:
@@ -57,38 +111,409 @@ class claseCrassh(object):
             str.  A text blob from the device, including line breaks.
             REF: http://blog.timmattison.com/archives/2014/06/25/automating-cisco-switch-interactions/
         """
-        # global remote_conn, remote_conn_pre
-        # Start with empty var & loop
-        output = ""
-        keeplooping = True
+        return "".join(self.send_command_iter(command, hostname, bail_timeout))
+
+    def send_command_iter(self, command="show ver", hostname="Switch", bail_timeout=60, chan=None):
+        """Streaming version of ``send_command``
+        Yields the output as decoded chunks while they arrive, so a huge ``show tech`` never has to sit
+        in memory. Only the current (unfinished) line is kept for prompt detection.
+            Args:
+            command (str):  The Command you wish to run on the device.
+            hostname (str): The hostname of the device (*expected in the* ``prompt``).
+            bail_timeout (int): How long to wait for ``command`` to finish before giving up.
+            chan (paramiko.Channel): Shell to use, defaults to ``remote_conn``
+            Yields:
+            str.  Chunks of the device output, the last one ends with the prompt.
+        """
+        if chan is None:
+            chan = self.remote_conn
+        # Start with an empty line buffer
+        decoder = codecs.getincrementaldecoder('utf-8')('replace') # multibyte chars can be split across chunks
+        tail = ""                   # Text after the last line break, the prompt can only be in here
+        bailed = False
         # Regex for either config or enable
         regex = '^' + self.hostname[:20] + '(.*)(\ )?#'
         theprompt = re.compile(regex)
         # Time when the command started, prepare for timeout.
-        now = int(time.time())
-        timeout = now + bail_timeout
+        timeout = self.command_timeout(command, bail_timeout)
+        started = time.monotonic()
+        deadline = started + timeout
+        received = 0
+        iterations = 0
         # Send the command
-        self.remote_conn.send(command + "\n")
+        chan.send(command + "\n")
         # loop the output
-        while keeplooping:
+        while True:
+            iterations += 1
             # Setup bail timer
-            now = int(time.time())
-            if now == timeout:
-                print("\n Command %s took %s secs to run, bailing!" % (command, str(bail_timeout)))
-                output += "crassh bailed on command: " + command
-                keeplooping = False
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print("\n Command %s took %g secs to run, bailing!" % (command, timeout))
+                bailed = True
+                break
+            # Block until data arrives or the deadline passes, no polling
+            chan.settimeout(remaining)
+            try:
+                data = chan.recv(self.recv_size)
+            except socket.timeout:
+                continue
+            if not data:
+                # Channel closed by the device
                 break
-            # update receive buffer whilst waiting for the prompt to come back
-            if self.remote_conn.recv_ready():
-                output += self.remote_conn.recv(2048).decode('utf-8')
-                # Search the output for our prompt
-                theoutput = output.splitlines()
-                for lines in theoutput:
-                    myregmatch = theprompt.search(lines)
-                if myregmatch:
-                    keeplooping = False
-            # print(output)
-        return output
+            received += len(data)
+            text = decoder.decode(data)
+            if not text:
+                continue
+            yield text
+            # Search only the newly arrived tail for our prompt
+            lines = (tail + text).splitlines()
+            tail = "" if text[-1] in "\r\n" else lines[-1]
+            if theprompt.search(lines[-1]):
+                break
+        text = decoder.decode(b"", True)
+        if text:
+            yield text
+        self.record("command", started, command=command, bytes=received, iterations=iterations, bailed=bailed)
+        if bailed:
+            yield "crassh bailed on command: " + command
+            # The command is still running: skip the rest of its output (up to -t more seconds),
+            # or it would be taken for the next command's
+            drained, tail = self.drain(chan, theprompt, tail, time.monotonic() + bail_timeout)
+            if not drained:
+                # Sitting at somebody else's prompt? the hostname changed, refresh it for the next commands
+                if chan is self.remote_conn and tail and self.prompt_privileged.search(tail) and self.refresh_hostname():
+                    return
+                # Still busy (or gone): anything sent now would be read as this command's output
+                raise ShellLost("no prompt %g secs after bailing on %s" % (bail_timeout, command))
+
+    def drain(self, chan, prompt, tail="", deadline=None, prompts=1):
+        """Read and throw away what bailed commands still print, up to their prompts
+        Keeps the shell in step after a bail, without holding the skipped output in memory.
+            Args:
+            chan (paramiko.Channel): Shell to read
+            prompt (re): Regex of the prompt line that ends a command
+            tail (str): Unfinished last line already read
+            deadline (float): ``time.monotonic()`` value to give up at
+            prompts (int): How many prompts are still owed
+            Returns:
+            tuple.  ``True`` once every prompt arrived (``False`` at the deadline or EOF), and the unfinished last line
+        """
+        if deadline is None:
+            deadline = time.monotonic() + 30
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False, tail
+            chan.settimeout(remaining)
+            try:
+                data = chan.recv(self.recv_size)
+            except socket.timeout:
+                continue
+            if not data:
+                return False, tail
+            text = decoder.decode(data)
+            if not text:
+                continue
+            lines = (tail + text).splitlines()
+            tail = "" if text[-1] in "\r\n" else lines[-1]
+            # Complete lines are counted once; the last prompt usually has no line break after it
+            for line in (lines if not tail else lines[:-1]):
+                if prompt.search(line):
+                    prompts -= 1
+            if prompts <= 0 or (prompts == 1 and tail and prompt.search(tail)):
+                return True, tail
+
+    def send_commands_iter(self, commands, hostname="Switch", bail_timeout=60):
+        """Run commands one after the other, waiting for the prompt each time
+        Same output format as ``send_commands_pipelined``.
+            Yields:
+            tuple.  ``(index, chunk)`` with output chunks of ``commands[index]``, in order;
+            ``(index, None)`` once that command is complete.
+            Raises:
+            ShellLost.  After the command that left the shell busy, the rest are not sent
+        """
+        for index, command in enumerate(commands):
+            try:
+                for chunk in self.send_command_iter(command, hostname, bail_timeout):
+                    yield index, chunk
+            except ShellLost:
+                yield index, None
+                raise
+            yield index, None
+
+    def exec_command_iter(self, command="show ver", bail_timeout=60):
+        """Run ``command`` on an ``exec`` channel of its own (no shell, no prompt)
+        The output ends when the device closes the channel. IOS runs exec commands at the login
+        privilege level, ``enable`` doesn't apply.
+            Yields:
+            str.  Chunks of the device output.
+        """
+        bail_timeout = self.command_timeout(command, bail_timeout)
+        started = time.monotonic()
+        deadline = started + bail_timeout
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        received = 0
+        bailed = False
+        chan = self.remote_conn_pre.get_transport().open_session(timeout=bail_timeout)
+        try:
+            chan.exec_command(command)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print("\n Command %s took %g secs to run, bailing!" % (command, bail_timeout))
+                    bailed = True
+                    break
+                chan.settimeout(remaining)
+                try:
+                    data = chan.recv(self.recv_size)
+                except socket.timeout:
+                    continue
+                if not data:
+                    break
+                received += len(data)
+                text = decoder.decode(data)
+                if text:
+                    yield text
+        finally:
+            chan.close()
+        text = decoder.decode(b"", True)
+        if text:
+            yield text
+        self.record("command", started, command=command, bytes=received, bailed=bailed, exec=True)
+        if bailed:
+            yield "crassh bailed on command: " + command
+
+    def read_only(self, command):
+        """Is ``command`` safe to run next to others (``show``, ``more``, ``dir``)?"""
+        return self.read_only_command.match(command) is not None
+
+    def open_shell(self, deadline):
+        """One more interactive shell on the session's transport, walked to the privileged prompt
+        Returns:
+        paramiko.Channel.  The shell, or ``None`` if the device refused it
+        """
+        import paramiko
+        try:
+            chan = self.remote_conn_pre.get_transport().open_session(timeout=max(deadline - time.monotonic(), 1))
+            chan.get_pty()
+            chan.invoke_shell()
+        except (paramiko.SSHException, socket.error) as e:
+            print("%s: no extra channel (%s)" % (self.hostname, e))
+            return None
+        if not self.handshake(self.enable, self.enable_password, deadline, chan):
+            chan.close()
+            return None
+        return chan
+
+    def send_commands_parallel(self, commands, hostname="Switch", bail_timeout=60, channels=4, mode="shell"):
+        """Run independent read-only commands at the same time over several channels of the one transport
+        With ``mode="shell"`` every worker gets its own shell (the session's shell is one of them), with
+        ``mode="exec"`` every command gets its own ``exec`` channel, at most ``channels`` at once.
+        Output comes back in command order: the command at the head streams as it arrives, the ones
+        finished ahead of it are held until it is their turn. If any command is not read-only, or the
+        device refuses extra channels, the commands run one by one on the session's shell.
+            Args:
+            commands (list): The Commands you wish to run on the device, in order.
+            hostname (str): The hostname of the device (*expected in the* ``prompt``).
+            bail_timeout (int): How long to wait for each command.
+            channels (int): Most channels open on the device at once.
+            mode (str): ``"shell"`` or ``"exec"``.
+            Yields:
+            tuple.  ``(index, chunk)`` with output chunks of ``commands[index]``, in order;
+            ``(index, None)`` once that command is complete.
+        """
+        if not all(self.read_only(command) for command in commands):
+            print("%s: not every command is read-only, running them one by one" % hostname)
+            for item in self.send_commands_iter(commands, hostname, bail_timeout):
+                yield item
+            return
+        outputs = [[] for command in commands]  # Chunks of each command, None once it is complete
+        state = {"next": 0, "workers": 0}
+        cond = threading.Condition()
+
+        def worker(number):
+            chan = self.remote_conn
+            try:
+                if mode == "shell" and number > 0:
+                    chan = self.open_shell(time.monotonic() + bail_timeout)
+                    if chan is None:
+                        return
+                while True:
+                    with cond:
+                        index = state["next"]
+                        if index >= len(commands):
+                            return
+                        state["next"] += 1
+                    lost = False
+                    try:
+                        if mode == "exec":
+                            source = self.exec_command_iter(commands[index], bail_timeout)
+                        else:
+                            source = self.send_command_iter(commands[index], hostname, bail_timeout, chan)
+                        for chunk in source:
+                            with cond:
+                                outputs[index].append(chunk)
+                                cond.notify_all()
+                    except Exception as e:
+                        # A shell stuck in a bailed command is done, the other workers take the rest
+                        lost = isinstance(e, ShellLost)
+                        with cond:
+                            outputs[index].append("crassh channel failed on command: %s (%s)" % (commands[index], e))
+                    with cond:
+                        outputs[index].append(None)
+                        cond.notify_all()
+                    if lost:
+                        return
+            finally:
+                if chan is not None and chan is not self.remote_conn:
+                    chan.close()
+                with cond:
+                    state["workers"] -= 1
+                    cond.notify_all()
+
+        state["workers"] = max(1, channels)
+        for number in range(state["workers"]):
+            thread = threading.Thread(target=worker, args=(number,), name="%s-channel-%d" % (hostname, number), daemon=True)
+            thread.start()
+
+        for index in range(len(commands)):
+            seen = 0
+            done = False
+            while not done:
+                with cond:
+                    while seen == len(outputs[index]) and state["workers"] > 0:
+                        cond.wait()
+                    chunks = outputs[index][seen:]
+                    seen = len(outputs[index])
+                    # Every worker is gone and this one was never (or only partly) run
+                    if not chunks and state["workers"] == 0:
+                        chunks = ["crassh could not run command: " + commands[index], None]
+                for chunk in chunks:
+                    yield index, chunk
+                    if chunk is None:
+                        done = True
+
+        # Extra shells are closed by their workers, let them finish before the session goes away
+        with cond:
+            while state["workers"] > 0:
+                cond.wait()
+
+    def send_commands_pipelined(self, commands, hostname="Switch", bail_timeout=60, window=8):
+        """Send several commands without waiting for each prompt, and split the replies
+        Up to ``window`` commands are written ahead of the one the device is working on, the single
+        stream coming back is cut at every prompt (``hostname#``) into per-command outputs. Each
+        command's output is exactly what ``send_command`` would have returned for it.
+            Args:
+            commands (list): The Commands you wish to run on the device, in order.
+            hostname (str): The hostname of the device (*expected in the* ``prompt``).
+            bail_timeout (int): How long to wait for each command (once it is at the head of the queue).
+            window (int): How many commands may be in flight at once.
+            Yields:
+            tuple.  ``(index, chunk)`` with output chunks of ``commands[index]``, in order;
+            ``(index, None)`` once that command is complete.
+            Raises:
+            ShellLost.  A bailed command's prompt never came, the commands after it are not run
+        """
+        pipeline_started = time.monotonic()
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        # A prompt at the start of a line (truncated hostname, config mode...) ends a command
+        boundary = re.compile('^' + re.escape(self.hostname[:20]) + r'[^\s#]*#', re.M)
+        tail = ""                   # Text after the last line break, not yet handed out
+        at_line_start = True        # Does ``tail`` start at the beginning of a line?
+        head = 0                    # Command whose output we are reading
+        sent = 0
+        deadline = None
+        started = None
+        timeout = bail_timeout
+        late = 0                    # Prompts still owed by bailed commands, their output is skipped
+        received = 0
+        iterations = 0
+
+        while head < len(commands):
+            # Keep the window full
+            while sent < len(commands) and sent - head < window:
+                self.remote_conn.send(commands[sent] + "\n")
+                sent += 1
+            iterations += 1
+            if deadline is None:
+                timeout = self.command_timeout(commands[head], bail_timeout)
+                if started is None:
+                    started = time.monotonic()
+                deadline = started + timeout
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 and late:
+                # Waiting on a bailed command, not on the head: the shell is stuck, not the head slow
+                raise ShellLost("no prompt %g secs after bailing on %s" % (bail_timeout, commands[head - 1]))
+            if remaining <= 0:
+                print("\n Command %s took %g secs to run, bailing!" % (commands[head], timeout))
+                if tail:
+                    yield head, tail
+                    tail = ""
+                yield head, "crassh bailed on command: " + commands[head]
+                self.record("command", started, command=commands[head], bailed=True, pipelined=True)
+                yield head, None
+                head += 1
+                late += 1
+                # The next command only starts at the bailed one's prompt, wait for that up to -t
+                started = time.monotonic()
+                timeout = bail_timeout
+                deadline = started + timeout
+                continue
+            self.remote_conn.settimeout(remaining)
+            try:
+                data = self.remote_conn.recv(self.recv_size)
+            except socket.timeout:
+                continue
+            if not data:
+                # Channel closed by the device
+                break
+            received += len(data)
+            buf = tail + decoder.decode(data)
+            # Cut at every prompt, the first line only counts if it starts a line
+            pos = 0
+            start = 0
+            if not at_line_start:
+                start = buf.find("\n") + 1 or len(buf)
+            while head < len(commands):
+                match = boundary.search(buf, start)
+                if match is None:
+                    break
+                if late:
+                    # End of a bailed command's output, the next prompt is the head's
+                    late -= 1
+                    started = time.monotonic()
+                    deadline = started + bail_timeout if late else None
+                    pos = match.end()
+                    at_line_start = False
+                    start = buf.find("\n", pos) + 1 or len(buf)
+                    continue
+                yield head, buf[pos:match.end()]
+                self.record("command", started, command=commands[head], bailed=False, pipelined=True)
+                yield head, None
+                head += 1
+                # The next command starts when this prompt arrives, maybe in the same buffer
+                started = time.monotonic()
+                deadline = None
+                pos = start = match.end()
+                at_line_start = False
+                start = buf.find("\n", pos) + 1 or len(buf)
+            # Hand out whole lines, keep the unfinished one (it may be a prompt still arriving)
+            cut = buf.rfind("\n", pos) + 1
+            if cut > pos:
+                if head < len(commands) and not late:
+                    yield head, buf[pos:cut]
+                pos = cut
+                at_line_start = True
+            tail = buf[pos:]
+
+        if head < len(commands) and tail and not late:
+            yield head, tail
+        if late:
+            # Bailed at the end: leave the shell at the prompt for whoever uses it next
+            self.drain(self.remote_conn, boundary, tail, time.monotonic() + bail_timeout, late)
+        # Bytes and loop passes can't be told apart per command here, they go on one event
+        self.record("pipeline", pipeline_started, commands=len(commands), bytes=received, iterations=iterations)
 
     def do_no_harm(self, command):
         """Check Commands for dangerous things
@@ -242,11 +667,11 @@ class claseCrassh(object):
                         password = thisline[1].strip()
                         return username, password
 
-    def connect(self, device="127.0.0.1", username="cisco", password="cisco", enable=False, enable_password="cisco", sysexit=False, timeout=10):
+    def connect(self, device="127.0.0.1", username="cisco", password="cisco", enable=False, enable_password="cisco", sysexit=False, timeout=10, login_timeout=30, port=22, profile=None, jump=None):
         """Connect and get Hostname of Cisco Device
 
         This function wraps up ``paramiko`` and returns the hostname of the **Cisco** device.
-        The function creates two global variables ``remote_conn_pre`` and ``remote_conn`` which
+        The function sets two instance variables ``remote_conn_pre`` and ``remote_conn`` which
         are the paramiko objects for direct manipulation if necessary.
 
         Args:
@@ -256,6 +681,14 @@ class claseCrassh(object):
         enable (bool): Is enable going to be needed?
         enable_password (str): The enable password
         sysexit (bool): Should the connecton exit the script on failure?
+        timeout (int): TCP connect timeout
+        login_timeout (int): How long the whole enable / terminal length / hostname exchange may take
+        port (int): SSH port
+        profile (str): Transport profile name (see ``profiles.PROFILES``) or dict, ``None`` for paramiko defaults
+        jump (bastion.JumpHosts): Reach the device through a channel of a shared jump host transport
+
+        With a ``hostcache`` set, the hostname comes from the cache when the login prompt
+        matches the cached one, and ``show run | inc hostname`` is only run on a miss.
 
         Returns:
         str.  The hostname of the device
@@ -269,15 +702,40 @@ class claseCrassh(object):
             * https://pynet.twb-tech.com/blog/python/paramiko-ssh-part1.html
             * http://yenonn.blogspot.co.uk/2013/10/python-in-action-paramiko-handling-ssh.html
         """
+        # Imported on the first connect, so importing this module (cron wrappers, HTTP workers) stays cheap
+        import paramiko
+        profile = profiles.get(profile)
         hostname = False
+        self.device = device
+        self.hostname = ""
+        self.enable = enable
+        self.enable_password = enable_password
         # Create paramiko object
         self.remote_conn_pre = paramiko.SSHClient()
         # Change default paramiko object settings
         self.remote_conn_pre.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         # print("Connecting to %s ... " % device)
         try:
-            self.remote_conn_pre.connect(
-                device, username=username, password=password, allow_agent=False, look_for_keys=False, timeout=timeout)
+            # TCP first, on its own, so it can be timed apart from key exchange + auth
+            started = time.monotonic()
+            if jump is not None:
+                # A direct-tcpip channel over the shared jump host transport takes the place of TCP
+                bastion, sock = jump.open(device, port, timeout)
+                self.record("bastion_channel", started, bastion=bastion.host)
+            else:
+                sock = socket.create_connection((device, port), timeout)
+                self.record("tcp_connect", started)
+            started = time.monotonic()
+            try:
+                self.remote_conn_pre.connect(
+                    device, port=port, username=username, password=password, allow_agent=False, look_for_keys=False, timeout=timeout, sock=sock,
+                    compress=profile.get("compress", False), transport_factory=profiles.transport_factory(profile))
+            except BaseException:
+                # Don't leave the socket (or the jump host channel slot) behind a failed login
+                self.remote_conn_pre.close()
+                sock.close()
+                raise
+            self.record("auth", started)
         except paramiko.AuthenticationException as e:
             print("Authentication Error: %s" % e)
             if sysexit:
@@ -300,54 +758,36 @@ class claseCrassh(object):
             return False
 
         # Connected! (invoke_shell)
+        started = time.monotonic()
         self.remote_conn = self.remote_conn_pre.invoke_shell()
+        self.record("invoke_shell", started)
 
-        # Flush buffer.
-        output = self.remote_conn.recv(1000).decode('utf-8')
-        del output
-        output = ""
+        # One deadline for the whole login dance, a stuck prompt can't hang the run
+        deadline = time.monotonic() + login_timeout
 
-        # If we have enable password, send it.
-        if enable:
-            self.remote_conn.send("enable\n")
-            time.sleep(0.5)
-            self.remote_conn.send(enable_password + "\n")
+        # Get to the privileged prompt and disable <-- More --> on Output
+        if not self.handshake(enable, enable_password, deadline):
+            self.remote_conn_pre.close()
+            if sysexit:
+                sys.exit()
+            return False
 
-        # Disable <-- More --> on Output
-        self.remote_conn.sendall("terminal length 0\n")
-        time.sleep(0.5)
-
-        while "#" not in output:
-            # update receive buffer
-            if self.remote_conn.recv_ready():
-                output += self.remote_conn.recv(1024).decode('utf-8')
-        # Clear the Var.
-        del output
-        output = ""
+        # Ok, let's find the device hostname, the cache spares us the config walk if the prompt didn't change
+        started = time.monotonic()
+        cached = self.hostcache.get(device) if self.hostcache else None
+        if cached and cached["prompt"] == self.prompt:
+            hostname = cached["hostname"]
+        else:
+            hostname, output = self.probe_hostname(deadline)
+            if hostname is not False and self.hostcache:
+                self.hostcache.put(device, hostname, self.prompt)
+        self.record("hostname", started, cached=bool(cached and cached["prompt"] == self.prompt))
 
-        # Ok, let's find the device hostname
-        self.remote_conn.sendall("show run | inc hostname \n")
-        time.sleep(0.5)
-
-        keeplooping = True
-        while keeplooping:
-            if self.remote_conn.recv_ready():
-                output += self.remote_conn.recv(1024).decode('utf-8')
-                for subline in output.splitlines():
-                    if re.match("^hostname", subline):
-                        #print("Match %s" % subline)
-                        thisrow = subline.split()
-                        try:
-                            gotdata = thisrow[1]
-                            if thisrow[0] == "hostname":
-                                hostname = thisrow[1]
-                                #prompt = hostname + "#"
-                        except IndexError:
-                            gotdata = 'null'
-                        keeplooping = False
         # Catch looping failures.
         if hostname is False:
             print("Hostname Lookup Failed: \n %s \n" % output)
+            # Logged in, but useless without a hostname: don't leave the transport open
+            self.remote_conn_pre.close()
             if sysexit:
                 sys.exit()
         else:
@@ -355,6 +795,168 @@ class claseCrassh(object):
         # Found it! Return it!
         return hostname
 
+    def probe_hostname(self, deadline):
+        """Ask the device for its hostname with ``show run | inc hostname``
+
+        Args:
+        deadline (float): ``time.monotonic()`` value to give up at
+
+        Returns:
+        tuple.  The hostname (``False`` if not found) and the raw output
+        """
+        hostname = False
+        self.remote_conn.sendall("show run | inc hostname \n")
+        index, output = self.expect([self.prompt_privileged], deadline)
+
+        for subline in output.splitlines():
+            if re.match("^hostname", subline):
+                #print("Match %s" % subline)
+                thisrow = subline.split()
+                try:
+                    gotdata = thisrow[1]
+                    if thisrow[0] == "hostname":
+                        hostname = thisrow[1]
+                        #prompt = hostname + "#"
+                except IndexError:
+                    gotdata = 'null'
+        return hostname, output
+
+    def refresh_hostname(self, timeout=30):
+        """Probe the hostname again after the prompt stopped matching, and update the cache
+        Returns:
+        str.  The new hostname, or ``False``
+        """
+        if self.hostcache:
+            self.hostcache.invalidate(self.device)
+        hostname, output = self.probe_hostname(time.monotonic() + timeout)
+        if hostname is not False:
+            print("Hostname of %s changed: %s -> %s" % (self.device, self.hostname, hostname))
+            self.hostname = hostname
+            if self.hostcache:
+                self.hostcache.put(self.device, hostname, output.splitlines()[-1].strip())
+        return hostname
+
+    def handshake(self, enable=False, enable_password="cisco", deadline=None, chan=None):
+        """Walk a fresh shell to the privileged prompt
+        Reacts to whatever prompt the device shows (user exec ``>``, ``Password:`` or privileged ``#``)
+        instead of sleeping, then sends ``terminal length 0``.
+
+        Args:
+        enable (bool): Is enable going to be needed?
+        enable_password (str): The enable password
+        deadline (float): ``time.monotonic()`` value to give up at
+        chan (paramiko.Channel): Shell to use, defaults to ``remote_conn``
+
+        Returns:
+        bool.  True once the shell sits at the privileged prompt
+        """
+        if chan is None:
+            chan = self.remote_conn
+        if deadline is None:
+            deadline = time.monotonic() + 30
+        prompts = [self.prompt_privileged, self.prompt_user, self.prompt_password]
+        started = time.monotonic()
+        enable_sent = False
+        password_sent = False
+        output = ""
+
+        while True:
+            index, text = self.expect(prompts, deadline, chan)
+            output += text
+            if index == 0:
+                # Privileged, we are in!
+                break
+            if index == 1 and enable and not enable_sent:
+                chan.sendall("enable\n")
+                enable_sent = True
+                continue
+            if index == 2 and enable_sent and not password_sent:
+                chan.sendall(enable_password + "\n")
+                password_sent = True
+                continue
+            # Timed out, or the device keeps asking for something we can't give it
+            lastline = output.splitlines()[-1] if output.strip() else ""
+            if index is None:
+                print("Login Failed: no privileged prompt before the deadline, last seen \"%s\"" % lastline)
+            elif index == 1 and not enable:
+                print("Login Failed: device is at user exec prompt \"%s\", enable (-e) is needed" % lastline)
+            else:
+                print("Login Failed: enable was not accepted, last seen \"%s\"" % lastline)
+            return False
+        self.record("enable", started)
+
+        # Disable <-- More --> on Output
+        started = time.monotonic()
+        chan.sendall("terminal length 0\n")
+        index, text = self.expect([self.prompt_privileged], deadline, chan)
+        if index is None:
+            print("Login Failed: no prompt after \"terminal length 0\"")
+            return False
+        self.record("terminal_length", started)
+        if chan is self.remote_conn:
+            self.prompt = text.splitlines()[-1].strip()
+        return True
+
+    def expect(self, patterns, deadline, chan=None):
+        """Read from a shell until its last line matches one of ``patterns``
+        Blocks on the channel (no polling) until a match, the channel closing or ``deadline``.
+
+        Args:
+        patterns (list): Compiled regexes, tried in order against the last line received
+        deadline (float): ``time.monotonic()`` value to give up at
+        chan (paramiko.Channel): Shell to read, defaults to ``remote_conn``
+
+        Returns:
+        tuple.  Index of the matching pattern (``None`` if nothing matched) and the text read
+        """
+        if chan is None:
+            chan = self.remote_conn
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        chunks = []
+        tail = ""
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            chan.settimeout(remaining)
+            try:
+                data = chan.recv(self.recv_size)
+            except socket.timeout:
+                continue
+            if not data:
+                break
+            text = decoder.decode(data)
+            if not text:
+                continue
+            chunks.append(text)
+            lines = (tail + text).splitlines()
+            tail = "" if text[-1] in "\r\n" else lines[-1]
+            for index, pattern in enumerate(patterns):
+                if pattern.search(lines[-1]):
+                    return index, "".join(chunks)
+        return None, "".join(chunks)
+
+    def is_alive(self, timeout=3):
+        """Check an open session is still usable
+        The transport has to be up and the shell has to answer an empty line with the privileged prompt.
+        Anything left in the receive buffer is drained on the way.
+
+        Args:
+        timeout (int): How long to wait for the prompt
+
+        Returns:
+        bool.  True/False
+        """
+        try:
+            transport = self.remote_conn_pre.get_transport()
+            if transport is None or not transport.is_active() or self.remote_conn.closed:
+                return False
+            self.remote_conn.sendall("\n")
+            index, output = self.expect([self.prompt_privileged], time.monotonic() + timeout)
+        except Exception:
+            return False
+        return index == 0
+
     def disconnect(self):
         """Disconnect an SSH Session
         Crassh wrapper for paramiko disconnect
@@ -362,6 +964,182 @@ class claseCrassh(object):
         """
         self.remote_conn_pre.close()
 
+    def run_switch(self, switch, job):
+        """Run the whole command list against a single switch
+        Connects (falling back to the backup credentials if asked to), runs every command,
+        writes/prints the output and disconnects. Safe to call from a worker thread as long
+        as every worker uses its own ``claseCrassh`` instance.
+
+        Args:
+        switch (str): IP Address or Fully Qualifed Domain Name of Device
+        job (dict): Run settings built by ``main()``
+
+        Returns:
+        str.  The output filename (``-w``), otherwise ``False``
+        """
+        commands = job["commands"]
+        filename = False
+        # "device profile" lines in the -s file pick a transport profile for that device
+        fields = switch.split()
+        if not fields:
+            # A blank line, there is nothing to connect to
+            return False
+        switch = fields[0]
+        profile = fields[1] if len(fields) > 1 else job["profile"]
+        self.hostcache = job["hostcache"]
+        self.metrics = job["metrics"]
+        self.durations = job["durations"]
+        connect_timeout = job["connect_timeout"]
+        if self.durations is not None:
+            connect_timeout = self.durations.timeout(switch, CONNECT, connect_timeout)
+
+        progress = job["progress"]
+        progress.device_started(switch)
+        device_started = time.monotonic()
+        f = None                    # Output file (-w)
+        done = 0                    # Commands complete
+        try:
+            # don't bail on authentication failure if there are backup credz to try
+            sysexit = job["sysexit"]
+            if job["backup_credz"]:
+                sysexit = False
+
+            login_started = time.monotonic()
+            hostname = self.connect(switch, job["username"], job["password"], job["enable"], job["enable_password"], sysexit, connect_timeout, profile=profile, jump=job["jump"])
+
+            if isinstance(hostname, bool): # Connection failed, function returned False
+                if not job["backup_credz"]:
+                    progress.device_failed(switch, "connect", len(commands))
+                    return False
+                # fail or not (-Q) works as expected on backup credz
+                print("Trying backup credentials")
+                login_started = time.monotonic()
+                if job["backup_enable"]:
+                    hostname = self.connect(switch, job["backup_username"], job["backup_password"], job["enable"], job["backup_enable_password"], job["sysexit"], connect_timeout, profile=profile, jump=job["jump"])
+                else:
+                    hostname = self.connect(switch, job["backup_username"], job["backup_password"], False, "", job["sysexit"], connect_timeout, profile=profile, jump=job["jump"])
+
+                if isinstance(hostname, bool): # Connection failed, function returned False
+                    progress.device_failed(switch, "connect (backup credentials)", len(commands))
+                    return False
+
+            if self.durations is not None:
+                self.durations.add(switch, LOGIN, time.monotonic() - login_started)
+            progress.connected(switch, hostname, time.monotonic() - login_started)
+
+            # Write the output to a file (optional) - prepare file + filename before CMD loop
+            if job["writeo"]:
+                filetime = datetime.datetime.now().strftime("%y%m%d-%H%M%S")
+                filename = hostname + "-" + filetime + ".txt"
+                # Created exclusively: two devices sharing a hostname (or one listed twice) in the same
+                # second don't share a file, the later one gets the address and then a -N suffix
+                base = hostname + "-" + re.sub(r'[^\w.-]', '_', switch) + "-" + filetime
+                suffix = 1
+                while True:
+                    try:
+                        f = open(filename, 'x')
+                        break
+                    except FileExistsError:
+                        suffix += 1
+                        filename = base + (".txt" if suffix == 2 else "-%d.txt" % (suffix - 1))
+
+            # Command Loop
+            if job["channels"] > 1 and not job["delay_command"]:
+                # Several channels on the one transport (-C), read-only commands side by side
+                results = self.send_commands_parallel(commands, hostname, job["bail_timeout"], job["channels"], job["channel_mode"])
+            elif job["window"] > 1 and not job["delay_command"]:
+                # Pipelined (-W), several commands in flight
+                results = self.send_commands_pipelined(commands, hostname, job["bail_timeout"], job["window"])
+            else:
+                results = self.send_commands_iter(commands, hostname, job["bail_timeout"])
+
+            if commands:
+                print("%s: Running: %s" % (hostname, commands[0]))
+
+            # Stream the output to the file / screen as it arrives
+            write_time = 0.0
+            parts = []
+            member = None           # Archive (-Z) member of the command being read
+            size = 0
+            bailed = False
+            for index, chunk in results:
+                if chunk is not None:
+                    size += len(chunk.encode("utf-8"))
+                    bailed = bailed or chunk.startswith("crassh bailed on command: ")
+                    started = time.monotonic()
+                    # Print the output (optional)
+                    if job["printo"]:
+                        sys.stdout.write(chunk)
+                    if job["writeo"]:
+                        f.write(chunk)
+                    if job["archive"]:
+                        # The writer thread compresses it as it comes, the session moves on
+                        if member is None:
+                            member = job["archive"].begin(switch, hostname, commands[index])
+                        job["archive"].write(member, chunk)
+                    if job["store"]:
+                        parts.append(chunk)
+                    write_time += time.monotonic() - started
+                    continue
+
+                # commands[index] is done
+                if job["printo"]:
+                    sys.stdout.write("\n")
+                if job["archive"]:
+                    if member is None:
+                        member = job["archive"].begin(switch, hostname, commands[index])
+                    job["archive"].end(member)
+                    member = None
+                if job["store"]:
+                    job["store"].put(switch, hostname, commands[index], "".join(parts))
+                    parts = []
+                self.record("write", time.monotonic() - write_time, command=commands[index])
+                write_time = 0.0
+
+                # delay next command (optional)
+                if job["delay_command"]:
+                    time.sleep(job["delay_command_time"])
+
+                # Progress (and the -O event stream)
+                progress.command_done(switch, hostname, commands[index], size, bailed)
+                done += 1
+                size = 0
+                bailed = False
+
+                if index + 1 < len(commands):
+                    print("%s: Running: %s" % (hostname, commands[index + 1]))
+
+            # /end Command Loop
+
+            if job["writeo"]:
+                # Close the File
+                f.close()
+
+            # Disconnect from SSH
+            self.disconnect()
+        except Exception as e:
+            # Stuck after a bail (ShellLost) or anything unexpected: this device is given up,
+            # its session and output file are closed and the run goes on with the others
+            print("%s: %s, %d commands not run" % (switch, e, len(commands) - done))
+            if f is not None:
+                f.close()
+            if self.remote_conn_pre:
+                self.disconnect()
+            progress.device_failed(switch, str(e), len(commands) - done)
+            return filename
+
+        progress.device_done(switch, hostname, time.monotonic() - device_started)
+
+        if job["writeo"]:
+            print("Switch %s done, output: %s" % (switch, filename))
+        else:
+            print("Switch %s done" % switch)
+
+        # Sleep between SSH connections
+        time.sleep(1)
+
+        return filename
+
     def main(self):
         """Main Code Block
         This is the main script that Network Administrators will run.
@@ -382,19 +1160,37 @@ class claseCrassh(object):
         enable = False
         delay_command = False
         writeo = True
+        write_asked = False # -w given, .txt files are kept next to -Z/-S
         printo = False
         bail_timeout = 60
         connect_timeout = 10
         sysexit = True
         backup_credz = False
         backup_enable = False
+        workers = 1
+        hostcache = None
+        window = 1
+        metrics = None
+        archive = None
+        store = None
+        profile = None
+        jump = None
+        jump_channels = None
+        channels = 1
+        channel_mode = "shell"
+        sweep = None
+        unreachable = []
+        inventory = None
+        inventory_filter = ""
+        durations = None
+        stream = None
 
         # Default Authentication File Path
         crasshrc = os.path.expanduser("~") + "/.crasshrc"
 
         # Get script options - http://www.cyberciti.biz/faq/python-command-line-arguments-argv-example/
         try:
-            myopts, args = getopt.getopt(sys.argv[1:], "c:s:t:T:d:A:U:P:B:b:E:hpwXeQ")
+            myopts, args = getopt.getopt(sys.argv[1:], "c:s:t:T:d:A:U:P:B:b:E:j:H:W:M:Z:S:K:J:L:C:R:I:F:D:O:hpwXeQx")
         except getopt.GetoptError as e:
             print("\n ERROR: %s" % str(e))
             self.print_help()
@@ -424,6 +1220,7 @@ class claseCrassh(object):
 
             if o == '-w':
                 writeo = True
+                write_asked = True
 
             if o == '-X':
                 play_safe = False
@@ -459,6 +1256,83 @@ class claseCrassh(object):
                 backup_enable = True
                 backup_enable_password = str(a)
 
+            if o == '-j':
+                workers = int(a)
+
+            if o == '-H':
+                hostcache = HostnameCache(str(a))
+
+            if o == '-W':
+                window = int(a)
+
+            if o == '-M':
+                metrics = JsonlSink(str(a))
+
+            if o == '-Z':
+                # One archive for the whole run instead of a .txt per device
+                archive = str(a)
+
+            if o == '-S':
+                # Content-addressed store, unchanged outputs are not written again
+                store = OutputStore(str(a))
+
+            if o == '-K':
+                profile = str(a)
+
+            if o == '-J':
+                # [user@]host[:port], comma separated for several jump hosts
+                jump = str(a).split(",")
+
+            if o == '-L':
+                jump_channels = int(a)
+
+            if o == '-C':
+                channels = int(a)
+
+            if o == '-x':
+                # exec channels instead of extra shells (-C), where the platform supports it
+                channel_mode = "exec"
+
+            if o == '-R':
+                # skip: leave unreachable devices out, defer: try them after all the others
+                sweep = str(a)
+                if sweep not in ("skip", "defer"):
+                    print("\n ERROR: -R takes skip or defer")
+                    sys.exit()
+
+            if o == '-I':
+                inventory = str(a)
+
+            if o == '-O':
+                # JSON lines of every device/command event, a file or tcp://host:port
+                stream = str(a)
+
+            if o == '-D':
+                # Durations of past runs, timeouts (-t/-T) and estimates are learned from them
+                durations = DurationStats(str(a))
+
+            if o == '-F':
+                # e.g. "sitio=central,modelo=WS-C2960*,etiqueta=core"
+                inventory_filter = str(a)
+
+        # Devices picked from the inventory (-I/-F) instead of a -s file
+        if inventory is not None:
+            tags, selection = parsearFiltro(inventory_filter)
+            try:
+                # Opened read-only: a mistyped -I is an error, not a new empty inventory
+                db = Inventario(inventory, crear=False)
+                try:
+                    devices = db.equipos(tags, **selection)
+                finally:
+                    db.cerrar()
+            except ValueError as e:
+                print("\n ERROR: %s" % e)
+                sys.exit()
+            # Same "device [profile]" lines a -s file would give
+            switches = [" ".join(filter(None, (device["ip"], device["perfil"]))) for device in devices]
+            sfile = inventory
+            print(" Inventory: %d devices match" % len(switches))
+
         # See if we have an Authentication File
         if os.path.isfile(crasshrc) is True:
             try:
@@ -474,6 +1348,9 @@ class claseCrassh(object):
             except:
                 sys.exit()
 
+        # Blank lines (in the -s file or an empty answer) are not devices
+        switches = [line for line in switches if line.split()]
+
         # Do we have any commands?
         if cfile == "":
             try:
@@ -482,6 +1359,14 @@ class claseCrassh(object):
             except:
                 sys.exit()
 
+        # Transport profiles, the -K one and any picked per device in the -s file
+        try:
+            for name in [profile] + [line.split()[1] for line in switches if len(line.split()) > 1]:
+                profiles.get(name)
+        except ValueError as e:
+            print("\n ERROR: %s" % e)
+            sys.exit()
+
         """
             Check the commands are safe
         """
@@ -525,107 +1410,138 @@ class claseCrassh(object):
                     backup_password = getpass.getpass("Enter your backup SSH password:")
                 except:
                     sys.exit()
+        # One shared transport per jump host, opened on the first session that needs it
+        if jump:
+            jump = JumpHosts(jump, username, password, jump_channels)
+
+        """
+            Reachability sweep, every device at once before any SSH work
+        """
+        if sweep and jump:
+            print(" Reachability sweep (-R) skipped, devices are behind jump hosts (-J)")
+        elif sweep:
+            reachable = Sweeper(timeout=connect_timeout).sweep([line.split()[0] for line in switches])
+            alive = [line for line in switches if reachable[line.split()[0]]]
+            unreachable = [line for line in switches if not reachable[line.split()[0]]]
+            print(" Reachability: %d of %d devices answer on TCP/22" % (len(alive), len(switches)))
+            switches = alive + unreachable if sweep == "defer" else alive
+
         """
             Time estimations for those delaying commands
         """
-        if delay_command:
+        if delay_command and (window > 1 or channels > 1):
+            print(" Pipelining (-W) and parallel channels (-C) are off, commands are delayed (-d) one by one")
+
+        if durations:
+            # What these commands took on these devices before (guesses for anything never seen)
+            seconds = durations.estimate([line.split()[0] for line in switches], commands, workers,
+                                         delay_command_time if delay_command else 0, 1, bail_timeout / 10.0, connect_timeout / 2.0)
+            time_estimate = datetime.timedelta(0, seconds) + datetime.datetime.now()
+            print(" Start Time: %s" % datetime.datetime.now().strftime("%H:%M:%S (%y-%m-%d)"))
+            print(" Estimatated Completion Time: %s" % time_estimate.strftime("%H:%M:%S (%y-%m-%d)"))
+        elif delay_command:
             time_estimate = datetime.timedelta(0, (len(commands) * (len(switches) * 2) * delay_command_time)) + datetime.datetime.now()
             print(" Start Time: %s" % datetime.datetime.now().strftime("%H:%M:%S (%y-%m-%d)"))
             print(" Estimatated Completion Time: %s" % time_estimate.strftime("%H:%M:%S (%y-%m-%d)"))
 
+        if (archive or store) and not write_asked:
+            writeo = False
+
+        if archive:
+            try:
+                archive = ArchiveWriter(archive)
+            except (RuntimeError, IOError, OSError) as e:
+                print("\n ERROR: %s" % e)
+                sys.exit()
+
         """
-            Progress calculations - for big jobs only
+            Progress - percent/ETA lines for big jobs only, events on the -O stream for any job
         """
-        if (len(commands) * len(switches)) > 100:
-            counter = 0
+        if stream:
+            try:
+                stream = open_stream(stream)
+            except (IOError, OSError, ValueError) as e:
+                print("\n ERROR: -O %s: %s" % (stream, e))
+                sys.exit()
+        progress = Progress(len(commands) * len(switches), len(switches), stream, steps=(len(commands) * len(switches)) > 100)
+
+        # Everything a worker needs to handle one switch on its own
+        job = {
+            "commands": commands,
+            "username": username,
+            "password": password,
+            "enable": enable,
+            "enable_password": enable_password if enable else "",
+            "backup_credz": backup_credz,
+            "backup_username": backup_username if backup_credz else "",
+            "backup_password": backup_password if backup_credz else "",
+            "backup_enable": backup_enable,
+            "backup_enable_password": backup_enable_password if backup_enable else "",
+            "sysexit": sysexit,
+            "connect_timeout": connect_timeout,
+            "bail_timeout": bail_timeout,
+            "delay_command": delay_command,
+            "delay_command_time": delay_command_time if delay_command else 0,
+            "writeo": writeo,
+            "printo": printo,
+            "progress": progress,
+            "hostcache": hostcache,
+            "window": window,
+            "metrics": metrics,
+            "archive": archive,
+            "store": store,
+            "profile": profile,
+            "jump": jump,
+            "channels": channels,
+            "channel_mode": channel_mode,
+            "durations": durations,
+        }
 
         """
             Ready to loop thru switches
         """
 
-        for switch in switches:
-
-            if backup_credz:
-                tmp_sysexit = sysexit # re-assign so, don't bail on authentication failure
-                sysexit = False
-
-            if enable:
-                hostname = self.connect(switch, username, password, enable, enable_password, sysexit, connect_timeout)
+        try:
+            progress.run_started(commands)
+            if workers > 1:
+                # One claseCrassh (and so one SSH session) per device, N devices at a time
+                with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+                    futures = [pool.submit(claseCrassh().run_switch, switch, job) for switch in switches]
+                    try:
+                        for future in futures:
+                            filename = future.result()
+                            if filename:
+                                filenames.append(filename)
+                    except SystemExit:
+                        # A worker hit a fatal connection error and sysexit is on (no -Q)
+                        pool.shutdown(wait=True, cancel_futures=True)
+                        raise
             else:
-                hostname = self.connect(switch, username, password, False, "", sysexit, connect_timeout)
-
-            if isinstance(hostname, bool): # Connection failed, function returned False
-                if backup_credz:
-                    sysexit = tmp_sysexit # put it back, so fail or not (-Q) works as expected on backup credz
-                    print("Trying backup credentials")
-                    if backup_enable:
-                        hostname = self.connect(switch, backup_username, backup_password, enable, backup_enable_password, sysexit, connect_timeout)
-                    else:
-                        hostname = self.connect(switch, backup_username, backup_password, False, "", sysexit, connect_timeout)
+                for switch in switches:
+                    filename = self.run_switch(switch, job)
+                    if filename:
+                        filenames.append(filename)
+        finally:
+            # Whatever happened to the run, what was collected so far is saved and closed
+            progress.close()
 
-                    if isinstance(hostname, bool): # Connection failed, function returned False
-                        continue
-                else:
-                    continue
-
-            # Write the output to a file (optional) - prepare file + filename before CMD loop
-            if writeo:
-                filetime = datetime.datetime.now().strftime("%y%m%d-%H%M%S")
-                filename = hostname + "-" + filetime + ".txt"
-                filenames.append(filename)
-                f = open(filename, 'a')
-
-            # Command Loop
-            for cmd in commands:
-
-                # Send the Command
-                print("%s: Running: %s" % (hostname, cmd))
-                output = self.send_command(cmd, hostname, bail_timeout)
-
-                # Print the output (optional)
-                if printo:
-                    print(output)
-                if writeo:
-                    f.write(output)
-
-                # delay next command (optional)
-                if delay_command:
-                    time.sleep(delay_command_time)
-
-                # Print progress
-                try:
-                    counter
-                    # Random calculation to find 10 percent
-                    if (counter % 10) == 0:
-                        completion = ((float(counter) / (float(len(commands)) * float(len(switches)))) * 100)
-                        if int(completion) > 9:
-                            print("\n  %s%% Complete" % int(completion))
-                            if delay_command:
-                                time_left = datetime.timedelta(0, (((int(len(commands)) * int(len(switches))) + (len(switches) * 0.5)) - counter)) + datetime.datetime.now()
-                                print("  Estimatated Completion Time: %s" % time_left.strftime("%H:%M:%S (%y-%m-%d)"))
-                            print(" ")
-                    counter += 1
-                except:
-                    pass
+            if hostcache:
+                hostcache.save()
 
+            if durations:
+                durations.save()
 
-            # /end Command Loop
+            if metrics:
+                metrics.close()
 
-            if writeo:
-                # Close the File
-                f.close()
+            if archive:
+                archive.close()
 
+            if store:
+                store.close()
 
-            # Disconnect from SSH
-            self.disconnect()
-
-            if writeo:
-                print("Switch %s done, output: %s" % (switch, filename))
-            else:
-                print("Switch %s done" % switch)
-
-            # Sleep between SSH connections
-            time.sleep(1)
+            if jump:
+                jump.close()
 
         print("\n") # Random line break
 
@@ -637,7 +1553,18 @@ class claseCrassh(object):
                 print("   - %s" % ofile)
 
             print(" ---------------------------------- ")
+        if archive:
+            print("  Output archive: %s (index: %s.idx)" % (archive.path, archive.path))
+            print(" ---------------------------------- ")
+        if unreachable:
+            print("  Unreachable at start%s: " % (" (tried last)" if sweep == "defer" else " (skipped)"))
+            for line in unreachable:
+                print("   - %s" % line.split()[0])
+            print(" ---------------------------------- ")
+        if store:
+            print("  Output store: %s, run %s (%d new outputs)" % (store.root, store.run, store.new_blobs))
+            print(" ---------------------------------- ")
         print(" Script FINISHED ! ")
-        if delay_command:
+        if delay_command or durations:
             print(" Finish Time: %s" % datetime.datetime.now().strftime("%H:%M:%S (%y-%m-%d)"))
         print(" ********************************** ")
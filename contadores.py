@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# deltas y tasas por segundo de los contadores acumulados de cada puerto (CRC, colisiones,
+# errores de entrada/salida, interface resets)
+# guarda solo la muestra anterior de cada equipo/puerto, asi cada consulta se procesa sola
+# (sin releer historial). Contempla la vuelta de contador (32 o 64 bits) y el "clear counters"
+# (el contador vuelve a cero), y marca en alerta los puertos que superan un umbral de errores
+# por segundo o que cambiaron de estado / se reiniciaron entre dos consultas (enlace flapeando)
+
+import threading
+import time
+from collections import namedtuple
+
+CONTADORES = ('crc', 'colisiones', 'erroresEntrada', 'erroresSalida', 'reinicios')
+
+# tasas por segundo (None si no hay muestra anterior o falta el dato) y las marcas de la consulta
+Tasa = namedtuple('Tasa', ['equipo', 'puerto', 'segundos'] + list(CONTADORES) +
+                  ['reiniciado', 'cambioEstado', 'alerta', 'motivos'])
+
+_TOPE_32 = 2 ** 32
+_TOPE_64 = 2 ** 64
+
+
+def delta(anterior, nuevo):
+    # devuelve (incremento, reiniciado) entre dos lecturas de un contador acumulado
+    if nuevo >= anterior:
+        return nuevo - anterior, False
+    # bajo: o dio la vuelta (estaba cerca del tope) o alguien hizo "clear counters"
+    if anterior >= _TOPE_32 * 3 // 4 and anterior < _TOPE_32:
+        return nuevo + _TOPE_32 - anterior, False
+    if anterior >= _TOPE_64 * 3 // 4:
+        return nuevo + _TOPE_64 - anterior, False
+    # reinicio: lo que cuenta ahora es lo que sumo desde el clear
+    return nuevo, True
+
+
+class MotorTasas(object):
+    # errores por segundo a partir de los cuales un puerto queda en alerta
+    UMBRALES = {
+        'crc': 0.1,
+        'colisiones': 1.0,
+        'erroresEntrada': 0.5,
+        'erroresSalida': 0.5,
+        'reinicios': 0.0,       # cualquier interface reset entre dos consultas
+    }
+
+    def __init__(self, umbrales=None):
+        self.umbrales = dict(self.UMBRALES)
+        if umbrales:
+            self.umbrales.update(umbrales)
+        self._lock = threading.Lock()
+        self._anteriores = dict()   # (equipo, puerto) -> (momento, EstadoInterfaz)
+        self._alertas = dict()      # (equipo, puerto) -> ultima Tasa en alerta
+
+    def procesar(self, equipo, puerto, registro, momento=None):
+        # recibe la muestra nueva (interfaces.EstadoInterfaz) y devuelve la Tasa contra la anterior
+        momento = time.time() if momento is None else momento
+        clave = (equipo, puerto)
+        with self._lock:
+            previo = self._anteriores.get(clave)
+            self._anteriores[clave] = (momento, registro)
+        tasas = dict.fromkeys(CONTADORES)
+        segundos = None
+        reiniciado = False
+        cambioEstado = False
+        motivos = []
+        if previo is not None:
+            momentoAnterior, anterior = previo
+            segundos = momento - momentoAnterior
+            cambioEstado = (anterior.estado, anterior.protocolo) != (registro.estado, registro.protocolo)
+            if cambioEstado:
+                motivos.append("estado %s/%s -> %s/%s" % (anterior.estado, anterior.protocolo, registro.estado, registro.protocolo))
+            if segundos > 0:
+                for nombre in CONTADORES:
+                    viejo = getattr(anterior, nombre)
+                    nuevo = getattr(registro, nombre)
+                    if viejo is None or nuevo is None:
+                        continue
+                    incremento, reinicio = delta(viejo, nuevo)
+                    reiniciado = reiniciado or reinicio
+                    tasas[nombre] = incremento / segundos
+                    if tasas[nombre] > self.umbrales.get(nombre, float('inf')):
+                        motivos.append("%s %.3f/s" % (nombre, tasas[nombre]))
+        tasa = Tasa(equipo, puerto, segundos, reiniciado=reiniciado, cambioEstado=cambioEstado,
+                    alerta=bool(motivos), motivos=motivos, **tasas)
+        with self._lock:
+            if tasa.alerta:
+                self._alertas[clave] = tasa
+            else:
+                self._alertas.pop(clave, None)
+        return tasa
+
+    def alertas(self):
+        # puertos que quedaron en alerta en su ultima consulta
+        with self._lock:
+            return list(self._alertas.values())
+
+    def olvidar(self, equipo, puerto=None):
+        # descarta la muestra anterior (por ejemplo si el equipo se reemplazo)
+        with self._lock:
+            for clave in list(self._anteriores):
+                if clave[0] == equipo and (puerto is None or clave[1] == puerto):
+                    del self._anteriores[clave]
+                    self._alertas.pop(clave, None)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""Learned command and connect durations for C.R.A.SSH
+
+``DurationStats`` remembers the last few durations seen per (device,
+command) and turns them into timeouts and completion estimates:
+
+* ``timeout()`` is a high percentile of the samples times a margin, so a
+  ``show clock`` that always answers in a second fails fast when the session
+  hangs, while a ``show tech`` that takes four minutes on a big chassis still
+  gets its four minutes plus margin. Until the device has ``min_samples`` of
+  its own, what every other device took only ever raises the fixed timeout
+  (``-t``/``-T``), it never cuts it: a fleet of fast access switches says
+  nothing about the core.
+* A command that timed out only says it takes longer than its timeout, so a
+  bail is not a sample. It is kept as a lower bound instead, and the next run
+  gets at least ``margin`` times that bound, straight away. The bound goes as
+  soon as the command completes again, so a session that hung once doesn't
+  leave the command slow for the next ``keep`` runs.
+* ``expected()`` (the median) feeds ``estimate()``, the expected run time of
+  a job from what the same devices and commands took before.
+
+Connects are stored under the ``CONNECT`` pseudo-command (TCP connect or jump
+host channel, what ``-T`` bounds) and whole logins under ``LOGIN``.
+
+"""
+
+import json
+import os
+import threading
+
+CONNECT = "<connect>"
+LOGIN = "<login>"
+ANY = "*"
+
+
+def percentile(samples, fraction):
+    """``fraction`` (0-1) percentile of ``samples``, nearest rank"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class DurationStats(object):
+    """Recent durations per (device, command), stored as JSON
+
+    Args:
+    path (str): Stats file, created on the first ``save()``
+    keep (int): Samples kept per (device, command)
+    quantile (float): Percentile the timeout starts from
+    margin (float): Factor applied on top of the percentile
+    floor (float): Shortest timeout ever handed out, seconds
+    ceiling (float): Longest timeout ever handed out, seconds
+    min_samples (int): Samples needed before a device's own history is trusted
+    """
+
+    def __init__(self, path, keep=20, quantile=0.95, margin=1.5, floor=5, ceiling=3600, min_samples=3):
+        self.path = path
+        self.keep = keep
+        self.quantile = quantile
+        self.margin = margin
+        self.floor = floor
+        self.ceiling = ceiling
+        self.min_samples = min_samples
+        self.entries = {}           # device -> command -> [seconds, ...], ANY holds every device
+        self.bails = {}             # device -> command -> seconds it bailed at since the last completion
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Read the stats file, a missing or broken file is just no history"""
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.entries = data["samples"]
+            self.bails = data["bails"]
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            self.entries = {}
+            self.bails = {}
+
+    def save(self):
+        """Write the stats back to disk (atomically) if anything changed"""
+        with self.lock:
+            if not self.dirty:
+                return
+            tmp = self.path + ".tmp"
+            with open(tmp, 'w') as f:
+                json.dump({"samples": self.entries, "bails": self.bails}, f, separators=(",", ":"), sort_keys=True)
+            os.replace(tmp, self.path)
+            self.dirty = False
+
+    def add(self, device, command, seconds, bailed=False):
+        """Remember that ``command`` took ``seconds`` on ``device`` (or bailed after ``seconds``)"""
+        seconds = round(seconds, 3)
+        with self.lock:
+            bounds = self.bails.setdefault(device, {})
+            self.dirty = True
+            if bailed:
+                bounds[command] = max(bounds.get(command, 0), seconds)
+                return
+            bounds.pop(command, None)
+            if not bounds:
+                del self.bails[device]
+            for key in (device, ANY):
+                samples = self.entries.setdefault(key, {}).setdefault(command, [])
+                samples.append(seconds)
+                del samples[:-self.keep]
+
+    def samples(self, device, command):
+        """The device's own samples, or every device's when it has fewer than ``min_samples``"""
+        with self.lock:
+            samples = self.entries.get(device, {}).get(command, [])
+            if len(samples) < self.min_samples:
+                samples = self.entries.get(ANY, {}).get(command, [])
+            return list(samples)
+
+    def learned(self, samples):
+        """Timeout the ``samples`` call for: the percentile times the margin, within floor and ceiling"""
+        return min(self.ceiling, max(self.floor, percentile(samples, self.quantile) * self.margin))
+
+    def timeout(self, device, command, default):
+        """Seconds to allow ``command`` on ``device``, ``default`` without history
+
+        The device's own history once it has ``min_samples``. Before that the
+        timeout is ``default``, raised (never lowered) by the other devices'
+        history. A bail since the last completion raises it to ``margin``
+        times the time it bailed at.
+        """
+        with self.lock:
+            own = list(self.entries.get(device, {}).get(command, []))
+            pooled = list(self.entries.get(ANY, {}).get(command, []))
+            bound = self.bails.get(device, {}).get(command)
+        if len(own) >= self.min_samples:
+            limit = self.learned(own)
+        elif pooled:
+            limit = max(default, self.learned(pooled))
+        else:
+            limit = default
+        if bound is not None:
+            limit = max(limit, min(self.ceiling, bound * self.margin))
+        return limit
+
+    def expected(self, device, command, default):
+        """Typical (median) seconds ``command`` takes on ``device``, ``default`` without history"""
+        samples = self.samples(device, command)
+        if not samples:
+            return default
+        return percentile(samples, 0.5)
+
+    def estimate(self, devices, commands, workers=1, delay=0, pause=0, default_command=5, default_login=5):
+        """Expected seconds to run ``commands`` on every device of ``devices``
+
+        Args:
+        devices (list): Device addresses
+        commands (list): Commands run on each device
+        workers (int): Devices handled at once (``-j``)
+        delay (float): Pause after each command (``-d``)
+        pause (float): Pause after each device
+        default_command (float): Guess for a command never seen on any device
+        default_login (float): Guess for a login never seen on any device
+
+        Returns:
+        float.  Seconds, the per-device times spread evenly over the workers
+        """
+        total = 0.0
+        for device in devices:
+            total += self.expected(device, LOGIN, default_login) + pause
+            for command in commands:
+                total += self.expected(device, command, default_command) + delay
+        return total / max(1, min(workers, len(devices)))
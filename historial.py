@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# historial de metricas por puerto en memoria, con presupuesto fijo
+# cada puerto tiene un buffer circular de CAPACIDAD muestras numericas (momento, confiabilidad,
+# txload, rxload, CRC, colisiones). Las columnas de TODOS los puertos viven en arrays planos
+# (un slot de CAPACIDAD lugares por puerto), sin un objeto por muestra: con la capacidad por
+# defecto son 23 bytes por muestra, ~1.4 KB por puerto, ~280 MB para 200 mil puertos
+
+import bisect
+import threading
+import time
+from array import array
+from collections import namedtuple
+
+Muestra = namedtuple('Muestra', ['tiempo', 'confiabilidad', 'txload', 'rxload', 'crc', 'colisiones'])
+
+# marcas de "dato faltante" (el valor mas alto de cada tipo)
+_SIN_BYTE = 0xFF
+_SIN_CONTADOR = 0xFFFFFFFFFFFFFFFF
+
+# columna -> codigo de array; las fracciones (0..1) se guardan como x/254 en un byte
+_COLUMNAS = (('tiempo', 'I'), ('confiabilidad', 'B'), ('txload', 'B'), ('rxload', 'B'), ('crc', 'Q'), ('colisiones', 'Q'))
+
+
+def _aByte(fraccion):
+    if fraccion is None:
+        return _SIN_BYTE
+    return min(254, max(0, int(round(fraccion * 254))))
+
+
+def _deByte(valor):
+    return None if valor == _SIN_BYTE else valor / 254.0
+
+
+def _aContador(valor):
+    return _SIN_CONTADOR if valor is None else valor & _SIN_CONTADOR
+
+
+def _deContador(valor):
+    return None if valor == _SIN_CONTADOR else valor
+
+
+class HistorialPuertos(object):
+    CAPACIDAD = 60              # muestras por puerto (una hora si se consulta cada minuto)
+    BLOQUE = 1024               # puertos nuevos que se reservan de una vez cuando hace falta lugar
+
+    def __init__(self, capacidad=None):
+        self.capacidad = capacidad or self.CAPACIDAD
+        self._lock = threading.Lock()
+        self._slots = dict()                # (equipo, puerto) -> numero de slot
+        self._inicio = array('I')           # por slot: posicion de la muestra mas vieja
+        self._cantidad = array('I')         # por slot: cuantas muestras hay
+        self._columnas = dict((nombre, array(codigo)) for nombre, codigo in _COLUMNAS)
+
+    def _reservar(self):
+        # agrega BLOQUE slots vacios a todas las columnas
+        self._inicio.frombytes(bytes(self.BLOQUE * self._inicio.itemsize))
+        self._cantidad.frombytes(bytes(self.BLOQUE * self._cantidad.itemsize))
+        for columna in self._columnas.values():
+            columna.frombytes(bytes(self.BLOQUE * self.capacidad * columna.itemsize))
+
+    def _slot(self, equipo, puerto):
+        clave = (equipo, puerto)
+        slot = self._slots.get(clave)
+        if slot is None:
+            slot = len(self._slots)
+            if slot >= len(self._cantidad):
+                self._reservar()
+            self._slots[clave] = slot
+        return slot
+
+    def agregar(self, equipo, puerto, registro, momento=None):
+        # guarda una muestra a partir de un interfaces.EstadoInterfaz
+        momento = int(time.time() if momento is None else momento)
+        with self._lock:
+            slot = self._slot(equipo, puerto)
+            cantidad = self._cantidad[slot]
+            if cantidad < self.capacidad:
+                posicion = (self._inicio[slot] + cantidad) % self.capacidad
+                self._cantidad[slot] = cantidad + 1
+            else:
+                # lleno: se pisa la mas vieja
+                posicion = self._inicio[slot]
+                self._inicio[slot] = (posicion + 1) % self.capacidad
+            i = slot * self.capacidad + posicion
+            c = self._columnas
+            c['tiempo'][i] = momento
+            c['confiabilidad'][i] = _aByte(registro.confiabilidad)
+            c['txload'][i] = _aByte(registro.txload)
+            c['rxload'][i] = _aByte(registro.rxload)
+            c['crc'][i] = _aContador(registro.crc)
+            c['colisiones'][i] = _aContador(registro.colisiones)
+
+    def rango(self, equipo, puerto, desde=0, hasta=None):
+        # muestras del puerto con desde <= tiempo <= hasta, de la mas vieja a la mas nueva
+        # (los momentos de un slot estan ordenados, los extremos se cortan con bisect)
+        with self._lock:
+            slot = self._slots.get((equipo, puerto))
+            if slot is None:
+                return []
+            base = slot * self.capacidad
+            inicio = self._inicio[slot]
+            cantidad = self._cantidad[slot]
+            c = self._columnas
+            fisica = [base + (inicio + k) % self.capacidad for k in range(cantidad)]
+            tiempos = [c['tiempo'][i] for i in fisica]
+            primero = bisect.bisect_left(tiempos, desde)
+            ultimo = cantidad if hasta is None else bisect.bisect_right(tiempos, hasta)
+            return [Muestra(c['tiempo'][i],
+                            _deByte(c['confiabilidad'][i]), _deByte(c['txload'][i]), _deByte(c['rxload'][i]),
+                            _deContador(c['crc'][i]), _deContador(c['colisiones'][i]))
+                    for i in fisica[primero:ultimo]]
+
+    def ultimos(self, equipo, puerto, segundos=3600):
+        # por ejemplo "la ultima hora de Gi0/11"
+        return self.rango(equipo, puerto, int(time.time()) - segundos)
+
+    def puertos(self):
+        with self._lock:
+            return list(self._slots)
+
+    def memoria(self):
+        # bytes ocupados por las columnas (sin contar el indice de puertos)
+        with self._lock:
+            total = sum(len(a) * a.itemsize for a in self._columnas.values())
+            return total + len(self._inicio) * self._inicio.itemsize + len(self._cantidad) * self._cantidad.itemsize
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""On-disk cache of device hostnames and prompts for C.R.A.SSH
+
+``connect()`` needs the hostname to build the prompt regex, and finding it
+means ``show run | inc hostname`` (a walk of the whole running config). The
+cache remembers, per device, the hostname and the privileged prompt the device
+showed at login. On the next connect, if the login prompt is the same one, the
+cached hostname is used and the config walk is skipped.
+
+"""
+
+import json
+import os
+import threading
+import time
+
+
+class HostnameCache(object):
+    """Device -> hostname/prompt cache stored as JSON
+
+    Args:
+    path (str): Cache file, created on the first ``save()``
+    ttl (int): Seconds an entry stays valid
+    """
+
+    def __init__(self, path, ttl=604800):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Read the cache file, a missing or broken file is just an empty cache"""
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            self.entries = {}
+
+    def save(self):
+        """Write the cache back to disk (atomically) if anything changed"""
+        with self.lock:
+            if not self.dirty:
+                return
+            tmp = self.path + ".tmp"
+            with open(tmp, 'w') as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+            self.dirty = False
+
+    def get(self, device):
+        """Cached entry for ``device``
+
+        Returns:
+        dict.  ``hostname``, ``prompt`` and ``time`` keys, or ``None`` on a miss or an expired entry
+        """
+        with self.lock:
+            entry = self.entries.get(device)
+            if entry is None:
+                return None
+            if time.time() - entry["time"] > self.ttl:
+                del self.entries[device]
+                self.dirty = True
+                return None
+            return entry
+
+    def put(self, device, hostname, prompt):
+        """Remember the hostname and login prompt of ``device``"""
+        with self.lock:
+            self.entries[device] = {"hostname": hostname, "prompt": prompt, "time": time.time()}
+            self.dirty = True
+
+    def invalidate(self, device):
+        """Forget ``device``, the next connect will walk the config again"""
+        with self.lock:
+            if self.entries.pop(device, None) is not None:
+                self.dirty = True
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# parser de la salida de "show interface(s)" de Cisco IOS
+# busca las cabeceras de interfaz con str.find y lee cada bloque con patrones precompilados,
+# devuelve registros con tipos (numeros en lugar de texto) por cada interfaz encontrada
+
+import re
+from collections import namedtuple
+
+# un registro por interfaz; las cargas y la confiabilidad quedan como fraccion (x/255 -> 0..1),
+# las tasas en bits/seg y los contadores como enteros. None si el dato no vino en la salida
+EstadoInterfaz = namedtuple('EstadoInterfaz', [
+    'interfaz', 'estado', 'protocolo',
+    'confiabilidad', 'txload', 'rxload',
+    'tasaEntrada', 'tasaSalida',
+    'erroresEntrada', 'crc', 'erroresSalida', 'colisiones', 'reinicios',
+])
+
+# cada interfaz empieza en una linea "<nombre> is <estado>, line protocol is <protocolo>" (en la
+# columna 0) y los datos que interesan estan en cinco lineas indentadas. En lugar de probar un patron
+# en cada linea de la salida (unas 30 por interfaz), el bloque se lee con un solo match (_BLOQUE) o,
+# si no tiene la forma de siempre, se busca cada linea por una palabra clave con str.find y recien
+# ahi se aplica un patron chico, anclado al principio de esa linea. Anda igual con "\n" y con
+# "\r\n" (lo que llega por SSH)
+_PROTOCOLO = ", line protocol is "
+
+
+def _carga(dividendo, divisor):
+    # "x/255" -> fraccion, None si el divisor es 0
+    divisor = int(divisor)
+    if divisor == 0:
+        return None
+    return int(dividendo) / divisor
+
+
+def _cargas(m):
+    g = m.groups()
+    return _carga(g[0], g[1]), _carga(g[2], g[3]), _carga(g[4], g[5])
+
+
+def _enteros(m):
+    return tuple(map(int, m.groups()))
+
+
+def _erroresSalida(m):
+    salida, colisiones, reinicios = m.groups()
+    return int(salida), None if colisiones is None else int(colisiones), int(reinicios)
+
+
+_CAMPO = dict((campo, n) for n, campo in enumerate(EstadoInterfaz._fields))
+_LINEAS = (
+    # (palabra clave, patron desde el principio de la linea, primer campo que llena, conversion)
+    ("reliability ", re.compile(r"[ \t]+reliability (\d+)/(\d+), txload (\d+)/(\d+), rxload (\d+)/(\d+)"),
+     _CAMPO['confiabilidad'], _cargas),
+    (" input rate ", re.compile(r"[ \t]+\d+ (?:minute|second) input rate (\d+)"), _CAMPO['tasaEntrada'], _enteros),
+    (" output rate ", re.compile(r"[ \t]+\d+ (?:minute|second) output rate (\d+)"), _CAMPO['tasaSalida'], _enteros),
+    (" input errors, ", re.compile(r"[ \t]+(\d+) input errors, (\d+)"), _CAMPO['erroresEntrada'], _enteros),
+    (" output errors,", re.compile(r"[ \t]+(\d+) output errors,(?: (\d+) collisions,)? (\d+)"),
+     _CAMPO['erroresSalida'], _erroresSalida),
+)
+
+
+# el caso comun, las cinco lineas en el orden de IOS: un solo match por interfaz (todo en C), desde
+# el final de la cabecera y sin salir del bloque. Si falta alguna o vienen en otro orden, se buscan
+# de a una con _LINEAS. Cada salto tiene tope de lineas, asi un bloque raro no dispara un backtracking
+# cuadratico antes de caer en la busqueda de a una
+_LINEA = r"(?:[^\n]*\n){1,64}?[ \t]+"
+_BLOQUE = re.compile(
+    _LINEA + r"reliability (\d+)/(\d+), txload (\d+)/(\d+), rxload (\d+)/(\d+)" +
+    _LINEA + r"\d+ (?:minute|second) input rate (\d+)" +
+    _LINEA + r"\d+ (?:minute|second) output rate (\d+)" +
+    _LINEA + r"(\d+) input errors, (\d+)" +
+    _LINEA + r"(\d+) output errors,(?: (\d+) collisions,)? (\d+)")
+
+
+def _bloque(m):
+    g = m.groups()
+    return (_carga(g[0], g[1]), _carga(g[2], g[3]), _carga(g[4], g[5]), int(g[6]), int(g[7]),
+            int(g[8]), int(g[9]), int(g[10]), None if g[11] is None else int(g[11]), int(g[12]))
+
+
+def _cabeceras(texto):
+    # (inicio de la linea, posicion de ", line protocol is ") de cada cabecera de interfaz
+    cabeceras = []
+    pos = texto.find(_PROTOCOLO)
+    while pos != -1:
+        inicio = texto.rfind('\n', 0, pos) + 1
+        # las cabeceras van en la columna 0 y empiezan con el nombre de la interfaz
+        if texto[inicio].isalpha():
+            cabeceras.append((inicio, pos))
+        pos = texto.find(_PROTOCOLO, pos + len(_PROTOCOLO))
+    return cabeceras
+
+
+def _registro(texto, inicio, pos, fin):
+    # EstadoInterfaz de la interfaz cuya cabecera empieza en inicio y cuyo bloque termina en fin
+    nombre, separador, estado = texto[inicio:pos].partition(' is ')
+    finLinea = texto.find('\n', pos, fin)
+    protocolo = texto[pos + len(_PROTOCOLO):fin if finLinea == -1 else finLinea].split()
+    if not separador or ' ' in nombre or not protocolo:
+        # cabecera cortada o que no es de una interfaz
+        return None
+    m = _BLOQUE.match(texto, pos, fin)
+    if m is not None:
+        return EstadoInterfaz._make((nombre, estado, protocolo[0]) + _bloque(m))
+    valores = [nombre, estado, protocolo[0]] + [None] * (len(EstadoInterfaz._fields) - 3)
+    for clave, patron, campo, convertir in _LINEAS:
+        encontrado = texto.find(clave, pos, fin)
+        while encontrado != -1:
+            m = patron.match(texto, texto.rfind('\n', 0, encontrado) + 1)
+            if m is not None:
+                datos = convertir(m)
+                valores[campo:campo + len(datos)] = datos
+                break
+            # la palabra estaba en otra linea (una descripcion, por ejemplo): se sigue buscando
+            encontrado = texto.find(clave, encontrado + len(clave), fin)
+    return EstadoInterfaz._make(valores)
+
+
+def parsearInterfaces(texto):
+    # recorre la salida completa (una o muchas interfaces) y devuelve un dict nombre -> EstadoInterfaz
+    # en el orden en que aparecen
+    resultado = dict()
+    cabeceras = _cabeceras(texto)
+    for n, (inicio, pos) in enumerate(cabeceras):
+        fin = cabeceras[n + 1][0] if n + 1 < len(cabeceras) else len(texto)
+        registro = _registro(texto, inicio, pos, fin)
+        if registro is not None:
+            resultado[registro.interfaz] = registro
+    return resultado
+
+
+def parsearInterfaz(texto):
+    # salida de "show interface <puerto>": devuelve el registro de la primera interfaz, o None
+    for registro in parsearInterfaces(texto).values():
+        return registro
+    return None
+
+
+# tipos de interfaz: nombre completo y abreviaturas de IOS; la primera abreviatura es la clave del tipo.
+# Cada tipo tiene la suya: TwoGigabitEthernet es 'tw' y TwentyFiveGigE 'twe', como los abrevia IOS
+_TIPOS = (
+    ('ethernet', 'et', 'eth'),
+    ('fastethernet', 'fa'),
+    ('gigabitethernet', 'gi', 'gig'),
+    ('twogigabitethernet', 'tw'),
+    ('fivegigabitethernet', 'fi'),
+    ('tengigabitethernet', 'te'),
+    ('twentyfivegige', 'twe'),
+    ('fortygigabitethernet', 'fo'),
+    ('fiftygige', 'fif'),
+    ('hundredgige', 'hu'),
+    ('fourhundredgige', 'fou'),
+    ('appgigabitethernet', 'ap'),
+    ('port-channel', 'po'),
+    ('vlan', 'vl'),
+    ('loopback', 'lo'),
+    ('tunnel', 'tu'),
+    ('serial', 'se'),
+)
+_CLAVES = dict((escritura, tipo[1]) for tipo in _TIPOS for escritura in tipo)
+
+
+def _clave(prefijo):
+    # abreviatura o nombre completo conocido; si no, un prefijo que solo un nombre completo tenga
+    # ("Gigabit", "TenGig"); si no, el prefijo tal cual (tipos que no estan en la tabla)
+    clave = _CLAVES.get(prefijo)
+    if clave is None:
+        candidatos = set(tipo[1] for tipo in _TIPOS if tipo[0].startswith(prefijo))
+        clave = candidatos.pop() if len(candidatos) == 1 else prefijo
+    return clave
+
+
+def normalizarNombre(nombre):
+    # "Gi0/11", "gi 0/11" y "GigabitEthernet0/11" dan la misma clave ('gi', '0/11'),
+    # asi los puertos del archivo de configuracion se encuentran en la salida de "show interfaces"
+    nombre = nombre.replace(' ', '')
+    i = 0
+    while i < len(nombre) and not nombre[i].isdigit():
+        i += 1
+    return (_clave(nombre[:i].lower()), nombre[i:])
+
+
+def indexarPorNombre(registros):
+    # dict clave normalizada -> EstadoInterfaz, a partir de lo que devuelve parsearInterfaces
+    return dict((normalizarNombre(nombre), registro) for nombre, registro in registros.items())
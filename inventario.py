@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# inventario de equipos en SQLite, en lugar de listas de IPs en texto y secciones del INI
+# una fila por equipo (ip, hostname, sitio, marca, modelo, sistema operativo, grupo, perfil,
+# bastion, puertos) mas sus etiquetas, con indices en sitio, modelo, so, grupo y etiqueta:
+# "todos los 2960 del sitio X" es una consulta indexada, no releer y parsear archivos
+#
+# uso: python inventario.py inventario.db importar switches.txt sitio=central grupo=acceso
+#      python inventario.py inventario.db importar swOffal.ini
+#      python inventario.py inventario.db buscar sitio=central modelo=WS-C2960* etiqueta=core
+
+import sqlite3
+import sys
+import threading
+from urllib.parse import quote
+
+# columnas de la tabla equipos (ademas de ip), en el orden del esquema
+CAMPOS = ('hostname', 'sitio', 'marca', 'modelo', 'so', 'grupo', 'perfil', 'bastion', 'puertos')
+# campos por los que se puede filtrar (todos con indice)
+FILTROS = ('sitio', 'modelo', 'so', 'grupo')
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS equipos (
+    ip TEXT PRIMARY KEY,
+    hostname TEXT,
+    sitio TEXT COLLATE NOCASE,
+    marca TEXT,
+    modelo TEXT COLLATE NOCASE,
+    so TEXT COLLATE NOCASE,
+    grupo TEXT COLLATE NOCASE,
+    perfil TEXT,
+    bastion TEXT,
+    puertos TEXT
+);
+CREATE TABLE IF NOT EXISTS etiquetas (
+    etiqueta TEXT COLLATE NOCASE,
+    ip TEXT,
+    PRIMARY KEY (etiqueta, ip)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS equipos_sitio ON equipos (sitio);
+CREATE INDEX IF NOT EXISTS equipos_modelo ON equipos (modelo);
+CREATE INDEX IF NOT EXISTS equipos_so ON equipos (so);
+CREATE INDEX IF NOT EXISTS equipos_grupo ON equipos (grupo);
+CREATE INDEX IF NOT EXISTS etiquetas_ip ON etiquetas (ip);
+"""
+
+
+def _patron(valor):
+    # "WS-C2960*" -> LIKE 'WS-C2960%' ESCAPE '\' (con COLLATE NOCASE sqlite usa el indice para el prefijo)
+    # el unico comodin es '*': '%' y '_' del valor se buscan tal cual
+    valor = valor.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return valor.replace('*', '%')
+
+
+class Inventario(object):
+
+    def __init__(self, ruta, crear=True):
+        # crear=False para solo consultar (buscar, -I de crassh): la base tiene que existir,
+        # un nombre mal escrito es un ValueError y no una base vacia nueva
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        # una conexion compartida por los hilos (el lock serializa el acceso)
+        if crear:
+            self._db = sqlite3.connect(ruta, check_same_thread=False)
+        else:
+            try:
+                self._db = sqlite3.connect("file:" + quote(ruta) + "?mode=rw", uri=True, check_same_thread=False)
+            except sqlite3.OperationalError as e:
+                raise ValueError("no se pudo abrir el inventario " + ruta + ": " + str(e))
+        self._db.row_factory = sqlite3.Row
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_ESQUEMA)
+
+    def cerrar(self):
+        with self._lock:
+            self._db.close()
+
+    def agregar(self, ip, etiquetas=(), **campos):
+        self.agregarMuchos([dict(campos, ip=ip, etiquetas=etiquetas)])
+
+    def agregarMuchos(self, equipos):
+        # alta o actualizacion de muchos equipos en una sola transaccion
+        # cada equipo es un dict con ip, los CAMPOS que se conozcan y etiquetas (lista)
+        # los campos que no vienen no se pisan
+        with self._lock, self._db:
+            for equipo in equipos:
+                ip = equipo['ip']
+                self._db.execute("INSERT OR IGNORE INTO equipos (ip) VALUES (?)", (ip,))
+                campos = [c for c in CAMPOS if equipo.get(c) is not None]
+                if campos:
+                    self._db.execute("UPDATE equipos SET " + ", ".join(c + " = ?" for c in campos) + " WHERE ip = ?",
+                                     [equipo[c] for c in campos] + [ip])
+                etiquetas = equipo.get('etiquetas') or ()
+                self._db.executemany("INSERT OR IGNORE INTO etiquetas (etiqueta, ip) VALUES (?, ?)",
+                                     [(e, ip) for e in etiquetas])
+
+    def quitar(self, ip):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM etiquetas WHERE ip = ?", (ip,))
+            self._db.execute("DELETE FROM equipos WHERE ip = ?", (ip,))
+
+    def importarTexto(self, ruta, **campos):
+        # lista de IPs (una por linea, como la de -s de crassh: "ip [perfil]"), con campos comunes
+        equipos = []
+        with open(ruta, 'r') as f:
+            for linea in f:
+                partes = linea.split()
+                if not partes or partes[0].startswith('#'):
+                    continue
+                equipo = dict(campos, ip=partes[0])
+                if len(partes) > 1:
+                    equipo['perfil'] = partes[1]
+                equipos.append(equipo)
+        self.agregarMuchos(equipos)
+        return len(equipos)
+
+    def importarIni(self, config):
+        # secciones de un swOffal.ini ya leido (configparser): la seccion es la ip/nombre del equipo
+        equipos = []
+        for seccion in config.sections():
+            equipo = dict(ip=seccion)
+            for campo in CAMPOS:
+                equipo[campo] = config.get(seccion, campo, fallback=None)
+            etiquetas = config.get(seccion, 'etiquetas', fallback="")
+            equipo['etiquetas'] = [e.strip() for e in etiquetas.split(',') if e.strip()]
+            equipos.append(equipo)
+        self.agregarMuchos(equipos)
+        return len(equipos)
+
+    def _consulta(self, columnas, filtro, etiquetas):
+        condiciones = []
+        valores = []
+        for campo in FILTROS:
+            valor = filtro.get(campo)
+            if valor is None:
+                continue
+            if '*' in valor:
+                condiciones.append(campo + " LIKE ? ESCAPE '\\'")
+                valores.append(_patron(valor))
+            else:
+                condiciones.append(campo + " = ?")
+                valores.append(valor)
+        # cada etiqueta pedida tiene que estar (AND), la busqueda va por la clave de etiquetas
+        for etiqueta in etiquetas:
+            condiciones.append("ip IN (SELECT ip FROM etiquetas WHERE etiqueta = ?)")
+            valores.append(etiqueta)
+        sql = "SELECT " + columnas + " FROM equipos"
+        if condiciones:
+            sql += " WHERE " + " AND ".join(condiciones)
+        return sql + " ORDER BY ip", valores
+
+    def seleccionar(self, etiquetas=(), **filtro):
+        # ips de los equipos que cumplen todos los filtros (sitio, modelo, so, grupo; '*' como comodin)
+        sql, valores = self._consulta("ip", self._validar(filtro), etiquetas)
+        with self._lock:
+            return [fila[0] for fila in self._db.execute(sql, valores)]
+
+    def equipos(self, etiquetas=(), **filtro):
+        # como seleccionar, pero con todos los campos de cada equipo (sin etiquetas) en una sola consulta
+        sql, valores = self._consulta("*", self._validar(filtro), etiquetas)
+        with self._lock:
+            return [dict(fila) for fila in self._db.execute(sql, valores)]
+
+    def _validar(self, filtro):
+        desconocidos = set(filtro) - set(FILTROS)
+        if desconocidos:
+            raise ValueError("filtro desconocido: " + ", ".join(sorted(desconocidos)))
+        return filtro
+
+    def obtener(self, ip):
+        # dict con los campos y las etiquetas del equipo, o None
+        with self._lock:
+            fila = self._db.execute("SELECT * FROM equipos WHERE ip = ?", (ip,)).fetchone()
+            if fila is None:
+                return None
+            equipo = dict(fila)
+            equipo['etiquetas'] = [e[0] for e in self._db.execute("SELECT etiqueta FROM etiquetas WHERE ip = ?", (ip,))]
+        return equipo
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM equipos").fetchone()[0]
+
+
+def parsearFiltro(texto):
+    # "sitio=central,modelo=WS-C2960*,etiqueta=core" -> (etiquetas, filtro)
+    etiquetas = []
+    filtro = dict()
+    for parte in texto.split(','):
+        if not parte.strip():
+            continue
+        campo, _, valor = parte.partition('=')
+        campo = campo.strip()
+        if campo in ('etiqueta', 'tag'):
+            etiquetas.append(valor.strip())
+        else:
+            filtro[campo] = valor.strip()
+    return etiquetas, filtro
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("uso: inventario.py base.db importar archivo [campo=valor ...] | buscar [campo=valor ...]")
+        sys.exit(1)
+    try:
+        inventario = Inventario(sys.argv[1], crear=sys.argv[2] == "importar")
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    if sys.argv[2] == "importar":
+        archivo = sys.argv[3]
+        etiquetas, campos = parsearFiltro(",".join(sys.argv[4:]))
+        if archivo.endswith(".ini"):
+            import configparser
+            config = configparser.ConfigParser()
+            config.read(archivo)
+            print("importados: %d" % inventario.importarIni(config))
+        else:
+            print("importados: %d" % inventario.importarTexto(archivo, etiquetas=etiquetas, **campos))
+    elif sys.argv[2] == "buscar":
+        etiquetas, filtro = parsearFiltro(",".join(sys.argv[3:]))
+        for ip in inventario.seleccionar(etiquetas, **filtro):
+            print(ip)
+    inventario.cerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""Timing sinks for C.R.A.SSH
+
+``claseCrassh`` times every phase of a session (``tcp_connect``, ``auth``,
+``invoke_shell``, ``enable``, ``terminal_length``, ``hostname``, ``command``,
+``write``) and hands each measurement to ``self.metrics.record(event)`` when a
+sink is set. An event is a dict with at least ``device``, ``hostname``,
+``phase`` and ``seconds``; ``command`` events also carry ``command``,
+``bytes`` and ``iterations`` (passes through the receive loop).
+
+* ``JsonlSink`` appends one JSON object per line, for CLI runs (``-M``).
+* ``PrometheusSink`` keeps per-phase histograms and totals, and renders the
+  Prometheus text format for the ssh.py service.
+
+"""
+
+import bisect
+import json
+import threading
+import time
+
+
+class JsonlSink(object):
+    """Write every event as a JSON line
+
+    Args:
+    path (str): File to append to
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.f = open(path, 'a')
+
+    def record(self, event):
+        event["time"] = time.time()
+        line = json.dumps(event, sort_keys=True) + "\n"
+        with self.lock:
+            self.f.write(line)
+
+    def close(self):
+        with self.lock:
+            self.f.close()
+
+
+class PrometheusSink(object):
+    """Per-phase histograms (``crassh_phase_seconds``) plus byte and receive-loop totals
+
+    Args:
+    buckets (tuple): Upper bounds of the histogram buckets, in seconds
+    """
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(buckets or self.BUCKETS)
+        self.lock = threading.Lock()
+        self.phases = {}            # phase -> [bucket counts..., +Inf count, sum]
+        self.bytes = 0
+        self.iterations = 0
+
+    def record(self, event):
+        phase = event["phase"]
+        seconds = event["seconds"]
+        with self.lock:
+            counts = self.phases.get(phase)
+            if counts is None:
+                counts = self.phases[phase] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            counts[-1] += seconds
+            self.bytes += event.get("bytes", 0)
+            self.iterations += event.get("iterations", 0)
+
+    def exposition(self):
+        """The metrics in Prometheus text format"""
+        lines = [
+            "# HELP crassh_phase_seconds Time spent in each SSH session phase.",
+            "# TYPE crassh_phase_seconds histogram",
+        ]
+        with self.lock:
+            for phase in sorted(self.phases):
+                counts = self.phases[phase]
+                total = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts[:-1]):
+                    total += count
+                    lines.append('crassh_phase_seconds_bucket{phase="%s",le="%s"} %d' % (phase, bound, total))
+                lines.append('crassh_phase_seconds_sum{phase="%s"} %f' % (phase, counts[-1]))
+                lines.append('crassh_phase_seconds_count{phase="%s"} %d' % (phase, total))
+            lines += [
+                "# HELP crassh_received_bytes_total Bytes received from devices.",
+                "# TYPE crassh_received_bytes_total counter",
+                "crassh_received_bytes_total %d" % self.bytes,
+                "# HELP crassh_recv_iterations_total Passes through the receive loop.",
+                "# TYPE crassh_recv_iterations_total counter",
+                "crassh_recv_iterations_total %d" % self.iterations,
+            ]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# planificador de consultas periodicas para todos los equipos de swOffal.ini
+# - cada seccion puede tener su "intervalo" (segundos) en el archivo de configuracion
+# - las consultas se reparten a lo largo del intervalo con jitter, para no golpear a
+#   cientos de equipos en el mismo segundo
+# - hay tope global de consultas simultaneas y tope por equipo; si un equipo sigue ocupado
+#   (o la consulta ya llega tarde un intervalo entero) se saltea la vuelta en lugar de acumular
+# - metricas del atraso (lag) entre el momento planificado y el real, para saber cuando
+#   la cantidad de hilos ya no alcanza para el parque de equipos
+
+import heapq
+import random
+import threading
+import time
+import concurrent.futures
+from collections import deque
+
+
+def intervalosDesdeConfig(config, equipos, porDefecto):
+    # dict equipo -> intervalo en segundos, leido de cada seccion (o de [DEFAULT])
+    # un intervalo de cero o negativo no es una frecuencia: ValueError con el equipo
+    intervalos = dict()
+    for equipo in equipos:
+        intervalo = config.getfloat(equipo, "intervalo", fallback=porDefecto)
+        if not intervalo > 0:
+            raise ValueError("intervalo invalido para " + equipo + ": " + str(intervalo))
+        intervalos[equipo] = intervalo
+    return intervalos
+
+
+class Planificador(object):
+    HILOS = 16                  # consultas simultaneas en total
+    POR_EQUIPO = 1              # consultas simultaneas a un mismo equipo
+    JITTER = 0.1                # variacion aleatoria de cada intervalo (+/- 10%)
+    MUESTRAS_LAG = 1000         # cuantas mediciones de atraso se guardan para los percentiles
+
+    def __init__(self, intervalos, tarea, hilos=None, porEquipo=None, jitter=None):
+        self.intervalos = intervalos    # equipo -> segundos
+        self.tarea = tarea              # funcion que recibe el nombre del equipo
+        self.hilos = hilos or self.HILOS
+        self.porEquipo = porEquipo or self.POR_EQUIPO
+        self.jitter = self.JITTER if jitter is None else jitter
+        invalidos = sorted(equipo for equipo, intervalo in intervalos.items() if not intervalo > 0)
+        if invalidos:
+            raise ValueError("intervalo invalido (debe ser mayor a cero) para: " + ", ".join(invalidos))
+        if not 0 <= self.jitter < 1:
+            raise ValueError("jitter invalido (entre 0 y 1): " + str(self.jitter))
+        self._cola = []                 # heap de (momento planificado, equipo)
+        self._enCurso = dict((equipo, 0) for equipo in intervalos)
+        self._cond = threading.Condition()
+        self._lugares = threading.BoundedSemaphore(self.hilos)
+        self._parar = threading.Event()
+        self._lags = deque(maxlen=self.MUESTRAS_LAG)
+        self._metricas = {
+            "ejecutadas": 0,
+            "fallidas": 0,
+            "salteadasOcupado": 0,  # el equipo seguia con la consulta anterior
+            "salteadasAtraso": 0,   # la consulta ya llevaba un intervalo entero de atraso
+            "lagMaximo": 0.0,
+            "duracionTotal": 0.0,
+        }
+
+    def _programar(self, equipo, momento):
+        heapq.heappush(self._cola, (momento, equipo))
+        self._cond.notify()
+
+    def _siguiente(self, equipo, planificado):
+        # proximo momento: un intervalo (con jitter) despues del planificado, no del real,
+        # asi el atraso de una vuelta no se arrastra; si quedamos atras, se saltean vueltas
+        # (se calculan de una, sin iterar vuelta por vuelta con el lock tomado)
+        intervalo = self.intervalos[equipo]
+        siguiente = planificado + intervalo * (1 + random.uniform(-self.jitter, self.jitter))
+        ahora = time.monotonic()
+        if siguiente < ahora:
+            salteadas = int((ahora - siguiente) // intervalo) + 1
+            siguiente += salteadas * intervalo
+            self._metricas["salteadasAtraso"] += salteadas
+        return siguiente
+
+    def iniciar(self):
+        # la primera consulta de cada equipo cae en un punto al azar de su intervalo
+        ahora = time.monotonic()
+        with self._cond:
+            for equipo, intervalo in self.intervalos.items():
+                self._programar(equipo, ahora + random.uniform(0, intervalo))
+        self._ejecutor = concurrent.futures.ThreadPoolExecutor(max_workers=self.hilos)
+        hilo = threading.Thread(target=self._despachar, name="planificador", daemon=True)
+        hilo.start()
+        return hilo
+
+    def parar(self):
+        self._parar.set()
+        with self._cond:
+            self._cond.notify_all()
+        self._ejecutor.shutdown(wait=False)
+
+    def _despachar(self):
+        while not self._parar.is_set():
+            with self._cond:
+                if not self._cola:
+                    self._cond.wait()
+                    continue
+                planificado, equipo = self._cola[0]
+                espera = planificado - time.monotonic()
+                if espera > 0:
+                    self._cond.wait(espera)
+                    continue
+                heapq.heappop(self._cola)
+                if self._enCurso[equipo] >= self.porEquipo:
+                    # el equipo sigue ocupado con la vuelta anterior: esta se saltea
+                    self._metricas["salteadasOcupado"] += 1
+                    self._programar(equipo, self._siguiente(equipo, planificado))
+                    continue
+            # espera un lugar libre (si todos estan ocupados, aca crece el atraso)
+            while not self._lugares.acquire(timeout=1):
+                if self._parar.is_set():
+                    return
+            lag = time.monotonic() - planificado
+            with self._cond:
+                self._lags.append(lag)
+                self._metricas["lagMaximo"] = max(self._metricas["lagMaximo"], lag)
+                if lag > self.intervalos[equipo]:
+                    # llega tarde un intervalo entero: mejor esperar la proxima vuelta
+                    self._metricas["salteadasAtraso"] += 1
+                    self._lugares.release()
+                    self._programar(equipo, self._siguiente(equipo, planificado))
+                    continue
+                self._enCurso[equipo] += 1
+                self._programar(equipo, self._siguiente(equipo, planificado))
+            self._ejecutor.submit(self._ejecutar, equipo)
+
+    def _ejecutar(self, equipo):
+        inicio = time.monotonic()
+        fallo = False
+        try:
+            self.tarea(equipo)
+        except Exception:
+            fallo = True
+        finally:
+            with self._cond:
+                self._enCurso[equipo] -= 1
+                self._metricas["ejecutadas"] += 1
+                self._metricas["duracionTotal"] += time.monotonic() - inicio
+                if fallo:
+                    self._metricas["fallidas"] += 1
+            self._lugares.release()
+
+    def metricas(self):
+        # foto de las metricas: atraso (promedio, p50, p95, maximo), vueltas salteadas y ocupacion
+        with self._cond:
+            datos = dict(self._metricas)
+            lags = sorted(self._lags)
+            datos["enCurso"] = sum(self._enCurso.values())
+            datos["hilos"] = self.hilos
+            datos["equipos"] = len(self.intervalos)
+        if lags:
+            datos["lagPromedio"] = sum(lags) / len(lags)
+            datos["lagP50"] = lags[len(lags) // 2]
+            datos["lagP95"] = lags[min(len(lags) - 1, int(len(lags) * 0.95))]
+        else:
+            datos["lagPromedio"] = datos["lagP50"] = datos["lagP95"] = 0.0
+        if datos["ejecutadas"]:
+            datos["duracionPromedio"] = datos["duracionTotal"] / datos["ejecutadas"]
+            # hilos necesarios para el parque = consultas por segundo x duracion promedio
+            porSegundo = sum(1.0 / i for i in self.intervalos.values() if i > 0)
+            datos["hilosNecesarios"] = porSegundo * datos["duracionPromedio"]
+        return datos
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""SSH transport profiles for C.R.A.SSH
+
+A profile tunes the paramiko transport ``connect()`` builds: the preferred
+ciphers, key exchanges, MACs and host key types (in order), the channel window
+and packet sizes, and compression. Presets:
+
+* ``default``: paramiko's own settings.
+* ``fast-lan``: AES-GCM/CTR with curve25519, the cheapest to compute, and a
+  larger window so bulk output isn't throttled by window adjusts.
+* ``slow-wan``: compression (IOS output is text, it shrinks several times)
+  and a window big enough for a high bandwidth-delay product.
+* ``legacy-ios``: CBC ciphers, SHA-1 MACs and DH group 14/1 key exchanges
+  first, the ones older IOS images offer, and a smaller window.
+
+The profile lists go ahead of paramiko's defaults, which stay as a fallback
+for devices that offer none of them. Algorithms this paramiko doesn't
+implement are dropped, so a profile keeps working across paramiko versions
+(recent ones no longer ship the SHA-1 key exchanges, for instance).
+
+Select one with ``-K name`` in crassh (or per device, as a second word on the
+device's line of the ``-s`` file), or with ``perfil = name`` in a
+``swOffal.ini`` section (``[DEFAULT]`` for all of them).
+
+"""
+
+PROFILES = {
+    "default": {},
+    "fast-lan": {
+        "ciphers": ("aes128-gcm@openssh.com", "aes128-ctr", "aes256-gcm@openssh.com", "aes256-ctr"),
+        "kex": ("curve25519-sha256@libssh.org", "ecdh-sha2-nistp256"),
+        "macs": ("hmac-sha2-256-etm@openssh.com", "hmac-sha2-256"),
+        "keys": ("ssh-ed25519", "ecdsa-sha2-nistp256", "rsa-sha2-256", "rsa-sha2-512"),
+        "window_size": 8 * 1024 * 1024,
+        "max_packet_size": 32768,
+        "compress": False,
+    },
+    "slow-wan": {
+        "ciphers": ("aes128-gcm@openssh.com", "aes128-ctr", "aes256-ctr"),
+        "kex": ("curve25519-sha256@libssh.org", "ecdh-sha2-nistp256", "diffie-hellman-group14-sha256"),
+        "macs": ("hmac-sha2-256-etm@openssh.com", "hmac-sha2-256"),
+        "window_size": 16 * 1024 * 1024,
+        "max_packet_size": 32768,
+        "compress": True,
+    },
+    "legacy-ios": {
+        "ciphers": ("aes128-cbc", "aes256-cbc", "aes128-ctr", "aes256-ctr", "3des-cbc"),
+        "kex": ("diffie-hellman-group14-sha1", "diffie-hellman-group-exchange-sha1", "diffie-hellman-group1-sha1",
+                "diffie-hellman-group14-sha256", "ecdh-sha2-nistp256"),
+        "macs": ("hmac-sha1", "hmac-sha2-256", "hmac-sha1-96"),
+        "keys": ("ssh-rsa", "rsa-sha2-256", "rsa-sha2-512"),
+        "window_size": 1024 * 1024,
+        "max_packet_size": 16384,
+        "compress": False,
+    },
+}
+
+
+def get(profile):
+    """Profile dict for a name, a dict is returned as is and ``None`` is ``default``"""
+    if profile is None:
+        return PROFILES["default"]
+    if isinstance(profile, dict):
+        return profile
+    try:
+        return PROFILES[profile]
+    except KeyError:
+        raise ValueError("unknown transport profile %r (known: %s)" % (profile, ", ".join(sorted(PROFILES))))
+
+
+def transport_factory(profile):
+    """``transport_factory`` for ``SSHClient.connect`` that applies ``profile``"""
+    import paramiko
+
+    def factory(sock, **kwargs):
+        if "window_size" in profile:
+            kwargs["default_window_size"] = profile["window_size"]
+        if "max_packet_size" in profile:
+            kwargs["default_max_packet_size"] = profile["max_packet_size"]
+        transport = paramiko.Transport(sock, **kwargs)
+        # The profile's algorithms go first, paramiko's other defaults stay behind them as a fallback
+        options = transport.get_security_options()
+        for name, attribute, known in (("ciphers", "ciphers", transport._cipher_info),
+                                       ("kex", "kex", transport._kex_info),
+                                       ("macs", "digests", transport._mac_info),
+                                       ("keys", "key_types", transport._key_info)):
+            if name in profile:
+                wanted = tuple(algorithm for algorithm in profile[name] if algorithm in known)
+                rest = tuple(algorithm for algorithm in getattr(options, attribute) if algorithm not in wanted)
+                setattr(options, attribute, wanted + rest)
+        return transport
+
+    return factory
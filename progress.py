@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""Run progress and live event stream for C.R.A.SSH
+
+One ``Progress`` is shared by every worker of a run. Workers report what
+happens to each device (``device_started``, ``connected``, ``command_done``,
+``device_failed``, ``device_done``), and ``Progress`` keeps the counts and the
+ETA under a lock.
+
+* The ETA comes from throughput: commands finished over the last ``window``
+  seconds, whatever the number of workers. It is not derived from ``-d``.
+* A device that fails takes its commands out of the remaining work, so a dead
+  device doesn't stretch the ETA.
+* With a stream (``-O``), every event is written as one JSON line to a file,
+  or to a TCP listener given as ``tcp://host:port``. Each line is flushed, so
+  ``tail -f`` or a socket reader sees a 10,000 device run as it happens. Every
+  event carries the run-wide counts, the rate and the ETA.
+* On stdout, a percent/ETA line is printed at every 10% step (big jobs only).
+
+"""
+
+import collections
+import datetime
+import json
+import socket
+import sys
+import threading
+import time
+
+
+def open_stream(target):
+    """Line-buffered text stream for ``target``: ``tcp://host:port``, ``-`` (stdout) or a file path"""
+    if target == "-":
+        return sys.stdout
+    if target.startswith("tcp://"):
+        host, port = target[len("tcp://"):].rsplit(":", 1)
+        sock = socket.create_connection((host, int(port)), 10)
+        return sock.makefile("w", buffering=1, encoding="utf-8", newline="\n")
+    return open(target, "a", buffering=1)
+
+
+class Progress(object):
+    """Counts, throughput ETA and the event stream of one run
+
+    Args:
+    total (int): Commands in the run (devices x commands)
+    devices (int): Devices in the run
+    stream (file): Where the JSON lines go (see ``open_stream``), ``None`` for no stream
+    window (float): Seconds of finished commands the rate is measured over
+    steps (bool): Print a percent/ETA line to stdout every 10%
+    """
+
+    def __init__(self, total, devices, stream=None, window=60.0, steps=True):
+        self.total = total
+        self.devices = devices
+        self.stream = stream
+        self.window = window
+        self.steps = steps
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.done = 0               # Commands finished
+        self.skipped = 0            # Commands of failed devices, never to run
+        self.bytes = 0
+        self.devices_done = 0
+        self.devices_failed = 0
+        self.active = 0             # Devices being worked on right now
+        self.recent = collections.deque()   # time.monotonic() of each finished command inside the window
+        self.seq = 0
+        self.next_step = 10
+
+    def rate(self, now):
+        """Commands per second over the last ``window`` seconds (lock held)"""
+        while self.recent and now - self.recent[0] > self.window:
+            self.recent.popleft()
+        if not self.recent:
+            return 0.0
+        # The first seconds of a run only cover that long, don't read them as slow
+        span = min(self.window, time.time() - self.started)
+        return len(self.recent) / max(span, 1.0)
+
+    def eta(self, now):
+        """Seconds left at the current rate, ``None`` until there is a rate (lock held)"""
+        remaining = self.total - self.done - self.skipped
+        if remaining <= 0:
+            return 0.0
+        rate = self.rate(now)
+        if rate <= 0:
+            return None
+        return remaining / rate
+
+    def emit(self, event, **fields):
+        """Stamp ``fields`` with the run counts and write the event to the stream"""
+        with self.lock:
+            now = time.monotonic()
+            eta = self.eta(now)
+            self.seq += 1
+            fields.update({
+                "event": event,
+                "seq": self.seq,
+                "time": time.time(),
+                "done": self.done,
+                "skipped": self.skipped,
+                "total": self.total,
+                "active": self.active,
+                "devices_done": self.devices_done,
+                "devices_failed": self.devices_failed,
+                "devices": self.devices,
+                "bytes": self.bytes,
+                "rate": round(self.rate(now), 3),
+                "eta": None if eta is None else round(eta, 1),
+            })
+            if self.stream is not None:
+                try:
+                    self.stream.write(json.dumps(fields, sort_keys=True) + "\n")
+                except (IOError, OSError, ValueError):
+                    # A reader that went away doesn't stop the run
+                    self.stream = None
+            if self.steps and self.total:
+                self.print_step(eta)
+
+    def print_step(self, eta):
+        """Percent complete (and ETA) each time another 10% is done (lock held)"""
+        completion = ((float(self.done + self.skipped) / float(self.total)) * 100)
+        if completion < self.next_step:
+            return
+        self.next_step = (int(completion) // 10 + 1) * 10
+        print("\n  %s%% Complete" % int(completion))
+        if eta is not None:
+            time_left = datetime.timedelta(0, eta) + datetime.datetime.now()
+            print("  Estimatated Completion Time: %s" % time_left.strftime("%H:%M:%S (%y-%m-%d)"))
+        print(" ")
+
+    def run_started(self, commands):
+        self.emit("run_started", commands=len(commands))
+
+    def device_started(self, device):
+        with self.lock:
+            self.active += 1
+        self.emit("device_started", device=device)
+
+    def connected(self, device, hostname, seconds):
+        self.emit("connected", device=device, hostname=hostname, seconds=round(seconds, 3))
+
+    def command_done(self, device, hostname, command, size, bailed=False):
+        with self.lock:
+            self.done += 1
+            self.bytes += size
+            self.recent.append(time.monotonic())
+        self.emit("command_done", device=device, hostname=hostname, command=command, size=size, bailed=bailed)
+
+    def device_failed(self, device, reason, pending):
+        """``device`` is given up with ``pending`` of its commands not run"""
+        with self.lock:
+            self.active -= 1
+            self.devices_failed += 1
+            self.skipped += pending
+        self.emit("device_failed", device=device, reason=reason)
+
+    def device_done(self, device, hostname, seconds):
+        with self.lock:
+            self.active -= 1
+            self.devices_done += 1
+        self.emit("device_done", device=device, hostname=hostname, seconds=round(seconds, 3))
+
+    def close(self):
+        """Final ``run_done`` event, then close the stream (stdout is left open)"""
+        self.emit("run_done", seconds=round(time.time() - self.started, 3))
+        with self.lock:
+            if self.stream is not None and self.stream is not sys.stdout:
+                self.stream.close()
+            self.stream = None
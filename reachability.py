@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""TCP reachability sweep for C.R.A.SSH
+
+Before any SSH work, ``sweep()`` checks that every device accepts a TCP
+connection on port 22. It starts non-blocking ``connect()`` calls for
+thousands of devices at once and waits on all of them with one selector, so
+a dead device costs the sweep timeout once, in parallel with everything else,
+instead of the full connect timeout (twice with backup credentials) in the
+middle of the run.
+
+Results are kept for ``ttl`` seconds, so back-to-back sweeps (or
+``Switch.verificarConectividad`` calls) for the same device don't reconnect.
+
+"""
+
+import errno
+import selectors
+import socket
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:             # Windows
+    resource = None
+
+IN_PROGRESS = (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY, getattr(errno, "WSAEWOULDBLOCK", -1))
+
+
+def resolve(host, port):
+    """First address for ``host``, ``None`` if it doesn't resolve"""
+    try:
+        family, kind, proto, name, address = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0]
+    except socket.gaierror:
+        return None
+    return family, address
+
+
+class Sweeper(object):
+    """Parallel TCP connect checks with a short-lived result cache
+
+    Args:
+    timeout (float): Seconds a connect may take before the device counts as down
+    ttl (float): Seconds a result is reused
+    concurrency (int): Connects in flight at once (bounded by the open files limit)
+    """
+
+    def __init__(self, timeout=3.0, ttl=60.0, concurrency=2000):
+        self.timeout = timeout
+        self.ttl = ttl
+        self.concurrency = concurrency
+        if resource is not None:
+            # Leave room under the open files limit for everything else the process has open
+            soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+            if soft != resource.RLIM_INFINITY:
+                self.concurrency = max(1, min(concurrency, soft - 256))
+        self.cache = {}             # (host, port) -> (reachable, checked at)
+        self.lock = threading.Lock()
+
+    def sweep(self, hosts, port=22):
+        """Check every host, cached results younger than ``ttl`` are not checked again
+
+        Returns:
+        dict.  host -> True/False
+        """
+        now = time.monotonic()
+        results = {}
+        pending = []
+        with self.lock:
+            for host in hosts:
+                cached = self.cache.get((host, port))
+                if cached is not None and now - cached[1] < self.ttl:
+                    results[host] = cached[0]
+                elif host not in results:
+                    pending.append(host)
+                    results[host] = None
+        if pending:
+            checked = self.connect_all(pending, port)
+            now = time.monotonic()
+            with self.lock:
+                for host, reachable in checked.items():
+                    self.cache[(host, port)] = (reachable, now)
+            results.update(checked)
+        return results
+
+    def reachable(self, host, port=22):
+        return self.sweep([host], port)[host]
+
+    def forget(self, host=None, port=22):
+        """Drop the cached result for ``host`` (or every result)"""
+        with self.lock:
+            if host is None:
+                self.cache.clear()
+            else:
+                self.cache.pop((host, port), None)
+
+    def connect_all(self, hosts, port):
+        # Names are resolved on a few threads (getaddrinfo blocks), addresses pass straight through
+        with ThreadPoolExecutor(max_workers=min(32, len(hosts))) as pool:
+            addresses = dict(zip(hosts, pool.map(lambda host: resolve(host, port), hosts)))
+        results = dict((host, False) for host in hosts)
+        queue = [host for host in hosts if addresses[host] is not None]
+        selector = selectors.DefaultSelector()
+        in_flight = {}              # socket -> (host, deadline)
+        try:
+            while queue or in_flight:
+                # Keep up to ``concurrency`` connects going
+                while queue and len(in_flight) < self.concurrency:
+                    host = queue.pop()
+                    family, address = addresses[host]
+                    try:
+                        sock = socket.socket(family, socket.SOCK_STREAM)
+                    except OSError:
+                        if not in_flight:
+                            # Nothing to wait for that would free a descriptor, count it as down
+                            continue
+                        # Out of descriptors after all: retry once some connects are done
+                        queue.append(host)
+                        break
+                    sock.setblocking(False)
+                    code = sock.connect_ex(address)
+                    if code == 0:
+                        results[host] = True
+                        sock.close()
+                    elif code in IN_PROGRESS:
+                        selector.register(sock, selectors.EVENT_WRITE)
+                        in_flight[sock] = (host, time.monotonic() + self.timeout)
+                    else:
+                        sock.close()
+                if not in_flight:
+                    continue
+                wait = min(deadline for host, deadline in in_flight.values()) - time.monotonic()
+                for key, events in selector.select(max(wait, 0)):
+                    sock = key.fileobj
+                    host, deadline = in_flight.pop(sock)
+                    # Writable means the connect finished, SO_ERROR says whether it worked
+                    results[host] = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0
+                    selector.unregister(sock)
+                    sock.close()
+                now = time.monotonic()
+                for sock, (host, deadline) in list(in_flight.items()):
+                    if deadline <= now:
+                        del in_flight[sock]
+                        selector.unregister(sock)
+                        sock.close()
+        finally:
+            for sock in in_flight:
+                sock.close()
+            selector.close()
+        return results
+
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def shared():
+    """Process-wide ``Sweeper`` (shared cache), created on first use"""
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper = Sweeper()
+        return _sweeper
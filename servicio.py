@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# servicio HTTP (bottle) con el estado de los puertos de cada equipo de swOffal.ini
+# (y en /metrics los tiempos por fase de las sesiones SSH, para Prometheus)
+# las respuestas salen de un cache en memoria que refrescan hilos en segundo plano:
+# un pedido HTTP nunca abre una sesion SSH. Cada respuesta lleva ETag, asi un tablero
+# que pregunta cada pocos segundos recibe 304 (sin cuerpo) mientras nada cambie
+#
+# uso: python servicio.py [puerto]
+
+import hashlib
+import json
+import sys
+import threading
+import time
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer
+
+from ssh import SwVerif
+from planificador import Planificador, intervalosDesdeConfig
+from historial import HistorialPuertos
+from contadores import MotorTasas
+from metrics import PrometheusSink
+from sesiones import obtenerPool
+
+
+def coincideEtag(cabecera, etag):
+    # If-None-Match: "*" o una lista de ETags separados por coma (con o sin espacio),
+    # fuertes o debiles (W/"..."); para GET se compara en forma debil
+    cabecera = cabecera.strip()
+    if cabecera == "*":
+        return True
+    for candidato in cabecera.split(","):
+        candidato = candidato.strip()
+        if candidato.startswith("W/"):
+            candidato = candidato[2:]
+        if candidato == etag:
+            return True
+    return False
+
+
+class CacheEstado(object):
+    # ultimo estado conocido de cada equipo, ya serializado a JSON junto con su ETag
+    # si una consulta no cambia nada (alcanzable, error, puertos) se conservan el cuerpo y el ETag
+    # anteriores: "actualizado" y "tasas" cambian en cada vuelta y harian un ETag nuevo cada vez,
+    # asi que "actualizado" es el momento del ultimo cambio
+    ESTABLES = ("alcanzable", "error", "puertos")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._equipos = dict()      # equipo -> dict con el estado
+        self._respuestas = dict()   # equipo (o None para todos) -> (cuerpo JSON, etag)
+
+    def actualizar(self, equipo, alcanzable, estadoPuertos, error=None, tasasPuertos=None):
+        estado = {
+            "equipo": equipo,
+            "alcanzable": alcanzable,
+            "actualizado": time.time(),
+            "error": error,
+            "puertos": dict((puerto, registro._asdict()) for puerto, registro in estadoPuertos.items()),
+            "tasas": dict((puerto, tasa._asdict()) for puerto, tasa in (tasasPuertos or {}).items()),
+        }
+        with self._lock:
+            anterior = self._equipos.get(equipo)
+            if anterior is not None and all(anterior[clave] == estado[clave] for clave in self.ESTABLES):
+                return
+            self._equipos[equipo] = estado
+            self._respuestas[equipo] = self._serializar(estado)
+            # el resumen general se arma de nuevo en el proximo pedido
+            self._respuestas.pop(None, None)
+
+    def respuesta(self, equipo=None):
+        # devuelve (cuerpo, etag) para un equipo o para todos (equipo=None); None si no se conoce el equipo
+        with self._lock:
+            if equipo is None and None not in self._respuestas:
+                self._respuestas[None] = self._serializar({"equipos": self._equipos})
+            return self._respuestas.get(equipo)
+
+    def _serializar(self, datos):
+        cuerpo = json.dumps(datos, sort_keys=True).encode('utf-8')
+        return cuerpo, '"' + hashlib.sha1(cuerpo).hexdigest() + '"'
+
+
+class Refrescador(object):
+    # mantiene el cache al dia: el planificador consulta cada equipo cada "intervalo" segundos
+    # (de su seccion en swOffal.ini, o INTERVALO si no lo tiene)
+    INTERVALO = 60              # segundos entre consultas a un mismo equipo
+    HILOS = 16                  # equipos consultados a la vez
+
+    def __init__(self, verif, cache, intervalo=None, hilos=None):
+        self.verif = verif          # SwVerif ya cargado (configuracion y log)
+        self.cache = cache
+        self.intervalo = intervalo or self.INTERVALO
+        self.hilos = hilos or self.HILOS
+        self.planificador = None
+
+    def consultar(self, equipo):
+        trabajador = self.verif.trabajador()
+        try:
+            alcanzable = trabajador.consultarEquipo(equipo)
+            self.cache.actualizar(equipo, alcanzable, trabajador.estadoPuertos, tasasPuertos=trabajador.tasasPuertos)
+        except Exception as e:
+            self.verif.logger.error("(refrescar) error consultando " + equipo + ": " + str(e), exc_info=True)
+            self.cache.actualizar(equipo, False, dict(), str(e))
+
+    def iniciar(self):
+        # los equipos aparecen desde el principio, con alcanzable en null hasta la primera consulta
+        # un barrido TCP/22 de todos a la vez marca desde ya los que no responden
+        alcance = self.verif.barrerAlcance()
+        for equipo in self.verif.equipos:
+            if not alcance[equipo]:
+                self.cache.actualizar(equipo, False, dict(), "no responde en TCP/22")
+            elif self.cache.respuesta(equipo) is None:
+                self.cache.actualizar(equipo, None, dict())
+        intervalos = intervalosDesdeConfig(self.verif.config, self.verif.equipos, self.intervalo)
+        self.planificador = Planificador(intervalos, self.consultar, hilos=self.hilos)
+        return self.planificador.iniciar()
+
+    def parar(self):
+        if self.planificador is not None:
+            self.planificador.parar()
+
+
+class ServidorHilos(ThreadingMixIn, WSGIServer):
+    # wsgiref atendiendo cada cliente en su propio hilo (el de fabrica atiende de a uno)
+    daemon_threads = True
+    request_queue_size = 512
+
+
+def crearApp(cache, refrescador=None, metricas=None):
+    # bottle se importa recien aca, importar el modulo sigue siendo barato
+    from bottle import Bottle, request, response, HTTPResponse
+    app = Bottle()
+
+    def responder(entrada):
+        if entrada is None:
+            return HTTPResponse(status=404, body=json.dumps({"error": "equipo desconocido"}),
+                                headers={"Content-Type": "application/json"})
+        cuerpo, etag = entrada
+        response.set_header("ETag", etag)
+        response.set_header("Cache-Control", "no-cache")
+        if coincideEtag(request.get_header("If-None-Match", ""), etag):
+            response.status = 304
+            return b""
+        response.content_type = "application/json"
+        return cuerpo
+
+    @app.get("/estado")
+    def estadoGeneral():
+        return responder(cache.respuesta())
+
+    @app.get("/estado/<equipo>")
+    def estadoEquipo(equipo):
+        return responder(cache.respuesta(equipo))
+
+    @app.get("/historial/<equipo>/<puerto:path>")
+    def historialPuerto(equipo, puerto):
+        # muestras del puerto en los ultimos ?segundos= (una hora por defecto)
+        if refrescador is None or refrescador.verif.historial is None:
+            return {"muestras": []}
+        try:
+            segundos = int(request.query.get("segundos", 3600))
+        except ValueError:
+            segundos = None
+        if segundos is None or not segundos > 0:
+            return HTTPResponse(status=400, body=json.dumps({"error": "segundos debe ser un entero mayor a cero"}),
+                                headers={"Content-Type": "application/json"})
+        muestras = refrescador.verif.historial.ultimos(equipo, puerto, segundos)
+        return {"equipo": equipo, "puerto": puerto, "muestras": [m._asdict() for m in muestras]}
+
+    @app.get("/alertas")
+    def alertas():
+        # puertos cuyo error por segundo supero el umbral (o que flapearon) en la ultima consulta
+        if refrescador is None or refrescador.verif.motorTasas is None:
+            return {"alertas": []}
+        return {"alertas": [tasa._asdict() for tasa in refrescador.verif.motorTasas.alertas()]}
+
+    @app.get("/planificador")
+    def metricasPlanificador():
+        # atraso de la planificacion, vueltas salteadas y ocupacion de los hilos
+        if refrescador is None or refrescador.planificador is None:
+            return {}
+        return refrescador.planificador.metricas()
+
+    @app.get("/metrics")
+    def metricasSesiones():
+        # tiempos por fase de las sesiones SSH (tcp, auth, enable, comandos...) en formato Prometheus
+        response.content_type = "text/plain; version=0.0.4"
+        return metricas.exposition() if metricas is not None else ""
+
+    return app
+
+
+def main():
+    puerto = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+    verif = SwVerif()
+    if not verif.cargar():
+        print("No se pudo cargar la configuracion")
+        sys.exit(1)
+    verif.historial = HistorialPuertos()
+    verif.motorTasas = MotorTasas()
+    metricas = PrometheusSink()
+    obtenerPool().metricas = metricas
+    cache = CacheEstado()
+    refrescador = Refrescador(verif, cache)
+    try:
+        refrescador.iniciar()
+    except ValueError as e:
+        print("Configuracion invalida: " + str(e))
+        sys.exit(1)
+    crearApp(cache, refrescador, metricas).run(host="0.0.0.0", port=puerto, server="wsgiref", server_class=ServidorHilos, quiet=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# pool de sesiones SSH persistentes
+# cada sesion es un objeto claseCrassh ya conectado y en modo privilegiado,
+# se reutiliza mientras siga sana en lugar de abrir una conexion nueva por consulta
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from claseCrassh import claseCrassh
+from bastion import JumpHosts
+
+
+class PoolSesiones(object):
+    MAXIMO_SESIONES = 50        # tope de sesiones abiertas (libres + en uso)
+    TTL_INACTIVA = 300          # segundos que una sesion libre puede quedar sin usarse
+    INTERVALO_KEEPALIVE = 30    # segundos entre keepalives del transporte
+    ESPERA_LIBRE = 60           # segundos que se espera un lugar cuando se llego al tope
+
+    def __init__(self, maximo=None, ttl=None, keepalive=None):
+        self.maximo = maximo or self.MAXIMO_SESIONES
+        self.ttl = ttl or self.TTL_INACTIVA
+        self.keepalive = keepalive or self.INTERVALO_KEEPALIVE
+        self.logger = logging.getLogger(__name__)
+        # sesiones libres ordenadas de la menos a la mas recientemente usada (LRU)
+        # clave -> (conexion, momento en que se devolvio)
+        self._libres = OrderedDict()
+        self._enUso = dict()        # id(conexion) -> clave
+        self._cond = threading.Condition()
+        self._saltos = dict()       # (bastiones, usuario, secreto, canales) -> bastion.JumpHosts compartido
+        self.metricas = None        # sumidero de tiempos por fase (metrics.py) para las sesiones nuevas
+
+    def _clave(self, equipo, usuario, password, enable, enablePassword, perfil, salto):
+        # las credenciales forman parte de la clave, pero no se guardan en claro
+        # (el perfil de transporte tambien: una sesion "legacy-ios" no sirve para quien pidio "fast-lan")
+        secreto = hashlib.sha256((password + "\0" + enablePassword).encode('utf-8')).hexdigest()
+        return (equipo, usuario, secreto, bool(enable), perfil, salto.specs if salto else None)
+
+    def _totalAbiertas(self):
+        return len(self._libres) + len(self._enUso)
+
+    def _sacarLibre(self, clave):
+        # saca una sesion libre para la clave (la ultima devuelta), o None
+        for k in reversed(self._libres):
+            if k[0] == clave:
+                conexion, devuelta = self._libres.pop(k)
+                return conexion
+        return None
+
+    def obtener(self, equipo, usuario, password, enable=False, enablePassword="", perfil=None, salto=None):
+        # devuelve una sesion lista para usar (claseCrassh conectado) o False si no se pudo conectar
+        # perfil: nombre de un perfil de transporte SSH (ver profiles.py), None usa los de paramiko
+        # salto: bastion.JumpHosts por el que se llega al equipo (ver salto()), None conecta directo
+        clave = self._clave(equipo, usuario, password, enable, enablePassword, perfil, salto)
+        while True:
+            with self._cond:
+                self._purgarVencidas()
+                conexion = self._sacarLibre(clave)
+                if conexion is None:
+                    # hay que abrir una nueva: hacemos lugar o esperamos a que se libere una
+                    if self._totalAbiertas() >= self.maximo:
+                        self._desalojarLRU()
+                    if self._totalAbiertas() >= self.maximo:
+                        if not self._cond.wait(self.ESPERA_LIBRE):
+                            self.logger.error("(obtener) no hay lugar en el pool para " + equipo)
+                            return False
+                        continue
+                # reservo el lugar antes de salir del lock, conectar puede tardar
+                reserva = object() if conexion is None else conexion
+                self._enUso[id(reserva)] = clave
+            if conexion is not None:
+                # verificamos que la sesion siga viva antes de entregarla
+                if conexion.is_alive():
+                    self.logger.debug("(obtener) reutilizando sesion a " + equipo)
+                    return conexion
+                self.logger.info("(obtener) sesion a " + equipo + " caida, se descarta")
+                self._liberar(reserva, conexion)
+                continue
+            try:
+                conexion = self._conectar(equipo, usuario, password, enable, enablePassword, perfil, salto)
+            except Exception as e:
+                # connect() puede fallar despues del login (invoke_shell, handshake): el lugar se libera igual
+                self.logger.error("(obtener) error al conectar a " + equipo + ": " + str(e), exc_info=True)
+                conexion = False
+            with self._cond:
+                del self._enUso[id(reserva)]
+                if conexion:
+                    self._enUso[id(conexion)] = clave
+                self._cond.notify()
+            return conexion
+
+    def _conectar(self, equipo, usuario, password, enable, enablePassword, perfil, salto):
+        conexion = claseCrassh()
+        conexion.metrics = self.metricas
+        try:
+            nombre = conexion.connect(equipo, usuario, password, enable, enablePassword, profile=perfil, jump=salto)
+        except Exception:
+            # no dejar abierto el transporte (ni el canal del bastion) de un login a medias
+            if conexion.remote_conn_pre:
+                self._cerrar(conexion)
+            raise
+        if not nombre:
+            return False
+        # keepalive del transporte para que la sesion no muera por inactividad
+        conexion.remote_conn_pre.get_transport().set_keepalive(self.keepalive)
+        self.logger.debug("(conectar) nueva sesion a " + equipo + " (" + nombre + ")")
+        return conexion
+
+    def devolver(self, conexion, descartar=False):
+        # devuelve una sesion al pool; si se descarta (o el pool esta lleno de libres) se cierra
+        with self._cond:
+            clave = self._enUso.pop(id(conexion), None)
+            if clave is not None and not descartar:
+                self._libres[(clave, id(conexion))] = (conexion, time.monotonic())
+                conexion = None
+            self._cond.notify()
+        if conexion is not None:
+            self._cerrar(conexion)
+
+    def _liberar(self, reserva, conexion):
+        with self._cond:
+            self._enUso.pop(id(reserva), None)
+            self._cond.notify()
+        self._cerrar(conexion)
+
+    def _desalojarLRU(self):
+        # cierra la sesion libre usada hace mas tiempo (se llama con el lock tomado)
+        if self._libres:
+            k, (conexion, devuelta) = self._libres.popitem(last=False)
+            self.logger.debug("(desalojar) cerrando sesion LRU a " + k[0][0])
+            self._cerrar(conexion)
+
+    def _purgarVencidas(self):
+        # cierra las sesiones libres que superaron el TTL (se llama con el lock tomado)
+        limite = time.monotonic() - self.ttl
+        for k in list(self._libres):
+            conexion, devuelta = self._libres[k]
+            if devuelta < limite:
+                del self._libres[k]
+                self.logger.debug("(purgar) sesion inactiva a " + k[0][0])
+                self._cerrar(conexion)
+
+    def purgar(self):
+        # para llamar periodicamente si el pool queda sin uso por mucho tiempo
+        with self._cond:
+            self._purgarVencidas()
+            self._cond.notify_all()
+
+    def equiposConSesion(self, equipos):
+        # cuales de los equipos tienen una sesion libre con el transporte activo (no toca la red):
+        # esos atienden SSH, no hace falta probarles el puerto 22 antes de consultarlos
+        equipos = set(equipos)
+        with self._cond:
+            libres = [(k[0][0], conexion) for k, (conexion, devuelta) in self._libres.items() if k[0][0] in equipos]
+        vivos = set()
+        for equipo, conexion in libres:
+            transporte = conexion.remote_conn_pre.get_transport()
+            if transporte is not None and transporte.is_active():
+                vivos.add(equipo)
+        return vivos
+
+    def salto(self, bastiones, usuario, password, canales=None):
+        # JumpHosts compartido para esa lista de bastiones: todas las sesiones que pasan por ellos
+        # usan el mismo transporte autenticado (uno por bastion)
+        secreto = hashlib.sha256(password.encode('utf-8')).hexdigest()
+        clave = (tuple(bastiones), usuario, secreto, canales)
+        with self._cond:
+            salto = self._saltos.get(clave)
+            if salto is None:
+                salto = self._saltos[clave] = JumpHosts(bastiones, usuario, password, canales)
+            return salto
+
+    def cerrarTodo(self):
+        # cierra todas las sesiones libres (las que estan en uso se cierran al devolverlas)
+        with self._cond:
+            while self._libres:
+                k, (conexion, devuelta) = self._libres.popitem(last=False)
+                self._cerrar(conexion)
+            self._cond.notify_all()
+            for salto in self._saltos.values():
+                salto.close()
+
+    def _cerrar(self, conexion):
+        try:
+            conexion.disconnect()
+        except Exception as e:
+            self.logger.debug("(cerrar) error al cerrar la sesion: " + str(e))
+
+
+_pool = None
+_poolLock = threading.Lock()
+
+
+def obtenerPool():
+    # pool compartido por SwVerif y Switch, se crea en el primer uso
+    global _pool
+    with _poolLock:
+        if _pool is None:
+            _pool = PoolSesiones()
+        return _pool
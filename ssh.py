@@ -2,16 +2,19 @@
 # coding=utf-8
 
 # requisitos: 
-# bottle
+# paramiko (recien al conectar), bottle solo para servicio.py
 
 try:
     import logging
     from claseCrassh import claseCrassh
+    from sesiones import obtenerPool
+    import reachability
+    from inventario import Inventario, parsearFiltro
+    from interfaces import parsearInterfaz, parsearInterfaces, indexarPorNombre, normalizarNombre
     import logging.handlers
     import itertools
     import configparser
     import os, sys
-    from bottle import route, run
 except Exception as e:
     print("No se pudo importar un modulo requerido: " + str(e))
 
@@ -19,8 +22,15 @@ except Exception as e:
 
 class SwVerif(object):       # en Python todas las clases heredan de object
     puertos = []
-    conexion = claseCrassh()
+    conexion = None             # sesion prestada por el pool mientras esta conectado
+    usarPool = True             # False: abre y cierra una sesion propia en cada conexion
+    historial = None            # historial.HistorialPuertos donde se guarda cada muestra (opcional)
+    motorTasas = None           # contadores.MotorTasas que calcula errores por segundo (opcional)
     estadoPuertos = dict()
+    perfil = None               # perfil de transporte SSH (profiles.py), lo lee leerCredenciales
+    salto = None                # bastion.JumpHosts si el equipo se alcanza por bastiones, idem
+    UMBRAL_MASIVO = 8           # desde cuantos puertos conviene un solo "show interfaces" para todo el equipo
+    umbralMasivo = UMBRAL_MASIVO
     _ARCHIVO_CONFIG = 'swOffal.ini'
     DIRECTORIO_CONFIG = "config"
     LOG_FILENAME = "swOffal.log"
@@ -30,21 +40,31 @@ class SwVerif(object):       # en Python todas las clases heredan de object
 
     def __init__(self):         # este es el constructor, el metodo que se llama al instanciar el objeto
         self.config = configparser.ConfigParser()
+        # estado propio de cada objeto, asi varios SwVerif pueden trabajar en paralelo
+        self.puertos = []
+        self.estadoPuertos = dict()
+        self.tasasPuertos = dict()
+    def trabajador(self):
+        # devuelve un SwVerif nuevo que comparte la configuracion y el log ya cargados,
+        # para consultar otro equipo en paralelo sin pisar las credenciales ni los puertos de este
+        nuevo = SwVerif()
+        nuevo.config = self.config
+        nuevo.logger = self.logger
+        nuevo.equipos = self.equipos
+        nuevo.historial = self.historial
+        nuevo.motorTasas = self.motorTasas
+        return nuevo
     def cargar(self):
         respuesta = False
         try:
             # usaremos nuestro propio log
             self.logger = logging.getLogger(__name__)
             self.logger.setLevel(logging.DEBUG)
-            # obtengo el directorio actual del archivo python
-            dir_path = os.path.dirname(os.path.realpath(__file__))
-            # cambio el directorio para que sea el del archivo python
-            os.chdir(dir_path)
-            # creamos los logs en un directorio aparte
-            os.chdir(self.DIRECTORIO_LOG)        
+            # creamos los logs en un directorio aparte, junto al archivo python
+            # (rutas absolutas: no se cambia el directorio actual del proceso)
             # rotacion de logs (notar que indico el tamaño y cuantos se retienen)
             handler = logging.handlers.RotatingFileHandler(
-            self.LOG_FILENAME, maxBytes=self.TAMANIO_LOG, backupCount=self.CUANTOS_LOGS_GUARDO)
+            self.ruta(self.DIRECTORIO_LOG, self.LOG_FILENAME), maxBytes=self.TAMANIO_LOG, backupCount=self.CUANTOS_LOGS_GUARDO)
             # formato de los mensajes de log
             formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
             handler.setFormatter(formatter)
@@ -54,19 +74,14 @@ class SwVerif(object):       # en Python todas las clases heredan de object
         except Exception as e:
             print("No se pudo crear el objeto de logging: " + str(e))         
         try:
-            # eso es para que pueda abrir el archivo INI con ruta relativa
-            dir_path = os.path.dirname(os.path.realpath(__file__))
-            os.chdir(dir_path)
-            os.chdir(self.DIRECTORIO_CONFIG)
             # hago mis validaciones primero
             if not self.verificarExisteArchivo(self._ARCHIVO_CONFIG):
                 raise FileNotFoundError
             if not self.verificarAccesoLecturaArchivo(self._ARCHIVO_CONFIG):
                 raise IOError
             # leemos el archivo y validamos que lo haya encontrado (vuelvo a permitir excepciones en config.read)
-            if (len(self.config.read(self._ARCHIVO_CONFIG))==0):
+            if (len(self.config.read(self.ruta(self.DIRECTORIO_CONFIG, self._ARCHIVO_CONFIG)))==0):
                 self.logger.error('No se pudo abrir el archivo')
-            self.config.read(self._ARCHIVO_CONFIG)
             # ahora leemos las secciones del archivo
             self.equipos = self.config.sections()
             respuesta = True
@@ -90,84 +105,157 @@ class SwVerif(object):       # en Python todas las clases heredan de object
             self.logger.error('Error inesperado ' + str(e1) , exc_info=True)            
         finally:
             return(respuesta)
+    def cargarInventario(self, ruta, filtro=""):
+        # toma los equipos del inventario (inventario.py) que cumplen el filtro, por ejemplo
+        # "sitio=central,modelo=WS-C2960*,etiqueta=core", en lugar de todas las secciones del ini
+        # los que no tienen seccion usan [DEFAULT] (credenciales); perfil, bastion y puertos del
+        # inventario completan lo que la seccion no diga. Devuelve la lista de equipos
+        etiquetas, seleccion = parsearFiltro(filtro)
+        inventario = Inventario(ruta, crear=False)
+        try:
+            equipos = inventario.equipos(etiquetas, **seleccion)
+        finally:
+            inventario.cerrar()
+        for equipo in equipos:
+            if not self.config.has_section(equipo['ip']):
+                self.config.add_section(equipo['ip'])
+            for clave in ('perfil', 'bastion', 'puertos'):
+                if equipo[clave] and not self.config.has_option(equipo['ip'], clave):
+                    self.config.set(equipo['ip'], clave, equipo[clave])
+        self.equipos = [equipo['ip'] for equipo in equipos]
+        self.logger.info("(cargarInventario) " + str(len(self.equipos)) + " equipos de " + ruta + " con filtro '" + filtro + "'")
+        return(self.equipos)
+    def ruta(self, directorio, archivo):
+        # ruta absoluta de un archivo en un directorio junto al archivo python (logs, config)
+        return os.path.join(os.path.dirname(os.path.realpath(__file__)), directorio, archivo)
     def leerCredenciales(self, equipo):
         self.__username = self.config.get(equipo, 'username')
         self.__password = self.config.get(equipo, 'password')
+        # perfil de transporte SSH del equipo (o de todos, en [DEFAULT]); ver profiles.py
+        self.perfil = self.config.get(equipo, 'perfil', fallback=None)
+        # bastiones por los que se llega al equipo: "bastion = host1, usuario@host2:2222" (ver bastion.py)
+        # con las credenciales del equipo salvo bastion_usuario / bastion_password
+        self.salto = None
+        bastiones = self.config.get(equipo, 'bastion', fallback="")
+        if bastiones.strip():
+            self.salto = obtenerPool().salto(
+                [b.strip() for b in bastiones.split(',')],
+                self.config.get(equipo, 'bastion_usuario', fallback=self.__username),
+                self.config.get(equipo, 'bastion_password', fallback=self.__password),
+                self.config.getint(equipo, 'bastion_canales', fallback=None))
     def cargarPuertosDesdeArchivo(self, equipo):
         # recibe un nombre de equipo y trae los puertos que aparecen 
         # para ese equipo en el archivo de configuracion
         self.puertos = [e.strip() for e in self.config.get(equipo, "puertos").split(',')]
+        # cada equipo puede cambiar el umbral para la consulta masiva (umbral_masivo = 0 la fuerza siempre)
+        self.umbralMasivo = self.config.getint(equipo, "umbral_masivo", fallback=self.UMBRAL_MASIVO)
     def agregarPuerto(self, nombrePuerto):
         print(self.puertos)
         # recibe un nombre de puerto y lo agrega a la lista de verificacion
         self.puertos.append(nombrePuerto)
     def conectar(self, equipo):
-        # abre la conexion SSH al equipo, usando el usuario y pass que leyó del archivo de config
-        nombre = self.conexion.connect(equipo, self.__username, self.__password)
-        self.nombreEquipo = nombre
-        if (nombre==""):
-            return(False)
+        # toma del pool una sesion SSH al equipo (o abre una nueva), usando el usuario y pass que leyó del archivo de config
+        self.equipo = equipo
+        if self.usarPool:
+            self.conexion = obtenerPool().obtener(equipo, self.__username, self.__password, perfil=self.perfil, salto=self.salto)
         else:
-            return(True)
+            self.conexion = claseCrassh()
+            if not self.conexion.connect(equipo, self.__username, self.__password, profile=self.perfil, jump=self.salto):
+                self.conexion = False
+        if not self.conexion:
+            self.conexion = None
+            self.nombreEquipo = ""
+            return(False)
+        self.nombreEquipo = self.conexion.hostname
+        return(True)
     def estaConectado(self):
         # devuelve True si está conectado (o False sino)
-        return(self.conexion)
+        return(self.conexion is not None)
     def verificarPuertos(self):
+        # con pocos puertos pregunta uno por uno, con muchos trae todas las interfaces de una vez
+        if len(self.puertos) >= self.umbralMasivo:
+            self.verificarPuertosMasivo()
+        else:
+            self.verificarPuertosIndividual()
+    def verificarPuertosMasivo(self):
+        # un solo "show interfaces" para todo el equipo, se separa por interfaz y se guarda
+        # el estado de cada puerto pedido
+        output = self.conexion.send_command("show interfaces", self.nombreEquipo)
+        registros = indexarPorNombre(parsearInterfaces(output))
+        for puerto in self.puertos:
+            registro = registros.get(normalizarNombre(puerto))
+            if registro is None:
+                self.logger.error("(verificarPuertosMasivo) no se encontro " + puerto + " en la salida de " + self.nombreEquipo)
+                continue
+            self.guardarEstado(puerto, registro)
+    def verificarPuertosIndividual(self):
         # recorre los puertos de la lista y ejecuta el comando en cada uno
-        # luego procesa el estado y lo guarda 
+        # luego procesa el estado (ver interfaces.EstadoInterfaz) y lo guarda 
         for puerto in self.puertos:
             output = self.conexion.send_command("Show interface " + puerto, self.nombreEquipo)
-            words = output.split()
-            gig_ind = words.index(puerto)+6 
-            gig_fin = (gig_ind + 3)
-            rel_ind = words.index('reliability')
-            rel_fin = (rel_ind + 2)
-            txl_ind = words.index('txload')
-            txl_fin = (txl_ind + 2)
-            rxl_ind = words.index('rxload')
-            rxl_fin = (rxl_ind +2)
-            crc_ind = words.index('CRC,')
-            crc_men = (crc_ind - 4)
-            col_ind = words.index('collisions,')
-            col_men = (col_ind - 4)
-            stringSw = ' '.join(words[gig_ind:gig_fin])
-            stringSw1 = ' '.join(words[rel_ind:rel_fin])
-            stringSw3 = ' '.join(words[crc_men:crc_ind+1])
-            stringSw4 = ' '.join(words[col_men:col_ind+1])
-            txl_texto = ' '.join(words[txl_ind:txl_fin])
-            rxl_texto = ' '.join(words[rxl_ind:rxl_fin])    
-            txl_indb = txl_texto.index('/')
-            rxl_indb = rxl_texto.index('/')
-            txl_indv = txl_texto.index(' ')
-            rxl_indv = rxl_texto.index(' ')
-            txl_dividendo = int(''.join(txl_texto[txl_indb-1:txl_indb]))
-            txl_divisor = int(''.join(rxl_texto[txl_indb+1:]))
-            rxl_dividendo = int(''.join(txl_texto[rxl_indb-1:rxl_indb]))
-            rxl_divisor = int(''.join(rxl_texto[rxl_indb+1:]))
-            resultado_txl = txl_dividendo/txl_divisor
-            resultado_rxl = rxl_dividendo/rxl_divisor
-            
-            stringSw2 = ('txload %'+str("{0:.3f}".format(resultado_txl)) + ', rxload %'+str("{0:.3f}".format(resultado_rxl)))
-
-
-
-            self.estadoPuertos[puerto] = (stringSw, stringSw1, stringSw2, stringSw3, stringSw4)
+            registro = parsearInterfaz(output)
+            if registro is None:
+                self.logger.error("(verificarPuertos) no se pudo interpretar la salida de " + puerto + " en " + self.nombreEquipo)
+                continue
+            self.guardarEstado(puerto, registro)
+    def guardarEstado(self, puerto, registro):
+        # ultimo estado del puerto, la muestra al historial y las tasas de error si estan configurados
+        self.estadoPuertos[puerto] = registro
+        if self.historial is not None:
+            self.historial.agregar(self.equipo, puerto, registro)
+        if self.motorTasas is not None:
+            tasa = self.motorTasas.procesar(self.equipo, puerto, registro)
+            self.tasasPuertos[puerto] = tasa
+            if tasa.alerta:
+                self.logger.warning("(guardarEstado) alerta en " + self.equipo + " " + puerto + ": " + ", ".join(tasa.motivos))
 
+    def barrerAlcance(self, equipos=None):
+        # verifica TCP/22 de todas las secciones (o de equipos) a la vez, antes de cualquier SSH
+        # devuelve equipo -> True/False; el resultado queda en cache y lo usa consultarEquipo
+        # (los equipos detras de un bastion no se pueden verificar directo, quedan como alcanzables,
+        # y los que ya tienen una sesion viva en el pool tampoco se prueban: atienden SSH)
+        equipos = self.equipos if equipos is None else equipos
+        conSesion = obtenerPool().equiposConSesion(equipos) if self.usarPool else set()
+        directos = [e for e in equipos if not self.config.get(e, 'bastion', fallback="").strip() and e not in conSesion]
+        resultado = reachability.shared().sweep(directos)
+        return dict((e, resultado.get(e, True)) for e in equipos)
+    def consultarEquipo(self, equipo):
+        # ciclo completo para un equipo: credenciales, puertos, conexion, verificacion y desconexion
+        # devuelve True si se pudo conectar
+        if not self.barrerAlcance([equipo])[equipo]:
+            # no atiende en el puerto 22: no se espera el timeout de SSH (se vuelve a probar cuando venza el cache)
+            self.logger.error("(consultarEquipo) " + equipo + " no responde en TCP/22")
+            return(False)
+        self.leerCredenciales(equipo)
+        self.cargarPuertosDesdeArchivo(equipo)
+        self.estadoPuertos = dict()
+        self.tasasPuertos = dict()
+        if not self.conectar(equipo):
+            self.logger.error("(consultarEquipo) no se pudo conectar a " + equipo)
+            return(False)
+        try:
+            self.verificarPuertos()
+        finally:
+            self.desconectar()
+        return(True)
     def verEstadoPuertos(self):
         # muestra el estado de cada puerto
         for puerto in self.puertos:
             print("Estado de: " + puerto)
             print(self.estadoPuertos[puerto])
     def desconectar(self):
-        # cierra la sesion SSH
-        self.conexion.disconnect()
+        # devuelve la sesion SSH al pool (queda abierta para la proxima consulta)
+        if self.conexion is None:
+            return
+        if self.usarPool:
+            obtenerPool().devolver(self.conexion)
+        else:
+            self.conexion.disconnect()
+        self.conexion = None
     def verificarExisteArchivo(self, archivo):
         # notar que la excepcion ocurre solamente si hubo un fallo al tratar de determinar la existencia
         try:
-            dir_path = os.path.dirname(os.path.realpath(__file__))
-            os.chdir(dir_path)
-            os.chdir(self.DIRECTORIO_CONFIG)
-            respuesta = os.access(archivo, os.F_OK)
+            respuesta = os.access(self.ruta(self.DIRECTORIO_CONFIG, archivo), os.F_OK)
         except Exception as e:
             self.logger.error('(verificarExiste): Error al intentar determinar la existencia del archivo: ' + str(e) , exc_info=True)
             respuesta = False
@@ -175,10 +263,7 @@ class SwVerif(object):       # en Python todas las clases heredan de object
     def verificarAccesoLecturaArchivo(self, archivo):
         # notar que la excepcion ocurre solamente si hubo un fallo al tratar de determinar la posibilidad de lectura        
         try:
-            dir_path = os.path.dirname(os.path.realpath(__file__))
-            os.chdir(dir_path)
-            os.chdir(self.DIRECTORIO_CONFIG)
-            respuesta = os.access(archivo, os.R_OK)
+            respuesta = os.access(self.ruta(self.DIRECTORIO_CONFIG, archivo), os.R_OK)
         except Exception as e:
             self.logger.error('(verificarAccesoLectura): Error al intentar determinar la existencia del archivo: ' + str(e) , exc_info=True)
             respuesta = False
@@ -186,10 +271,7 @@ class SwVerif(object):       # en Python todas las clases heredan de object
     def verificarAccesoEscrituraArchivo(self, archivo):
         # notar que la excepcion ocurre solamente si hubo un fallo al tratar de determinar la posibilidad de escritura        
         try:
-            dir_path = os.path.dirname(os.path.realpath(__file__))
-            os.chdir(dir_path)
-            os.chdir(self.DIRECTORIO_CONFIG)
-            respuesta = os.access(archivo, os.W_OK)
+            respuesta = os.access(self.ruta(self.DIRECTORIO_CONFIG, archivo), os.W_OK)
         except Exception as e:
             self.logger.error('(verificarAccesoEscritura): Error al intentar determinar la existencia del archivo: ' + str(e) , exc_info=True)
             respuesta = False
@@ -197,18 +279,10 @@ class SwVerif(object):       # en Python todas las clases heredan de object
     
 
 
-prueba = SwVerif()
-"prueba.cargar()"
-
-        
-        
-
-""" 
-# prueba.agregarPuerto("GigabitEthernet0/4")
-# prueba.agregarPuerto("GigabitEthernet0/5")
-prueba.agregarPuerto("GigabitEthernet0/11")
-prueba.conectar()
-prueba.verificarPuertos()
-prueba.verEstadoPuertos()
-prueba.desconectar()
-"""
+# prueba manual (solo si se ejecuta el archivo, importar el modulo no conecta ni crea objetos)
+if __name__ == "__main__":
+    prueba = SwVerif()
+    if prueba.cargar():
+        for equipo in prueba.equipos:
+            if prueba.consultarEquipo(equipo):
+                prueba.verEstadoPuertos()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""Content-addressed store of command outputs for C.R.A.SSH
+
+Nightly runs of the same command set return, for the most part, the same
+bytes as the night before. ``-S dir`` keeps every output in a store instead:
+
+* volatile lines (uptime, timestamps, config byte counts...) are masked,
+* the masked output is hashed (SHA-256) and saved once under
+  ``dir/blobs/<2 hex>/<hash>.gz``, a blob already there is not written again,
+* every run writes a manifest, ``dir/runs/<run>.json``, mapping device and
+  command to the hash. The manifest also keeps the lines masked out of each
+  output (and where they were), so this run's uptime, clock or config byte
+  count can still be read back: ``show`` returns the output as received.
+
+Finding what changed between two runs only compares two manifests::
+
+    python store.py dir runs                      # list the runs
+    python store.py dir diff 240101-020000        # what changed since that run (vs the latest)
+    python store.py dir show 240101-020000 10.0.0.1 "show run"
+
+"""
+
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+# Lines that change on every run without anything having changed on the device
+VOLATILE = re.compile(
+    r'^(.*\buptime is\b.*'
+    r'|System returned to ROM\b.*'
+    r'|System restarted at\b.*'
+    r'|! Last configuration change at\b.*'
+    r'|! NVRAM config last updated at\b.*'
+    r'|Current configuration : \d+ bytes'
+    r'|Building configuration\.\.\.'
+    r'|ntp clock-period \d+'
+    r'|\*?\d{2}:\d{2}:\d{2}\.\d+ \w+ \w{3} \w{3} +\d+ \d{4})\s*$', re.M)
+MASK = "<masked>"
+
+
+def mask(output):
+    """``output`` with every volatile line replaced by ``<masked>``"""
+    return VOLATILE.sub(MASK, output)
+
+
+def split(output):
+    """Masked ``output`` plus what was masked out
+
+    Returns:
+    tuple.  (masked text, ``[[offset in the masked text, original text], ...]``)
+    """
+    masked = []
+    volatile = []
+    length = 0
+    pos = 0
+    for match in VOLATILE.finditer(output):
+        masked.append(output[pos:match.start()])
+        length += match.start() - pos
+        volatile.append([length, match.group(0)])
+        masked.append(MASK)
+        length += len(MASK)
+        pos = match.end()
+    masked.append(output[pos:])
+    return "".join(masked), volatile
+
+
+def restore(masked, volatile):
+    """The original output back from ``split()``'s two halves"""
+    parts = []
+    pos = 0
+    for offset, original in volatile:
+        parts.append(masked[pos:offset])
+        parts.append(original)
+        pos = offset + len(MASK)
+    parts.append(masked[pos:])
+    return "".join(parts)
+
+
+class OutputStore(object):
+    """Deduplicated blobs plus one manifest per run
+
+    Args:
+    root (str): Store directory, created if needed
+    run (str): Name of the run being recorded, ``YYMMDD-HHMMSS`` by default
+    """
+
+    def __init__(self, root, run=None):
+        self.root = root
+        self.run = run or datetime.datetime.now().strftime("%y%m%d-%H%M%S")
+        self.outputs = {}           # device -> {command: hash}
+        self.hostnames = {}         # device -> hostname
+        self.volatile = {}          # device -> {command: what split() masked out}
+        self.new_blobs = 0
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+        os.makedirs(os.path.join(root, "runs"), exist_ok=True)
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, "blobs", digest[:2], digest + ".gz")
+
+    def put(self, device, hostname, command, output):
+        """Store one output, returns its hash (of the masked text)"""
+        masked, volatile = split(output)
+        data = masked.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written aside and renamed, two workers storing the same blob can't leave half a file
+            tmp = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+            with open(tmp, 'wb') as f:
+                f.write(gzip.compress(data))
+            os.replace(tmp, path)
+            with self.lock:
+                self.new_blobs += 1
+        with self.lock:
+            self.outputs.setdefault(device, {})[command] = digest
+            self.hostnames[device] = hostname
+            if volatile:
+                self.volatile.setdefault(device, {})[command] = volatile
+        return digest
+
+    def get(self, digest):
+        """Masked output stored under ``digest``"""
+        with open(self.blob_path(digest), 'rb') as f:
+            return gzip.decompress(f.read()).decode("utf-8")
+
+    def output(self, run, device, command):
+        """Output of ``command`` on ``device`` in ``run`` as it was received, volatile lines included"""
+        manifest = self.manifest(run)
+        masked = self.get(manifest["outputs"][device][command])
+        return restore(masked, manifest.get("volatile", {}).get(device, {}).get(command, []))
+
+    def close(self):
+        """Write this run's manifest (atomically)"""
+        with self.lock:
+            manifest = {"run": self.run, "time": time.time(), "hostnames": self.hostnames, "outputs": self.outputs,
+                        "volatile": self.volatile}
+        path = os.path.join(self.root, "runs", self.run + ".json")
+        tmp = path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+
+    def runs(self):
+        """Names of the recorded runs, oldest first"""
+        return sorted(name[:-5] for name in os.listdir(os.path.join(self.root, "runs")) if name.endswith(".json"))
+
+    def manifest(self, run):
+        with open(os.path.join(self.root, "runs", run + ".json"), 'r') as f:
+            return json.load(f)
+
+    def changed(self, since, run=None):
+        """What changed between run ``since`` and ``run`` (the latest one by default)
+
+        Returns:
+        list.  ``(device, command, old hash, new hash)`` tuples, ``None`` for an output missing on one side
+        """
+        run = run or self.runs()[-1]
+        old = self.manifest(since)["outputs"]
+        new = self.manifest(run)["outputs"]
+        changes = []
+        for device in sorted(set(old) | set(new)):
+            before = old.get(device, {})
+            after = new.get(device, {})
+            for command in sorted(set(before) | set(after)):
+                if before.get(command) != after.get(command):
+                    changes.append((device, command, before.get(command), after.get(command)))
+        return changes
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: %s dir runs | diff since [run] | show run device command" % sys.argv[0])
+        sys.exit(1)
+    store = OutputStore(sys.argv[1], run="-")
+    action = sys.argv[2]
+    if action == "runs":
+        for run in store.runs():
+            print(run)
+    elif action == "diff":
+        for device, command, old, new in store.changed(sys.argv[3], sys.argv[4] if len(sys.argv) > 4 else None):
+            status = "added" if old is None else "removed" if new is None else "changed"
+            print("%-8s %-20s %s" % (status, device, command))
+    elif action == "show":
+        sys.stdout.write(store.output(sys.argv[3], sys.argv[4], sys.argv[5]))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,57 @@
 #!/usr/bin/env python
 # coding=utf-8
-from claseCrassh import claseCrassh
+from sesiones import obtenerPool
+import reachability
 
 class Switch(object):
+    # registro liviano: con __slots__ no hay un __dict__ por objeto, y si viene de un inventario
+    # (inventario.py) los datos del equipo se leen recien la primera vez que se usa alguno,
+    # asi armar 20 mil Switch no consulta 20 mil filas
+    __slots__ = ('ip', 'hostname', 'ubicacion', 'marca', 'modelo', 'sistemaOperativo', 'grupo', 'etiquetas',
+                 'usuario', 'password', 'conectado', 'alcanzable', 'objCrassh', 'perfil', 'salto', '_inventario')
+    # atributo -> columna del inventario
+    DESDE_INVENTARIO = {'hostname': 'hostname', 'ubicacion': 'sitio', 'marca': 'marca', 'modelo': 'modelo',
+                        'sistemaOperativo': 'so', 'grupo': 'grupo', 'etiquetas': 'etiquetas', 'perfil': 'perfil'}
    
-    def __init__(self):
-        self.ip = "192.168.1.20"
+    def __init__(self, ip=None, inventario=None):
+        self._inventario = inventario
+        self.usuario = "admin"
+        self.password = "1234"
+        self.conectado = False
+        self.alcanzable = None  # resultado del ultimo verificarConectividad (None: sin verificar)
+        self.objCrassh = None   # sesion prestada por el pool mientras esta conectado
+        self.salto = None       # bastion.JumpHosts (ver PoolSesiones.salto) si se llega por bastiones
+        if inventario is not None:
+            # hostname, ubicacion, modelo... se cargan del inventario cuando se pidan
+            self.ip = ip
+            return None
+        self.ip = ip or "192.168.1.20"
         self.hostname = "prueba"
         self.ubicacion = "algun lado"
         self.marca = "Cisko"
         self.modelo = "2019 con GNC"
         self.sistemaOperativo = "IOS 501"
-        self.usuario = "admin"
-        self.password = "1234"
-        self.conectado = False
-        self.objCrassh = claseCrassh()
+        self.grupo = None
+        self.etiquetas = []
+        self.perfil = None      # perfil de transporte SSH (ver profiles.py), None usa los de paramiko
+        return None
+    def __getattr__(self, nombre):
+        # solo se llama para un slot sin valor: el primer acceso a un dato del inventario
+        if nombre in self.DESDE_INVENTARIO and self._inventario is not None:
+            self.cargar()
+            return object.__getattribute__(self, nombre)
+        raise AttributeError(nombre)
+    def cargar(self):
+        # trae la fila del equipo del inventario (sin pisar lo que ya se haya asignado a mano)
+        datos = self._inventario.obtener(self.ip) or dict()
+        for atributo, columna in self.DESDE_INVENTARIO.items():
+            try:
+                object.__getattribute__(self, atributo)
+            except AttributeError:
+                setattr(self, atributo, datos.get(columna))
+        if self.etiquetas is None:
+            self.etiquetas = []
+        self._inventario = None
         return None
     def getIP(self):
         return self.ip
@@ -23,18 +60,33 @@ class Switch(object):
         self.ip = direccionIP
         return None
     def verificarConectividad(self):
-        # implementar un ping aqui
-        return None
+        # connect TCP al puerto 22 (sin ping: lo que importa es si atiende SSH)
+        # el resultado queda en cache unos segundos, compartido con barrerConectividad
+        # con una sesion viva en el pool no hace falta probar: atiende SSH
+        if obtenerPool().equiposConSesion([self.ip]):
+            self.alcanzable = True
+        else:
+            self.alcanzable = reachability.shared().reachable(self.ip)
+        return self.alcanzable
     def getHostname(self):
         return self.hostname
     def conectar(self):
-        nombre = self.objCrassh.connect(self.ip, self.usuario, self.password, True, self.password)
-        if not nombre:
+        # pide al pool una sesion ya en modo privilegiado (reutiliza la que este abierta)
+        sesion = obtenerPool().obtener(self.ip, self.usuario, self.password, True, self.password, self.perfil, self.salto)
+        if not sesion:
             self.conectado = False 
         else:
-            self.hostname = nombre
+            self.objCrassh = sesion
+            self.hostname = sesion.hostname
             self.conectado = True
         return None
+    def desconectar(self):
+        # devuelve la sesion al pool, queda abierta para la proxima verificacion
+        if self.objCrassh is not None:
+            obtenerPool().devolver(self.objCrassh)
+            self.objCrassh = None
+        self.conectado = False
+        return None
     def traerInformacion(self):
         # carga los datos del switch a partir de lo que obtenga del mismo
         # si falla retorna false
@@ -43,10 +95,20 @@ class Switch(object):
         self.usuario = usuario
         self.password = password
         return None
-    
-
 
-    
 
+def barrerConectividad(switches):
+    # verifica todos los switches juntos (miles de connects en paralelo) antes de conectarse
+    # devuelve los alcanzables; cada Switch queda con su resultado en alcanzable
+    # (los que ya tienen una sesion viva en el pool no se prueban)
+    conSesion = obtenerPool().equiposConSesion([sw.ip for sw in switches])
+    resultado = reachability.shared().sweep([sw.ip for sw in switches if sw.ip not in conSesion])
+    for sw in switches:
+        sw.alcanzable = sw.ip in conSesion or resultado[sw.ip]
+    return [sw for sw in switches if sw.alcanzable]
 
 
+def cargarSwitches(inventario, etiquetas=(), **filtro):
+    # Switch de los equipos del inventario que cumplen el filtro (sitio, modelo, so, grupo, etiquetas)
+    # cada uno carga sus datos recien cuando se usan
+    return [Switch(ip, inventario) for ip in inventario.seleccionar(etiquetas, **filtro)]